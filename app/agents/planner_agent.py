@@ -1,4 +1,28 @@
+import json
+import os
+import re
 from app.llm.groq_llm import get_llm
+from app.rag.context_packer import AGENT_BUDGETS, pack_history
+
+PLANNER_MAX_SUBQUERIES = int(os.getenv("PLANNER_MAX_SUBQUERIES", "3"))
+
+def parse_plan(text: str):
+    """
+    Extracts (plan, sub_queries) from the planner's JSON reply.
+    Falls back to the raw text as the plan, with no sub-queries, when the JSON is missing or malformed.
+    """
+    match = re.search(r"\{.*\}", text, re.S)
+    if match:
+        try:
+            data = json.loads(match.group(0))
+            sub_queries = data.get("sub_queries", [])
+            if not isinstance(sub_queries, list):
+                sub_queries = [sub_queries]
+            sub_queries = [str(q).strip() for q in sub_queries if str(q).strip()]
+            return str(data.get("plan", "")).strip() or text, sub_queries[:PLANNER_MAX_SUBQUERIES]
+        except (ValueError, AttributeError):
+            pass
+    return text, []
 
 def planner_agent(state: dict):
     llm = get_llm()
@@ -6,15 +30,12 @@ def planner_agent(state: dict):
     web_enabled = state.get("web_search_enabled", False)
     messages = state.get("messages", [])
     
-    # Get last few messages for context
-    history_str = ""
-    for msg in messages[:-1]: # exclude the latest human query already in state["query"]
-        role = "User" if hasattr(msg, 'type') and msg.type == 'human' else "Assistant"
-        history_str += f"{role}: {msg.content}\n"
+    # Get recent messages for context, excluding the latest human query already in state["query"]
+    history_str = pack_history(messages[:-1], AGENT_BUDGETS["planner"]["history"])
 
     prompt = f"""
 You are a planning agent for a Multi-Agent Expert Knowledge Assistant (MEKA).
-Your task is to decompose the user's current query into a simple search plan.
+Your task is to decompose the user's current query into a simple search plan and up to {PLANNER_MAX_SUBQUERIES} standalone search queries.
 If the query is a follow-up (e.g., "tell me more", "explain that part"), use the conversation history to disambiguate what the user is referring to.
 
 **Conversation History:**
@@ -25,17 +46,21 @@ If the query is a follow-up (e.g., "tell me more", "explain that part"), use the
 **Contextual Awareness:**
 - If the query is a continuation, make the plan relevant to the previous topic.
 - If it's a new topic, create a fresh plan.
+- Each sub-query must be self-contained (resolve pronouns using the history) and target a distinct aspect.
 - Web search is {"ENABLED" if web_enabled else "DISABLED"}.
 
-Plan:
+Respond ONLY with JSON:
+{{"plan": "<one or two sentence plan>", "sub_queries": ["<search query>", ...]}}
 """
     response = llm.invoke(prompt)
-    plan = response.content.strip()
+    plan, sub_queries = parse_plan(response.content.strip())
     
-    trace = state.get("reasoning_trace", [])
-    trace.append(f"Planner: Created extraction plan - {plan}")
+    trace = [f"Planner: Created extraction plan - {plan}"]
+    if sub_queries:
+        trace.append(f"Planner: Sub-queries - {' | '.join(sub_queries)}")
     
     return {
         "planner_output": plan,
+        "sub_queries": sub_queries,
         "reasoning_trace": trace
-    }
\ No newline at end of file
+    }
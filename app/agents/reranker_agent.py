@@ -1,31 +1,37 @@
-from sentence_transformers import CrossEncoder
-
-# Load model once at module level
-print("Loading CrossEncoder model...")
-model = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+from app.rag.rerank_service import get_rerank_service
+from app.rag.chunk_store import materialize, put_chunks
 
 def reranker_agent(state: dict):
     query = state["query"]
-    retrieved_docs = state["retrieved_docs"]
+    retrieved = state["retrieved_docs"]
     
-    if not retrieved_docs:
-        trace = state.get("reasoning_trace", [])
-        trace.append("Reranker: No docs to rerank")
+    if not retrieved:
+        trace = ["Reranker: No docs to rerank"]
         return {"reranked_docs": [], "reasoning_trace": trace}
 
-    pairs = [[query, doc.page_content] for doc in retrieved_docs]
-    scores = model.predict(pairs)
-    
-    for i, doc in enumerate(retrieved_docs):
-        doc.metadata["rerank_score"] = float(scores[i])
+    # Rows from a structured lookup are exact matches: they lead and skip the cross-encoder
+    structured = [r for r in retrieved if r.get("structured")]
+    candidates = [r for r in retrieved if not r.get("structured")]
+
+    cached = 0
+    if candidates:
+        # Only the cross-encoder needs the text; state keeps the references
+        docs = materialize(candidates, state.get("tenant"))
+        scores, cached = get_rerank_service().score(query, docs)
+        for i, doc in enumerate(docs):
+            doc.metadata["rerank_score"] = float(scores[i])
+        candidates = put_chunks(docs)
     
-    reranked = sorted(retrieved_docs, key=lambda x: x.metadata["rerank_score"], reverse=True)
-    top_docs = reranked[:5]
+    reranked = sorted(candidates, key=lambda x: x["rerank_score"], reverse=True)
+    top_docs = (structured + reranked)[:5]
     
-    trace = state.get("reasoning_trace", [])
-    trace.append(f"Reranker: Re-scored {len(retrieved_docs)} segments, optimized to top {len(top_docs)}")
+    trace = []
+    if candidates:
+        trace.append(f"Reranker: Re-scored {len(candidates)} segments ({cached} from cache), optimized to top {len(top_docs)}")
+    if structured:
+        trace.append(f"Reranker: Kept {len(structured)} structured rows as exact matches")
     
     return {
         "reranked_docs": top_docs,
         "reasoning_trace": trace
-    }
\ No newline at end of file
+    }
@@ -1,15 +1,45 @@
-from app.rag.retriever import retrieve_docs
+from app.rag.retriever import retrieve_docs_with_stats
+from app.rag.chunk_store import put_chunks
+from app.graph.routing import ROUTER_ADAPTIVE
+
+def _describe_sources(stats: dict):
+    parts = []
+    for name, s in stats["sources"].items():
+        if s["status"] == "ok":
+            parts.append(f"{name}: {s['hits']} hits over {s['queries']} queries (k={s['k']}, w={s['weight']}) in {s['latency_ms']}ms")
+        else:
+            parts.append(f"{name}: {s['status']} after {s['latency_ms']}ms")
+    return "; ".join(parts)
+
+def _describe_filters(filters: dict):
+    return ", ".join(f"{name}={','.join(map(str, v)) if isinstance(v, list) else v}" for name, v in filters.items())
 
 def retriever_agent(state: dict):
     query = state["query"]
-    web_enabled = state.get("web_search_enabled", False)
+    # With adaptive routing, web search is deferred until local results prove too weak
+    web_enabled = state.get("web_search_enabled", False) and not ROUTER_ADAPTIVE
+    sub_queries = state.get("sub_queries") or []
     
-    docs = retrieve_docs(query, use_web=web_enabled)
+    docs, stats = retrieve_docs_with_stats(query, use_web=web_enabled, sub_queries=sub_queries,
+                                           filters=state.get("filters"), tenant=state.get("tenant"))
     
-    trace = state.get("reasoning_trace", [])
-    trace.append(f"Retriever: Fetched {len(docs)} segments from {'Local + Web' if web_enabled else 'Local Hybrid'}")
+    trace = []
+    if stats["fusion"] == "structured":
+        trace.append(f"Retriever: Answered lookup from structured data - {len(docs)} rows in {stats['latency_ms']}ms")
+        return {
+            "retrieved_docs": put_chunks(docs),
+            "retrieval_stats": stats,
+            "reasoning_trace": trace
+        }
+    trace.append(f"Retriever: Fetched {len(docs)} segments for {len(stats['queries'])} queries from {'Local + Web' if web_enabled else 'Local Hybrid'}")
+    if stats.get("tenant"):
+        trace.append(f"Retriever: Searched tenant '{stats['tenant']}' ({stats['shards']} shards)")
+    if stats.get("filters"):
+        trace.append(f"Retriever: Filtered by {_describe_filters(stats['filters'])}")
+    trace.append(f"Retriever: {stats['fusion'].upper()} fusion in {stats['latency_ms']}ms - {_describe_sources(stats)}")
     
     return {
-        "retrieved_docs": docs,
+        "retrieved_docs": put_chunks(docs),
+        "retrieval_stats": stats,
         "reasoning_trace": trace
     }
\ No newline at end of file
@@ -0,0 +1,18 @@
+from app.graph.routing import classify_query, ROUTER_ADAPTIVE
+
+def router_agent(state: dict):
+    query = state["query"]
+    # messages already holds the current question
+    history_turns = max(0, len(state.get("messages", [])) - 1) // 2
+
+    trace = []
+    if ROUTER_ADAPTIVE:
+        needs_planner, reason = classify_query(query, history_turns)
+    else:
+        needs_planner, reason = True, "adaptive routing disabled"
+    trace.append(f"Router: {'Planning' if needs_planner else 'Skipping planner'} - {reason}")
+
+    return {
+        "needs_planner": needs_planner,
+        "reasoning_trace": trace
+    }
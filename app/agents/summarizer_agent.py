@@ -1,19 +1,20 @@
 from app.llm.groq_llm import get_llm
 from langchain_core.messages import AIMessage
+from langgraph.config import get_stream_writer
+from app.rag.context_packer import AGENT_BUDGETS, pack_documents, pack_history
+from app.rag.chunk_store import materialize
 
 def summarizer_agent(state: dict):
     llm = get_llm()
     query = state["query"]
-    docs = state["reranked_docs"]
+    docs = materialize(state["reranked_docs"], state.get("tenant"))
     messages = state.get("messages", [])
 
-    context = "\n\n".join([doc.page_content for doc in docs])
+    budget = AGENT_BUDGETS["summarizer"]
+    context, packing = pack_documents(docs, budget["context"])
     
-    # Get conversation context
-    history_str = ""
-    for msg in messages[:-1]:
-        role = "User" if hasattr(msg, 'type') and msg.type == 'human' else "Assistant"
-        history_str += f"{role}: {msg.content}\n"
+    # Get conversation context (latest human query is already in state["query"])
+    history_str = pack_history(messages[:-1], budget["history"])
 
     prompt = f"""
 You are a synthesis agent for MEKA. Use the provided context AND conversation history to answer the user's latest query accurately.
@@ -30,11 +31,19 @@ If the context doesn't contain the answer but the history does, use the history.
 Answer:
 """
 
-    response = llm.invoke(prompt)
-    answer = response.content
+    # Stream tokens to the caller as they arrive; the writer is a no-op outside stream_meka
+    writer = get_stream_writer()
+    parts = []
+    for chunk in llm.stream(prompt):
+        if chunk.content:
+            parts.append(chunk.content)
+            writer({"answer_delta": chunk.content})
+    answer = "".join(parts)
     
-    trace = state.get("reasoning_trace", [])
-    trace.append(f"Summarizer: Synthesized final answer using context and history")
+    trace = [
+        f"Summarizer: Packed {packing['packed']}/{packing['docs']} chunks into {packing['tokens']} tokens",
+        "Summarizer: Synthesized final answer using context and history",
+    ]
     
     return {
         "messages": [AIMessage(content=answer)],
@@ -1,12 +1,13 @@
+import os
 from app.llm.groq_llm import get_llm
+from app.rag.context_packer import AGENT_BUDGETS, pack_documents
+from app.rag.chunk_store import materialize
 
-def validator_agent(state: dict):
-    llm = get_llm()
+VALIDATOR_BACKEND = os.getenv("VALIDATOR_BACKEND", "llm")  # "llm" or "nli" (local, no LLM call)
+VALIDATION_MODE = os.getenv("VALIDATION_MODE", "inline")  # "inline" or "background"
 
-    answer = state["final_answer"]
-    docs = state["retrieved_docs"]
-
-    context = "\n".join([d.page_content for d in docs])
+def _llm_validate(answer: str, context: str):
+    llm = get_llm()
 
     prompt = f"""
 Check if answer is grounded in context.
@@ -30,12 +31,47 @@ REASON: short reason
             status = line.split(":")[1].strip()
         if line.startswith("REASON"):
             reason = line.split(":")[1].strip()
+    return status, reason
 
-    trace = state.get("reasoning_trace", [])
-    trace.append(f"Validator: Answer is {status} - {reason}")
+def validate_answer(answer: str, refs: list, tenant: str = None):
+    """
+    Checks the answer against the reranked context (chunk references) it was built from.
+    Returns (status, reason).
+    """
+    docs = materialize(refs, tenant)
+    if VALIDATOR_BACKEND == "nli":
+        from app.rag.groundedness import nli_groundedness
+        return nli_groundedness(answer, [d.page_content for d in docs])
+    context, _ = pack_documents(docs, AGENT_BUDGETS["validator"]["context"])
+    return _llm_validate(answer, context)
+
+def validator_agent(state: dict):
+    status, reason = validate_answer(state["final_answer"], state.get("reranked_docs", []), state.get("tenant"))
+
+    trace = [f"Validator: Answer is {status} - {reason}"]
 
     return {
         "validation": status,
         "reason": reason,
         "reasoning_trace": trace
-    }
\ No newline at end of file
+    }
+
+def skip_validation_agent(state: dict):
+    top = max((r.get("rerank_score", float("-inf")) for r in state.get("reranked_docs", [])), default=None)
+
+    trace = [f"Validator: Skipped - high-confidence context (top rerank score {top:.2f})"]
+
+    return {
+        "validation": "SKIPPED",
+        "reason": "High-confidence retrieval",
+        "reasoning_trace": trace
+    }
+
+def defer_validation_agent(state: dict):
+    trace = ["Validator: Deferred - groundedness check runs in the background"]
+
+    return {
+        "validation": "PENDING",
+        "reason": "Validation in progress",
+        "reasoning_trace": trace
+    }
@@ -0,0 +1,20 @@
+from app.rag.retriever import web_retrieve_with_stats
+from app.rag.chunk_store import put_chunks
+from app.graph.routing import top_rerank_score
+
+def web_search_agent(state: dict):
+    query = state["query"]
+    top = top_rerank_score(state)
+
+    docs, stats = web_retrieve_with_stats(query, filters=state.get("filters"))
+    seen = {r["id"] for r in state["retrieved_docs"]}
+    new_docs = [r for r in put_chunks(docs) if r["id"] not in seen]
+
+    score = "no local hits" if top is None else f"top local score {top:.2f}"
+    trace = [f"Web Search: Triggered by weak local context ({score}) - {len(new_docs)} results in {stats['latency_ms']}ms ({stats['status']})"]
+
+    return {
+        "retrieved_docs": state["retrieved_docs"] + new_docs,
+        "web_searched": True,
+        "reasoning_trace": trace
+    }
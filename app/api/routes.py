@@ -1,12 +1,18 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from sse_starlette.sse import EventSourceResponse
 from app.schemas import AskRequest
-from app.graph.orchestrator import run_meka, stream_meka
-from app.utils.history import add_query_to_history, update_query_status, get_query_by_id, get_all_history, delete_history_item, save_history
+from app.rag.vector_db import get_tenant, UnknownTenantError
+from app.graph.orchestrator import (run_meka, stream_meka, needs_background_validation, validate_deferred,
+                                    timing_breakdown, materialize_result)
+from app.utils.history import add_query_to_history, update_query_status, update_query_fields, merge_query_result, get_query_by_id, get_history_page, delete_history_item
+from app.utils.jobs import get_job_queue, QueueFullError
+from app.utils.metrics import REQUEST_SECONDS, FIRST_TOKEN_SECONDS, QUERIES
 from langchain_core.documents import Document
+from typing import Optional
 import uuid
 import asyncio
 import json
+import time
 import traceback
 
 import logging
@@ -29,6 +35,120 @@ def serialize_docs(obj):
 
 router = APIRouter()
 
+# Strong references so pending background validations are not garbage collected
+_background_tasks = set()
+
+def schedule_validation(query_id: str, query: str, web_search: bool, result: dict, tenant: str = None):
+    """
+    Runs a deferred groundedness check off the request path and writes the verdict into history.
+    Returns the task; its result is the {validation, reason, trace} verdict.
+    """
+    async def run():
+        try:
+            verdict = await asyncio.to_thread(validate_deferred, query, web_search, result, tenant)
+        except Exception as e:
+            logger.error(f"Validation Error | id={query_id} | error={str(e)}")
+            verdict = {"validation": "UNKNOWN", "reason": str(e), "trace": f"Validator: Failed - {str(e)}"}
+        await asyncio.to_thread(merge_query_result, query_id, trace=verdict["trace"],
+                                validation=verdict["validation"], reason=verdict["reason"])
+        return verdict
+
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+def _cache_label(result: dict):
+    cache = result.get("cache")
+    if cache is None:
+        return "off"
+    return "hit" if cache.get("hit") else "miss"
+
+def _store_streamed_query(query_id: str, state: dict, tenant: str, timings: dict):
+    """
+    Blocking end of a streamed query, run in a thread: chunk references become text only here
+    (possibly re-read from the vector store), once for history and the client.
+    """
+    full_result = serialize_docs(materialize_result(state, tenant))
+    update_query_status(query_id, "completed", full_result)
+    # Persist final trace and timings to history
+    update_query_fields(query_id, reasoning_trace=state["reasoning_trace"], timings=timings)
+    return full_result
+
+async def ask_events(query: str, web_search: bool, thread_id: str, filters: dict = None, tenant: str = None):
+    """
+    Runs one streamed query and yields client events: trace, answer_delta, answer and done,
+    then validation once a deferred groundedness check finishes.
+    Shared by the WebSocket and SSE endpoints.
+    """
+    query_id = str(uuid.uuid4())
+    logger.info(f"Stream: Processing query | id={query_id} | query={query[:50]}...")
+
+    # Save initial history
+    await asyncio.to_thread(add_query_to_history, query_id, {
+        "query_id": query_id,
+        "query": query,
+        "status": "processing",
+        "result": "",
+        "reasoning_trace": [],
+        "thread_id": thread_id,
+        "tenant": tenant
+    })
+
+    combined_trace = []
+    full_state = {}
+    started, first_token_ms = time.perf_counter(), None
+
+    try:
+        async for kind, event in stream_meka(query, web_search, thread_id, filters, tenant):
+            # Tokens from the summarizer as they are generated
+            if kind == "delta":
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                    FIRST_TOKEN_SECONDS.observe(first_token_ms / 1000)
+                yield {"event": "answer_delta", "delta": event["answer_delta"]}
+                continue
+
+            node_name = list(event.keys())[0]
+            state_update = event[node_name]
+            full_state.update(state_update)
+
+            # Send traces; every node update carries only its new lines
+            for t in state_update.get("reasoning_trace") or ():
+                combined_trace.append(t)
+                yield {"event": "trace", "trace": t}
+
+            # Send answer updates
+            if "final_answer" in state_update:
+                yield {"event": "answer", "answer": state_update["final_answer"]}
+    except Exception as e:
+        QUERIES.inc(mode="stream", status="failed")
+        await asyncio.to_thread(update_query_status, query_id, "failed", {"error": str(e)})
+        raise
+
+    total_s = time.perf_counter() - started
+    timings = timing_breakdown(full_state, total_s * 1000, first_token_ms=first_token_ms)
+    REQUEST_SECONDS.observe(total_s, mode="stream", cache=_cache_label(full_state))
+    QUERIES.inc(mode="stream", status="completed")
+
+    full_state["reasoning_trace"] = combined_trace
+    full_result = await asyncio.to_thread(_store_streamed_query, query_id, full_state, tenant, timings)
+
+    validation = None
+    if needs_background_validation(full_state):
+        validation = schedule_validation(query_id, query, web_search, full_state, tenant)
+
+    yield {
+        "event": "done",
+        "full_result": full_result,
+        "timings": timings,
+        "query_id": query_id
+    }
+
+    if validation is not None:
+        # Shielded so a client that disconnects early doesn't cancel the history update
+        yield {"event": "validation", "query_id": query_id, **(await asyncio.shield(validation))}
+
 @router.websocket("/ws/ask/{thread_id}")
 async def websocket_ask(websocket: WebSocket, thread_id: str):
     await websocket.accept()
@@ -39,62 +159,23 @@ async def websocket_ask(websocket: WebSocket, thread_id: str):
         data = await websocket.receive_json()
         query = data.get("query")
         web_search = data.get("web_search", False)
+        filters = data.get("filters")
+        tenant = data.get("tenant")
         
         if not query:
             await websocket.send_json({"event": "error", "error": "No query provided"})
             await websocket.close()
             return
-
-        query_id = str(uuid.uuid4())
-        logger.info(f"WS: Processing query | id={query_id} | query={query[:50]}...")
-        
-        # Save initial history
-        add_query_to_history(query_id, {
-            "query_id": query_id,
-            "query": query,
-            "status": "processing",
-            "result": "",
-            "reasoning_trace": [],
-            "thread_id": thread_id
-        })
-
-        combined_trace = []
-        full_state = {}
+        try:
+            get_tenant(tenant)
+        except UnknownTenantError as e:
+            await websocket.send_json({"event": "error", "error": str(e)})
+            await websocket.close()
+            return
 
         # 2. Stream results
-        async for event in stream_meka(query, web_search, thread_id):
-            if not isinstance(event, dict): continue
-            node_name = list(event.keys())[0]
-            state_update = event[node_name]
-            full_state.update(state_update)
-            
-            # Send traces
-            if "reasoning_trace" in state_update:
-                for t in state_update["reasoning_trace"]:
-                    if t not in combined_trace:
-                        combined_trace.append(t)
-                        await websocket.send_json({"event": "trace", "trace": t})
-
-            # Send answer updates
-            if "final_answer" in state_update:
-                await websocket.send_json({"event": "answer", "answer": state_update["final_answer"]})
-
-        # 3. Finalize
-        update_query_status(query_id, "completed", serialize_docs(full_state))
-        
-        # Persist final trace to history
-        all_h = get_all_history() # Re-fetch to ensure we have latest
-        from app.utils.history import save_history, get_history
-        hist = get_history()
-        if query_id in hist:
-            hist[query_id]["reasoning_trace"] = combined_trace
-            save_history(hist)
-
-        await websocket.send_json({
-            "event": "done",
-            "full_result": serialize_docs(full_state),
-            "query_id": query_id
-        })
+        async for event in ask_events(query, web_search, thread_id, filters, tenant):
+            await websocket.send_json(event)
 
     except WebSocketDisconnect:
         logger.info(f"WS: Disconnected | thread_id={thread_id}")
@@ -112,32 +193,139 @@ async def websocket_ask(websocket: WebSocket, thread_id: str):
         except:
             pass
 
+@router.get("/sse/ask/{thread_id}")
+async def sse_ask(thread_id: str, query: str, web_search: bool = False,
+                  types: Optional[str] = None, sources: Optional[str] = None,
+                  modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+                  tenant: Optional[str] = None):
+    """
+    Server-Sent Events twin of /ws/ask: same events, one per SSE message.
+    Metadata filters and the tenant are query parameters; types and sources are comma-separated.
+    """
+    try:
+        get_tenant(tenant)
+    except UnknownTenantError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    filters = {
+        "types": types.split(",") if types else None,
+        "sources": sources.split(",") if sources else None,
+        "modified_after": modified_after,
+        "modified_before": modified_before,
+    }
+    async def event_stream():
+        try:
+            async for event in ask_events(query, web_search, thread_id, filters, tenant):
+                yield {"event": event["event"], "data": json.dumps(event)}
+        except Exception as e:
+            logger.error(f"SSE: Error | thread_id={thread_id} | error={str(e)}")
+            yield {"event": "error", "data": json.dumps({"event": "error", "error": str(e)})}
+
+    return EventSourceResponse(event_stream())
+
 @router.post("/query")
-async def create_query(req: AskRequest, background_tasks: BackgroundTasks):
+async def create_query(req: AskRequest):
     """Asynchronous endpoint for long-running workflows - Required by Assignment."""
     query_id = str(uuid.uuid4())
-    add_query_to_history(query_id, {
+    thread_id = req.thread_id or "default"
+    try:
+        get_tenant(req.tenant)
+    except UnknownTenantError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # Recorded before submit, so the job's status updates always find the record
+    await asyncio.to_thread(add_query_to_history, query_id, {
         "query_id": query_id,
         "query": req.query,
         "web_search": req.web_search,
-        "status": "processing",
+        "filters": req.filters.model_dump(exclude_none=True) if req.filters else None,
+        "status": "queued",
         "result": "",
         "reasoning_trace": [],
-        "thread_id": req.thread_id or "default"
+        "thread_id": thread_id,
+        "tenant": req.tenant
     })
-    
-    background_tasks.add_task(process_query_task, query_id, req.query, req.web_search, req.thread_id or "default")
-    return {"query_id": query_id, "status": "processing"}
+    try:
+        position = get_job_queue().submit(
+            query_id, run_meka, query=req.query, web_search=req.web_search, thread_id=thread_id,
+            filters=req.filters, tenant=req.tenant, callback=_on_query_job_update
+        )
+    except QueueFullError as e:
+        await asyncio.to_thread(delete_history_item, query_id)
+        raise HTTPException(
+            status_code=429,
+            detail={"error": "Query queue is full, retry later", "queue_depth": e.depth},
+            headers={"Retry-After": "5"}
+        )
+    return {"query_id": query_id, "status": "queued", "queue_position": position}
+
+# Last pending history write per async query; each write waits for the previous one,
+# so a job's status updates land in the order they happened
+_job_writes = {}
 
-async def process_query_task(query_id: str, question: str, web_search: bool, thread_id: str):
+def _write_job_update(job_id, work):
+    """Runs `work` (an async callable doing the blocking writes in a thread) after the job's earlier writes."""
+    previous = _job_writes.get(job_id)
+
+    async def run():
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await work()
+        except Exception as e:
+            logger.error(f"Async Error | id={job_id} | history update failed | error={str(e)}")
+
+    task = _job_writes[job_id] = asyncio.create_task(run())
+    _background_tasks.add(task)
+
+    def done(task):
+        _background_tasks.discard(task)
+        if _job_writes.get(job_id) is task:
+            del _job_writes[job_id]
+    task.add_done_callback(done)
+
+def _store_completed_query(job, total_s):
+    """Blocking part of a completed job: materializing the chunk references and the history writes."""
+    # Final formatting/serialization
+    result = serialize_docs(materialize_result(job.result, job.kwargs["tenant"]))
+    update_query_status(job.job_id, "completed", result)
+    update_query_fields(job.job_id, timings=timing_breakdown(
+        job.result, total_s * 1000, queue_ms=round((job.started_at - job.submitted_at) * 1000, 1)
+    ))
+
+async def _finish_query_job(job, total_s):
     try:
-        resultado = run_meka(question, web_search, thread_id)
-        # Final formatting/serialization
-        resultado = serialize_docs(resultado)
-        update_query_status(query_id, "completed", resultado)
+        await asyncio.to_thread(_store_completed_query, job, total_s)
     except Exception as e:
-        logger.error(f"Async Error | id={query_id} | error={str(e)}")
-        update_query_status(query_id, "failed", {"error": str(e)})
+        logger.error(f"Async Error | id={job.job_id} | state=completed | error={str(e)}")
+        await asyncio.to_thread(update_query_status, job.job_id, "failed", {"error": str(e)})
+        return
+    if needs_background_validation(job.result):
+        schedule_validation(job.job_id, job.kwargs["query"], job.kwargs["web_search"], job.result,
+                            job.kwargs["tenant"])
+
+def _on_query_job_update(job):
+    """Called on the event loop; every history write is handed to a thread, in order per job."""
+    if job.state == "running":
+        _write_job_update(job.job_id, lambda: asyncio.to_thread(update_query_status, job.job_id, "processing"))
+    elif job.state == "completed":
+        total_s = job.finished_at - job.started_at
+        REQUEST_SECONDS.observe(total_s, mode="async", cache=_cache_label(job.result))
+        QUERIES.inc(mode="async", status="completed")
+        _write_job_update(job.job_id, lambda: _finish_query_job(job, total_s))
+    elif job.state == "cancelled":
+        QUERIES.inc(mode="async", status="cancelled")
+        _write_job_update(job.job_id, lambda: asyncio.to_thread(update_query_status, job.job_id, "cancelled"))
+    else:
+        state, error = job.state, job.error
+        QUERIES.inc(mode="async", status=state)
+        logger.error(f"Async Error | id={job.job_id} | state={state} | error={error}")
+        _write_job_update(job.job_id, lambda: asyncio.to_thread(update_query_status, job.job_id, state, {"error": error}))
+
+@router.post("/query/{query_id}/cancel")
+async def cancel_query(query_id: str):
+    # On the event loop: the job queue and its callbacks belong to it
+    if get_job_queue().cancel(query_id):
+        return {"query_id": query_id, "status": "CANCELLED"}
+    raise HTTPException(status_code=404, detail="No queued or running query with this id")
 
 @router.get("/status/{query_id}")
 def get_status(query_id: str):
@@ -145,11 +333,21 @@ def get_status(query_id: str):
     query = get_query_by_id(query_id)
     if not query:
         raise HTTPException(status_code=404, detail="Query not found")
-    return query
+    queue_info = get_job_queue().describe(query_id)
+    if queue_info is None:
+        queue_info = {"queue_state": query.get("status"), "queue_position": None}
+    return {**query, **queue_info}
 
 @router.get("/history")
-def list_history():
-    return get_all_history()
+def list_history(response: Response, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    """Newest-first page of history; the cursor for the next page is in the X-Next-Cursor header."""
+    try:
+        records, next_cursor = get_history_page(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return records
 
 @router.delete("/history/{query_id}")
 def delete_item(query_id: str):
@@ -0,0 +1,120 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# State fields worth replaying on a hit; traces, messages and raw retrieval candidates are per-run
+CACHED_FIELDS = ("final_answer", "validation", "reason", "planner_output", "reranked_docs", "retrieval_stats")
+
+def normalize_query(query: str):
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.strip(" ?!.")
+
+class AnswerCache:
+    """
+    Answer cache keyed on normalized query, web flag and corpus version.
+    Exact matches hit directly; otherwise the closest cached query by embedding cosine similarity
+    hits if it clears the threshold. Entries expire after ttl seconds, the least recently used are
+    evicted beyond max_size, and everything is dropped when the corpus version changes.
+    """
+
+    def __init__(self, embed_fn=None, ttl=ANSWER_CACHE_TTL, max_size=ANSWER_CACHE_SIZE,
+                 similarity=ANSWER_CACHE_SIMILARITY):
+        self.embed_fn = embed_fn
+        self.ttl = ttl
+        self.max_size = max_size
+        self.similarity = similarity
+        self.version = None
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sync_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self.version = version
+
+    def _embed(self, normalized):
+        if self.embed_fn is None:
+            return None
+        vector = np.asarray(self.embed_fn(normalized), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query: str, web_search: bool, version):
+        """
+        Returns (result, hit_info, embedding). result is None on a miss; the embedding can be
+        passed back to store() so the query isn't embedded twice.
+        """
+        normalized = normalize_query(query)
+        key = (normalized, bool(web_search))
+        now = time.time()
+        with self._lock:
+            self._sync_version(version)
+            for k in [k for k, e in self._entries.items() if now - e["created"] > self.ttl]:
+                del self._entries[k]
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry["result"], {"kind": "exact", "similarity": 1.0}, entry["embedding"]
+            candidates = [(k, e) for k, e in self._entries.items() if k[1] == key[1] and e["embedding"] is not None]
+
+        embedding = self._embed(normalized)
+        if embedding is not None and candidates:
+            matrix = np.stack([e["embedding"] for _, e in candidates])
+            sims = matrix @ embedding
+            best = int(np.argmax(sims))
+            if sims[best] >= self.similarity:
+                best_key, entry = candidates[best]
+                with self._lock:
+                    if best_key in self._entries:
+                        self._entries.move_to_end(best_key)
+                    self.stats["semantic_hits"] += 1
+                return entry["result"], {"kind": "semantic", "similarity": round(float(sims[best]), 4), "matched": best_key[0]}, embedding
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None, None, embedding
+
+    def store(self, query: str, web_search: bool, version, result: dict, embedding=None):
+        normalized = normalize_query(query)
+        if embedding is None:
+            embedding = self._embed(normalized)
+        with self._lock:
+            self._sync_version(version)
+            self._entries[(normalized, bool(web_search))] = {
+                "result": {k: result[k] for k in CACHED_FIELDS if k in result},
+                "embedding": embedding,
+                "created": time.time(),
+            }
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def settle(self, query: str, web_search: bool, answer: str, validation: str, reason: str):
+        """
+        Applies a late validation verdict to the cached answer it was computed for.
+        Hallucinated answers are evicted so they are not served again.
+        """
+        key = (normalize_query(query), bool(web_search))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["result"].get("final_answer") != answer:
+                return
+            if validation == "HALLUCINATED":
+                del self._entries[key]
+            else:
+                entry["result"] = {**entry["result"], "validation": validation, "reason": reason}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,66 +1,328 @@
 from langgraph.graph import StateGraph
-from langgraph.checkpoint.memory import MemorySaver
 from typing_extensions import TypedDict
 from typing import List, Annotated
+import asyncio
+import os
 from langgraph.graph.message import add_messages
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, AIMessage
 from app.utils.logger import get_logger
+from app.graph.answer_cache import AnswerCache, ANSWER_CACHE_ENABLED
+from app.graph.checkpointer import create_checkpointer
+from app.graph.single_flight import SingleFlight, StreamSingleFlight, flight_key, SINGLE_FLIGHT_ENABLED
+from app.utils.metrics import stage_span, CANDIDATES
+from app.rag.vector_db import get_embeddings, get_corpus_version, get_tenant, DEFAULT_TENANT
+from app.rag.filters import normalize_filters
+from app.rag.chunk_store import materialize, put_chunks
 
 logger = get_logger(__name__)
 
 # Import all agents
+from app.agents.router_agent import router_agent
 from app.agents.planner_agent import planner_agent
 from app.agents.retriever_agent import retriever_agent
 from app.agents.reranker_agent import reranker_agent
+from app.agents.web_search_agent import web_search_agent
 from app.agents.summarizer_agent import summarizer_agent
-from app.agents.validator_agent import validator_agent
+from app.agents.validator_agent import validator_agent, skip_validation_agent, defer_validation_agent, validate_answer
+from app.graph.routing import route_after_router, route_after_rerank, route_after_summary
+
+# Messages kept per thread; older turns fall out of the checkpointed conversation
+MAX_THREAD_MESSAGES = int(os.getenv("MAX_THREAD_MESSAGES", "40"))
+
+def add_capped_messages(left: list, right: list):
+    """add_messages, keeping only the newest MAX_THREAD_MESSAGES messages."""
+    return add_messages(left, right)[-MAX_THREAD_MESSAGES:]
+
+def add_trace(left: list, right: list):
+    """Agents return only their new trace lines; None (a new turn's input) starts an empty trace."""
+    if right is None:
+        return []
+    return (left or []) + right
 
 class MekaState(TypedDict):
-    messages: Annotated[list, add_messages]
+    messages: Annotated[list, add_capped_messages]
     query: str
     web_search_enabled: bool
+    web_searched: bool
+    filters: dict
+    tenant: str
+    needs_planner: bool
     planner_output: str
-    retrieved_docs: List
-    reranked_docs: List
+    sub_queries: List[str]
+    # Chunk references (see app.rag.chunk_store); the text is materialized on demand
+    retrieved_docs: List[dict]
+    retrieval_stats: dict
+    reranked_docs: List[dict]
     final_answer: str
     validation: str
     reason: str
-    reasoning_trace: List[str]
+    route: List[str]
+    timings: dict
+    token_usage: dict
+    reasoning_trace: Annotated[List[str], add_trace]
+
+def _tracked(name, agent):
+    """
+    Records each executed node in state["route"], its wall time in state["timings"] (ms, summed
+    when a node runs twice) and the LLM tokens it spent in state["token_usage"].
+    """
+    def node(state: dict):
+        with stage_span(name) as span:
+            update = agent(state)
+        timings = state.get("timings", {})
+        usage = state.get("token_usage", {})
+        update["route"] = state.get("route", []) + [name]
+        update["timings"] = {**timings, name: round(timings.get(name, 0.0) + span.ms, 1)}
+        update["token_usage"] = {k: usage.get(k, 0) + v for k, v in span.usage.items()}
+        for stage, key in (("retrieved", "retrieved_docs"), ("reranked", "reranked_docs")):
+            if key in update:
+                CANDIDATES.observe(len(update[key]), stage=stage)
+        return update
+    return node
 
 graph = StateGraph(MekaState)
 
-graph.add_node("planner", planner_agent)
-graph.add_node("retriever", retriever_agent)
-graph.add_node("reranker", reranker_agent)
-graph.add_node("summarizer", summarizer_agent)
-graph.add_node("validator", validator_agent)
+for name, agent in [
+    ("router", router_agent),
+    ("planner", planner_agent),
+    ("retriever", retriever_agent),
+    ("reranker", reranker_agent),
+    ("web_search", web_search_agent),
+    ("summarizer", summarizer_agent),
+    ("validator", validator_agent),
+    ("skip_validation", skip_validation_agent),
+    ("defer_validation", defer_validation_agent),
+]:
+    graph.add_node(name, _tracked(name, agent))
 
-graph.set_entry_point("planner")
+# router -> [planner] -> retriever -> reranker -> [web_search -> reranker] -> summarizer
+#   -> validator | skip_validation | defer_validation
+graph.set_entry_point("router")
+graph.add_conditional_edges("router", route_after_router, {"planner": "planner", "retriever": "retriever"})
 graph.add_edge("planner", "retriever")
 graph.add_edge("retriever", "reranker")
-graph.add_edge("reranker", "summarizer")
-graph.add_edge("summarizer", "validator")
+graph.add_conditional_edges("reranker", route_after_rerank, {"web_search": "web_search", "summarizer": "summarizer"})
+graph.add_edge("web_search", "reranker")
+graph.add_conditional_edges("summarizer", route_after_summary, {
+    "validator": "validator",
+    "skip_validation": "skip_validation",
+    "defer_validation": "defer_validation",
+})
 graph.set_finish_point("validator")
+graph.set_finish_point("skip_validation")
+graph.set_finish_point("defer_validation")
 
-# Initialize memory checkpointer
-memory = MemorySaver()
+# Persistent, bounded checkpointer (MEKA_CHECKPOINTER=memory for the in-process MemorySaver)
+memory = create_checkpointer()
 app = graph.compile(checkpointer=memory)
 
-def run_meka(query: str, web_search: bool = False, thread_id: str = "default_user"):
-    config = {"configurable": {"thread_id": thread_id}}
-    return app.invoke({
-        "messages": [HumanMessage(content=query)],
-        "query": query, 
-        "web_search_enabled": web_search,
-        "reasoning_trace": []
-    }, config=config)
+# One answer cache per tenant: the same question can have a different answer in each corpus
+_answer_caches = {}
+
+def get_answer_cache(tenant: str = None):
+    tenant = tenant or DEFAULT_TENANT
+    if tenant not in _answer_caches:
+        _answer_caches[tenant] = AnswerCache(embed_fn=lambda text: get_embeddings().embed_query(text))
+    return _answer_caches[tenant]
+
+# Identical concurrent queries share one graph run (POST /query jobs and streams coalesce separately)
+_flights = SingleFlight()
+_stream_flights = StreamSingleFlight()
+_validation_flights = SingleFlight()
+JOINED_TRACE = "Single-flight: Joined the in-flight run of the same query"
+
+def _thread_config(thread_id: str, tenant: str = None):
+    # Conversations are per tenant, so the same thread id in two tenants never shares history
+    if tenant and tenant != DEFAULT_TENANT:
+        thread_id = f"{tenant}:{thread_id}"
+    return {"configurable": {"thread_id": thread_id}}
+
+def _cached_result(query: str, cached: dict, hit: dict):
+    label = f"{hit['kind']} match" if hit["kind"] == "exact" else f"semantic match ({hit['similarity']}) with '{hit['matched']}'"
+    return {
+        **cached,
+        # The cache keeps the text of its answers' context, which may have left the chunk store
+        "reranked_docs": put_chunks(cached.get("reranked_docs", [])),
+        "query": query,
+        "cache": {"hit": True, **hit},
+        "reasoning_trace": [f"Cache: Served answer from cache - {label}"],
+    }
+
+def _cached_turn(query: str, answer: str):
+    # Keep the thread's conversation consistent, as if the graph had produced this answer
+    return {"messages": [HumanMessage(content=query), AIMessage(content=answer)], "query": query, "final_answer": answer}
+
+def _is_cacheable(values: dict, filters: dict = None):
+    # Answers on a thread with history depend on that history, so only fresh threads use the cache.
+    # Filtered queries see a subset of the corpus and bypass it too.
+    return ANSWER_CACHE_ENABLED and not values.get("messages") and not filters
+
+def _should_store(result: dict):
+    return bool(result.get("final_answer")) and result.get("validation") != "HALLUCINATED"
+
+def _store_answer(cache, query: str, web_search: bool, version, result: dict, embedding, tenant: str):
+    cache.store(query, web_search, version, {**result, "reranked_docs": materialize(result.get("reranked_docs"), tenant)},
+                embedding)
 
-async def stream_meka(query: str, web_search: bool = False, thread_id: str = "default_user"):
-    config = {"configurable": {"thread_id": thread_id}}
-    async for event in app.astream({
+def materialize_result(result: dict, tenant: str = None):
+    """A copy of a run's state with its chunk references expanded into Documents, for responses."""
+    result = dict(result)
+    for key in ("retrieved_docs", "reranked_docs"):
+        if result.get(key):
+            result[key] = materialize(result[key], tenant)
+    return result
+
+def timing_breakdown(result: dict, total_ms: float, **extra):
+    """Per-request latency breakdown: node wall times, retrieval source latencies and LLM tokens."""
+    sources = (result.get("retrieval_stats") or {}).get("sources", {})
+    return {
+        "total_ms": round(total_ms, 1),
+        **extra,
+        "stages": result.get("timings", {}),
+        "retrieval": {name: s.get("latency_ms") for name, s in sources.items()},
+        "tokens": result.get("token_usage", {}),
+    }
+
+def needs_background_validation(result: dict):
+    return result.get("validation") == "PENDING" and bool(result.get("final_answer"))
+
+def validate_deferred(query: str, web_search: bool, result: dict, tenant: str = None):
+    """
+    Runs the groundedness check that the graph deferred and returns the verdict fields.
+    The cached copy of the answer is updated with the verdict, or evicted if it is hallucinated.
+    Callers that shared one run validate the same answer, so their checks are coalesced too.
+    """
+    def check():
+        return validate_answer(result["final_answer"], result.get("reranked_docs", []), tenant)
+
+    key = (flight_key(query, web_search, None, tenant), result["final_answer"])
+    (status, reason), _ = _validation_flights.do(key, check)
+    if ANSWER_CACHE_ENABLED:
+        get_answer_cache(tenant).settle(query, web_search, result["final_answer"], status, reason)
+    return {
+        "validation": status,
+        "reason": reason,
+        "trace": f"Validator: Answer is {status} - {reason}",
+    }
+
+def _initial_state(query: str, web_search: bool, filters: dict, tenant: str):
+    return {
         "messages": [HumanMessage(content=query)],
         "query": query,
         "web_search_enabled": web_search,
-        "reasoning_trace": []
-    }, config=config, stream_mode="updates"):
-        yield event
+        "web_searched": False,
+        "filters": filters,
+        "tenant": tenant,
+        "planner_output": "",
+        "sub_queries": [],
+        "route": [],
+        "timings": {},
+        "token_usage": {},
+        "reasoning_trace": None
+    }
+
+def run_meka(query: str, web_search: bool = False, thread_id: str = "default_user", filters: dict = None,
+             tenant: str = None):
+    tenant = get_tenant(tenant).name
+    config = _thread_config(thread_id, tenant)
+    filters = normalize_filters(filters)
+    values = app.get_state(config).values
+    cacheable = _is_cacheable(values, filters)
+    if cacheable:
+        cache, version = get_answer_cache(tenant), get_corpus_version(tenant)
+        cached, hit, embedding = cache.lookup(query, web_search, version)
+        if cached:
+            app.update_state(config, _cached_turn(query, cached["final_answer"]), as_node="validator")
+            return _cached_result(query, cached, hit)
+
+    def run():
+        return app.invoke(_initial_state(query, web_search, filters, tenant), config=config)
+
+    # Like the cache, only fresh threads share a run: with history the answer is thread-specific
+    leader = True
+    if SINGLE_FLIGHT_ENABLED and not values.get("messages"):
+        key = flight_key(query, web_search, get_corpus_version(tenant), tenant, filters)
+        result, leader = _flights.do(key, run)
+        # The result object is shared with every caller that joined the run
+        result = {**result, "reasoning_trace": list(result.get("reasoning_trace", []))}
+    else:
+        result = run()
+
+    if not leader:
+        if result.get("final_answer"):
+            app.update_state(config, _cached_turn(query, result["final_answer"]), as_node="validator")
+        result["reasoning_trace"].insert(0, JOINED_TRACE)
+        result["single_flight"] = {"joined": True}
+    if cacheable:
+        result["reasoning_trace"].insert(0, "Cache: Miss")
+        result["cache"] = {"hit": False}
+        if leader and _should_store(result):
+            _store_answer(cache, query, web_search, version, result, embedding, tenant)
+    return result
+
+async def _stream_graph(query: str, web_search: bool, inputs: dict, config: dict, store=None):
+    """
+    Streams one graph run as ("update", ...) and ("delta", ...) events; `store` is the
+    (cache, version, embedding) to save a good final answer under.
+    """
+    final_state = {}
+    async for mode, event in app.astream(inputs, config=config, stream_mode=["updates", "custom"]):
+        if mode == "custom":
+            if "answer_delta" in event:
+                yield "delta", event
+            continue
+        if not isinstance(event, dict):
+            continue
+        for update in event.values():
+            if isinstance(update, dict):
+                final_state.update(update)
+        yield "update", event
+
+    if store is not None and _should_store(final_state):
+        cache, version, embedding = store
+        await asyncio.to_thread(_store_answer, cache, query, web_search, version, final_state, embedding, inputs["tenant"])
+
+async def stream_meka(query: str, web_search: bool = False, thread_id: str = "default_user", filters: dict = None,
+                      tenant: str = None):
+    """
+    Yields ("update", {node: state_update}) after each node and ("delta", {"answer_delta": text})
+    for every token the summarizer generates.
+    Identical concurrent queries on fresh threads share one run, and every caller receives all of its events.
+    """
+    tenant = get_tenant(tenant).name
+    config = _thread_config(thread_id, tenant)
+    filters = normalize_filters(filters)
+    values = (await app.aget_state(config)).values
+    cacheable = _is_cacheable(values, filters)
+    store = None
+    if cacheable:
+        cache, version = get_answer_cache(tenant), get_corpus_version(tenant)
+        cached, hit, embedding = await asyncio.to_thread(cache.lookup, query, web_search, version)
+        if cached:
+            await app.aupdate_state(config, _cached_turn(query, cached["final_answer"]), as_node="validator")
+            yield "update", {"cache": _cached_result(query, cached, hit)}
+            return
+        yield "update", {"cache": {"cache": {"hit": False}, "reasoning_trace": ["Cache: Miss"]}}
+        store = (cache, version, embedding)
+
+    def run():
+        return _stream_graph(query, web_search, _initial_state(query, web_search, filters, tenant), config, store)
+
+    if not SINGLE_FLIGHT_ENABLED or values.get("messages"):
+        async for item in run():
+            yield item
+        return
+
+    key = flight_key(query, web_search, get_corpus_version(tenant), tenant, filters)
+    flight, leader = _stream_flights.join(key, run)
+    if not leader:
+        yield "update", {"single_flight": {"single_flight": {"joined": True}, "reasoning_trace": [JOINED_TRACE]}}
+    answer = None
+    async for kind, event in flight.subscribe():
+        if kind == "update":
+            for update in event.values():
+                if isinstance(update, dict) and update.get("final_answer"):
+                    answer = update["final_answer"]
+        yield kind, event
+    if not leader and answer:
+        await app.aupdate_state(config, _cached_turn(query, answer), as_node="validator")
@@ -0,0 +1,57 @@
+import os
+import re
+from app.agents.validator_agent import VALIDATION_MODE
+
+# Adaptive routing: cheap local signals decide which expensive stages a query needs
+ROUTER_ADAPTIVE = os.getenv("ROUTER_ADAPTIVE", "true").lower() == "true"
+ROUTER_SIMPLE_MAX_WORDS = int(os.getenv("ROUTER_SIMPLE_MAX_WORDS", "12"))
+# Cross-encoder logits: below this the local context is considered weak and web search is tried
+ROUTER_WEB_THRESHOLD = float(os.getenv("ROUTER_WEB_THRESHOLD", "0.0"))
+# At or above this top rerank score the answer is well supported and validation is skipped
+ROUTER_SKIP_VALIDATION_SCORE = float(os.getenv("ROUTER_SKIP_VALIDATION_SCORE", "7.0"))
+
+FOLLOW_UP_RE = re.compile(
+    r"\b(it|its|that|this|those|these|they|them|he|she|more|elaborate|explain|above|previous|earlier|again|else)\b"
+)
+COMPLEX_RE = re.compile(
+    r"\b(and|or|versus|vs|compare|comparison|difference|differences|between|pros|cons|why|how)\b|[,;]"
+)
+
+def classify_query(query: str, history_turns: int):
+    """
+    Returns (needs_planner, reason) from query length, intent keywords and conversation state.
+    """
+    text = query.lower()
+    words = len(text.split())
+    if history_turns and (FOLLOW_UP_RE.search(text) or words <= 4):
+        return True, "follow-up needs history resolution"
+    if words > ROUTER_SIMPLE_MAX_WORDS:
+        return True, f"long query ({words} words)"
+    if text.count("?") > 1 or COMPLEX_RE.search(text):
+        return True, "multi-part or analytical query"
+    return False, f"simple lookup ({words} words)"
+
+def top_rerank_score(state: dict):
+    refs = state.get("reranked_docs") or []
+    scores = [r["rerank_score"] for r in refs if r.get("rerank_score") is not None]
+    return max(scores) if scores else None
+
+def route_after_router(state: dict):
+    return "planner" if state.get("needs_planner", True) else "retriever"
+
+def has_structured_match(state: dict):
+    return any(r.get("structured") for r in state.get("reranked_docs") or [])
+
+def route_after_rerank(state: dict):
+    if not ROUTER_ADAPTIVE or not state.get("web_search_enabled") or state.get("web_searched"):
+        return "summarizer"
+    if has_structured_match(state):
+        return "summarizer"
+    top = top_rerank_score(state)
+    return "web_search" if top is None or top < ROUTER_WEB_THRESHOLD else "summarizer"
+
+def route_after_summary(state: dict):
+    top = top_rerank_score(state)
+    if ROUTER_ADAPTIVE and top is not None and top >= ROUTER_SKIP_VALIDATION_SCORE:
+        return "skip_validation"
+    return "defer_validation" if VALIDATION_MODE == "background" else "validator"
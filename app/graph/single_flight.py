@@ -0,0 +1,121 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from app.graph.answer_cache import normalize_query
+from app.rag.filters import filter_key
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+def flight_key(query: str, web_search: bool, version, tenant: str = None, filters: dict = None):
+    """Requests with the same key would produce the same answer, so they may share one run."""
+    return (tenant or "", normalize_query(query), bool(web_search), version, filter_key(filters))
+
+class SingleFlight:
+    """
+    Blocking single-flight: the first caller for a key runs fn, callers arriving while it runs
+    wait for and share its result (or its exception). Nothing is kept once the run finishes.
+    """
+
+    def __init__(self):
+        self.stats = {"runs": 0, "joined": 0}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Returns (result, leader); leader is False when the result came from another caller's run."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.stats["runs"] += 1
+            else:
+                self.stats["joined"] += 1
+        if not leader:
+            return future.result(), False
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return result, True
+
+class _Broadcast:
+    """Every event of one run, replayed to late subscribers and fanned out to live ones."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.task = None
+        self.changed = asyncio.Condition()
+
+    async def publish(self, event=None, error=None):
+        async with self.changed:
+            if event is not None:
+                self.events.append(event)
+            else:
+                self.done, self.error = True, error
+            self.changed.notify_all()
+
+    async def subscribe(self):
+        position = 0
+        while True:
+            async with self.changed:
+                while position == len(self.events) and not self.done:
+                    await self.changed.wait()
+                pending = self.events[position:]
+                finished, error = self.done, self.error
+            position += len(pending)
+            for event in pending:
+                yield event
+            if finished and position == len(self.events):
+                if error is not None:
+                    raise error
+                return
+
+class StreamSingleFlight:
+    """
+    Streaming single-flight for one event loop. The first subscriber for a key starts the source
+    stream on its own task, so a client disconnecting never stops the run the others wait on;
+    every subscriber, early or late, receives all of its events in order.
+    """
+
+    def __init__(self):
+        self.stats = {"runs": 0, "joined": 0}
+        self._flights = {}
+
+    def join(self, key, source):
+        """
+        Returns (broadcast, leader). `source` is a zero-argument callable returning the async
+        iterator of events; it is only called when no run for the key is in flight.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = _Broadcast()
+            self.stats["runs"] += 1
+            # Referenced from the flight, so the task isn't garbage collected while it runs
+            flight.task = asyncio.create_task(self._pump(key, flight, source()))
+        else:
+            self.stats["joined"] += 1
+        return flight, leader
+
+    async def _pump(self, key, flight, events):
+        error = None
+        try:
+            async for event in events:
+                await flight.publish(event)
+        except Exception as e:
+            error = e
+        finally:
+            # Later requests start a fresh run rather than replaying a finished one
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            await flight.publish(error=error)
@@ -0,0 +1,68 @@
+import json
+import os
+import re
+import time
+from typing import Any, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+FAKE_LLM_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "0"))
+
+def _estimate_tokens(text: str):
+    return max(1, len(text) // 4)
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for the Groq model (LLM_PROVIDER=fake).
+    Returns deterministic, prompt-shaped answers with optional simulated latency, so the
+    whole pipeline can be load-tested without network access or API quota.
+    """
+
+    latency_ms: float = FAKE_LLM_LATENCY_MS
+    token_ms: float = FAKE_LLM_TOKEN_MS
+
+    @property
+    def _llm_type(self) -> str:
+        return "meka-fake"
+
+    def _respond(self, prompt: str):
+        if "STATUS: GROUNDED or HALLUCINATED" in prompt:
+            return "STATUS: GROUNDED\nREASON: Offline stub validator"
+        if "planning agent" in prompt:
+            match = re.search(r"\*\*Current User Query:\*\* (.*)", prompt)
+            query = match.group(1).strip() if match else ""
+            return json.dumps({"plan": f"Search the knowledge base for: {query}", "sub_queries": [query] if query else []})
+        context = re.search(r"\*\*Retrieved Context:\*\*\n(.*?)\n\n\*\*Current User Query", prompt, re.S)
+        if context and context.group(1).strip():
+            return " ".join(context.group(1).split()[:60])
+        return "I could not find this in the knowledge base."
+
+    def _usage(self, prompt: str, text: str):
+        input_tokens, output_tokens = _estimate_tokens(prompt), _estimate_tokens(text)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        prompt = messages[-1].content
+        text = self._respond(prompt)
+        time.sleep((self.latency_ms + self.token_ms * _estimate_tokens(text)) / 1000)
+        message = AIMessage(content=text, usage_metadata=self._usage(prompt, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        prompt = messages[-1].content
+        text = self._respond(prompt)
+        time.sleep(self.latency_ms / 1000)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.token_ms / 1000)
+            token = word if i == len(words) - 1 else word + " "
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(prompt, text)))
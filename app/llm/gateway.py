@@ -0,0 +1,192 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from app.utils.logger import get_logger
+from app.utils.metrics import record_llm_call
+
+logger = get_logger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Per-process limits, off (0) by default: set them to the provider quota divided by the number of
+# worker processes. Without them, 429s from the provider are still retried with backoff.
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# Completion tokens reserved up front, corrected once the real usage is known
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "256"))
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to the same capacity.
+    reserve() takes units immediately (the balance may go negative) and returns how long the
+    caller must wait, so the same bucket serves threads and coroutines.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        if self.capacity <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= min(amount, self.capacity)
+            return max(0.0, -self.level / self.rate)
+
+def _is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    # Connection resets and timeouts carry no status code
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout", "RemoteProtocolError")
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except Exception:
+        return None
+
+def _estimate_tokens(prompt):
+    return len(str(prompt)) // 4 + LLM_EXPECTED_COMPLETION_TOKENS
+
+class LLMGateway:
+    """
+    Shared entry point for every LLM call: one pooled client, a concurrency cap, client-side
+    request/token rate limiting, exponential backoff on 429/5xx and per-call latency/token stats.
+    Exposes invoke/ainvoke/stream like a chat model.
+    """
+
+    def __init__(self, model, provider, max_concurrency=LLM_MAX_CONCURRENCY, max_retries=LLM_MAX_RETRIES,
+                 requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE):
+        self.model = model
+        self.provider = provider
+        self.max_retries = max_retries
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._stats = {"calls": 0, "errors": 0, "retries": 0, "throttled_s": 0.0,
+                       "input_tokens": 0, "output_tokens": 0}
+
+    # --- bookkeeping -------------------------------------------------------
+
+    def _throttle_delay(self, prompt):
+        estimate = _estimate_tokens(prompt)
+        delay = max(self._requests.reserve(1), self._tokens.reserve(estimate))
+        if delay:
+            with self._lock:
+                self._stats["throttled_s"] += delay
+        return delay, estimate
+
+    def _backoff(self, attempt, error):
+        delay = _retry_after(error) or min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)
+        with self._lock:
+            self._stats["retries"] += 1
+        logger.warning(f"LLM call failed ({error}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        return delay * (1 + random.random() * 0.1)
+
+    def _record(self, started, estimate, usage, failed=False):
+        latency_ms = (time.perf_counter() - started) * 1000
+        usage = usage or {}
+        # Give back (or take) the difference between the reserved estimate and the real usage
+        if usage.get("total_tokens"):
+            self._tokens.reserve(usage["total_tokens"] - estimate)
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["errors"] += int(failed)
+            self._stats["input_tokens"] += usage.get("input_tokens", 0)
+            self._stats["output_tokens"] += usage.get("output_tokens", 0)
+            self._latencies.append(latency_ms)
+        record_llm_call(latency_ms / 1000, usage, failed)
+        return latency_ms
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._stats)
+        if latencies:
+            stats["latency_ms_p50"] = round(latencies[len(latencies) // 2], 1)
+            stats["latency_ms_p95"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1)
+        stats["provider"] = self.provider
+        return stats
+
+    # --- calls -------------------------------------------------------------
+
+    def invoke(self, prompt, **kwargs):
+        with self._slots:
+            for attempt in range(self.max_retries + 1):
+                delay, estimate = self._throttle_delay(prompt)
+                time.sleep(delay)
+                started = time.perf_counter()
+                try:
+                    response = self.model.invoke(prompt, **kwargs)
+                except Exception as e:
+                    self._record(started, estimate, None, failed=True)
+                    if attempt == self.max_retries or not _is_retryable(e):
+                        raise
+                    time.sleep(self._backoff(attempt, e))
+                    continue
+                self._record(started, estimate, getattr(response, "usage_metadata", None))
+                return response
+
+    async def ainvoke(self, prompt, **kwargs):
+        loop = asyncio.get_running_loop()
+        # The cap is shared with threaded callers, so wait for a slot off the event loop
+        await loop.run_in_executor(None, self._slots.acquire)
+        try:
+            for attempt in range(self.max_retries + 1):
+                delay, estimate = self._throttle_delay(prompt)
+                await asyncio.sleep(delay)
+                started = time.perf_counter()
+                try:
+                    response = await self.model.ainvoke(prompt, **kwargs)
+                except Exception as e:
+                    self._record(started, estimate, None, failed=True)
+                    if attempt == self.max_retries or not _is_retryable(e):
+                        raise
+                    await asyncio.sleep(self._backoff(attempt, e))
+                    continue
+                self._record(started, estimate, getattr(response, "usage_metadata", None))
+                return response
+        finally:
+            self._slots.release()
+
+    def stream(self, prompt, **kwargs):
+        """
+        Yields message chunks. Retries only if the call fails before the first chunk arrives.
+        """
+        with self._slots:
+            for attempt in range(self.max_retries + 1):
+                delay, estimate = self._throttle_delay(prompt)
+                time.sleep(delay)
+                started = time.perf_counter()
+                usage, emitted = None, False
+                try:
+                    for chunk in self.model.stream(prompt, **kwargs):
+                        if getattr(chunk, "usage_metadata", None):
+                            usage = chunk.usage_metadata
+                        emitted = True
+                        yield chunk
+                except Exception as e:
+                    self._record(started, estimate, usage, failed=True)
+                    if emitted or attempt == self.max_retries or not _is_retryable(e):
+                        raise
+                    time.sleep(self._backoff(attempt, e))
+                    continue
+                self._record(started, estimate, usage)
+                return
@@ -1,15 +1,42 @@
 import os
+import threading
+import httpx
 from langchain_groq import ChatGroq
 from dotenv import load_dotenv
+from app.llm.gateway import LLMGateway, LLM_MAX_CONCURRENCY
 load_dotenv()
- 
-def get_llm():
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq")  # "groq" or "fake" (offline stub)
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def _build_groq_model():
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         raise ValueError("GROQ_API_KEY not set")
- 
+
+    # Keep-alive pools sized to the concurrency cap so connections are reused across agents and queries
+    limits = httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY)
     return ChatGroq(
         groq_api_key=api_key,
-        model="llama-3.1-8b-instant",
-        temperature=0.2
-    )
\ No newline at end of file
+        model=LLM_MODEL,
+        temperature=0.2,
+        max_retries=0,  # retries are handled by the gateway
+        request_timeout=LLM_TIMEOUT,
+        http_client=httpx.Client(limits=limits, timeout=LLM_TIMEOUT),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=LLM_TIMEOUT)
+    )
+
+def get_llm():
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            if LLM_PROVIDER == "fake":
+                from app.llm.fake_llm import FakeChatModel
+                _gateway = LLMGateway(FakeChatModel(), provider="fake", requests_per_minute=0, tokens_per_minute=0)
+            else:
+                _gateway = LLMGateway(_build_groq_model(), provider="groq")
+    return _gateway
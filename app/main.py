@@ -1,5 +1,6 @@
 import logging
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import asyncio
@@ -10,10 +11,9 @@ logger = logging.getLogger("MEKA")
 
 load_dotenv()
 
-# Import RAG components to trigger eager model loading
-from app.rag.vector_db import get_embeddings, get_vector_store
-from app.rag.retriever import get_bm25_retriever
 from app.api.routes import router
+from app.startup import warmup
+from app.utils.metrics import render_metrics, set_runtime_stats
 
 app = FastAPI(title="Multi-Agent RAG API | MEKA")
 
@@ -24,25 +24,78 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.on_event("startup")
 async def startup_event():
-    logger.info("--- MEKA Backend Initializing ---")
-    # Eagerly load AI models during startup to prevent request timeouts
-    try:
-        logger.info("Pre-loading Embeddings (HuggingFace)...")
-        get_embeddings()
-        logger.info("Pre-loading Vector Store (Chroma)...")
-        get_vector_store()
-        logger.info("Pre-loading BM25 Index...")
-        get_bm25_retriever()
-        logger.info("--- Initialization Complete ---")
-    except Exception as e:
-        logger.warning(f"Initialization Warning: {e}")
+    # Models, the vector store and the BM25 snapshot load in the background; /ready reports progress
+    logger.info("--- MEKA Backend Initializing (warming up in background) ---")
+    warmup.start()
 
 app.include_router(router)
 
 @app.get("/")
 def root():
-    return {"status": "API is running", "version": "1.0.0"}
\ No newline at end of file
+    return {"status": "API is running", "version": "1.0.0"}
+
+@app.get("/health")
+def health():
+    """Liveness: the process is up and serving, whether or not warmup has finished."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 once every model and index has loaded, 503 with per-component status until then."""
+    state = warmup.describe()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+def _hit_rate(hits, total):
+    return round(hits / total, 4) if total else 0.0
+
+def _tenant_component(component, tenant):
+    from app.rag.vector_db import DEFAULT_TENANT
+    return component if tenant == DEFAULT_TENANT else f"{component}:{tenant}"
+
+def _collect_runtime_stats():
+    """Snapshots queue depth and cache/gateway counters into gauges; components not yet created are skipped."""
+    from app.utils import jobs
+    from app.graph import orchestrator
+    from app.rag import rerank_service, vector_db, structured_store, web_search, chunk_store
+    from app.llm import groq_llm
+
+    if jobs._job_queue is not None:
+        set_runtime_stats("query_queue", jobs._job_queue.stats())
+    for tenant, cache in list(orchestrator._answer_caches.items()):
+        stats = dict(cache.stats)
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        stats["hit_rate"] = _hit_rate(hits, hits + stats["misses"])
+        stats["entries"] = len(cache._entries)
+        set_runtime_stats(_tenant_component("answer_cache", tenant), stats)
+    flights = (orchestrator._flights, orchestrator._stream_flights)
+    set_runtime_stats("single_flight", {stat: sum(f.stats[stat] for f in flights) for stat in ("runs", "joined")})
+    for tenant in list(vector_db._tenants.values()):
+        if tenant._stores is not None:
+            set_runtime_stats(_tenant_component("corpus", tenant.name), tenant.describe())
+    if vector_db._embeddings is not None:
+        set_runtime_stats("embeddings", vector_db._embeddings.describe())
+    for tenant, store in list(structured_store._stores.items()):
+        set_runtime_stats(_tenant_component("structured", tenant), store.describe())
+    if chunk_store._chunk_store is not None:
+        set_runtime_stats("chunk_store", chunk_store._chunk_store.describe())
+    if web_search._web_search is not None:
+        set_runtime_stats("web_search", web_search._web_search.describe())
+    if rerank_service._rerank_service is not None:
+        stats = dict(rerank_service._rerank_service.stats)
+        stats["hit_rate"] = _hit_rate(stats["cache_hits"], stats["cache_hits"] + stats["cache_misses"])
+        set_runtime_stats("rerank", stats)
+    if groq_llm._gateway is not None:
+        set_runtime_stats("llm", groq_llm._gateway.stats())
+    if hasattr(orchestrator.memory, "stats"):
+        set_runtime_stats("checkpointer", orchestrator.memory.stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text format. Metrics are per worker process."""
+    _collect_runtime_stats()
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
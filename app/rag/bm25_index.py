@@ -0,0 +1,223 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import numpy as np
+from scipy import sparse
+
+TOKEN_RE = re.compile(r"\w+")
+# Matrix files no snapshot points to are removed once older than this (a writer's save takes seconds)
+ORPHAN_SECONDS = 3600
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+def _widen(matrix, width):
+    """A copy of a CSR matrix with its column count raised to width (new columns are empty)."""
+    matrix = matrix.tocsr()
+    return sparse.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], width), copy=True)
+
+class BM25Index:
+    """
+    Okapi BM25 over a sparse chunk x term frequency matrix.
+    Rows are chunk IDs shared with the vector store, so hits are resolved back to the stored chunks.
+    Scoring only touches the non-zeros of the query's columns, which keeps top-k fast on large corpora.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.version = None
+        self.vocab = {}
+        self._lock = threading.Lock()
+        self._set_state([], sparse.csr_matrix((0, 0), dtype=np.float32))
+
+    def __len__(self):
+        return len(self._state["ids"])
+
+    def _set_state(self, ids, matrix):
+        matrix = matrix.tocsr()
+        doc_len = np.asarray(matrix.sum(axis=1), dtype=np.float32).ravel()
+        # Searches read one immutable snapshot, so updates never expose a half-built index
+        self._state = {
+            "ids": ids,
+            "row_of": {cid: i for i, cid in enumerate(ids)},
+            "csr": matrix,
+            "csc": matrix.tocsc(),
+            "doc_len": doc_len,
+            "avgdl": float(doc_len.mean()) if len(ids) else 0.0,
+            "masks": {},
+        }
+
+    def encode(self, texts):
+        """
+        Tokenizes texts into a sparse term-frequency block that update() can append later.
+        Lets a sync stream chunks through without holding their text until the index is updated.
+        """
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            counts = {}
+            for token in tokenize(text):
+                col = self.vocab.setdefault(token, len(self.vocab))
+                counts[col] = counts.get(col, 0) + 1
+            indices.extend(counts.keys())
+            data.extend(counts.values())
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(texts), len(self.vocab))
+        )
+
+    def update(self, add_ids=(), add_texts=(), remove_ids=(), add_rows=None):
+        """
+        Applies an incremental change: only added texts are tokenized, removed rows are sliced out.
+        Re-adding an existing ID replaces its row. Pre-encoded blocks can be passed as add_rows.
+        """
+        with self._lock:
+            state = self._state
+            add_ids = list(add_ids)
+            drop = (set(remove_ids) | set(add_ids)) & state["row_of"].keys()
+            ids, matrix = state["ids"], state["csr"]
+            if drop:
+                keep = [i for i, cid in enumerate(ids) if cid not in drop]
+                ids = [ids[i] for i in keep]
+                matrix = matrix[keep]
+            if add_ids:
+                blocks = add_rows if add_rows is not None else [self.encode(list(add_texts))]
+                width = len(self.vocab)
+                # Widened copies: the live snapshot and the caller's blocks are left untouched
+                matrix = sparse.vstack([_widen(m, width) for m in [matrix, *blocks]], format="csr")
+                ids = ids + add_ids
+            self._set_state(ids, matrix)
+
+    def _mask(self, state, allowed, key):
+        mask = state["masks"].get(key) if key is not None else None
+        if mask is None:
+            mask = np.zeros(len(state["ids"]), dtype=bool)
+            rows = [state["row_of"][cid] for cid in allowed if cid in state["row_of"]]
+            mask[rows] = True
+            if key is not None:
+                # Kept with the snapshot, so a mask never outlives the rows it was built for
+                if len(state["masks"]) >= 64:
+                    state["masks"].clear()
+                state["masks"][key] = mask
+        return mask
+
+    def search(self, query, k=5, allowed=None, allowed_key=None):
+        """
+        Returns up to k (chunk_id, score) pairs, best first. With `allowed` (chunk IDs) only
+        those chunks are ranked; the row mask is cached under `allowed_key`.
+        """
+        state = self._state
+        n = len(state["ids"])
+        width = state["csc"].shape[1]
+        query_terms = {}
+        for token in tokenize(query):
+            col = self.vocab.get(token)
+            # Terms added by an in-progress update aren't in this snapshot yet
+            if col is not None and col < width:
+                query_terms[col] = query_terms.get(col, 0) + 1
+        if not n or not query_terms:
+            return []
+
+        cols = np.fromiter(query_terms.keys(), dtype=np.int64)
+        qtf = np.fromiter(query_terms.values(), dtype=np.float32)
+        sub = state["csc"][:, cols]
+        df = np.diff(sub.indptr)
+        idf = np.log((n - df + 0.5) / (df + 0.5) + 1.0)
+
+        rows = sub.indices
+        tf = sub.data
+        col_of = np.repeat(np.arange(len(cols)), df)
+        norm = self.k1 * (1 - self.b + self.b * state["doc_len"][rows] / state["avgdl"])
+        weights = (idf * qtf)[col_of] * tf * (self.k1 + 1) / (tf + norm)
+        scores = np.bincount(rows, weights=weights, minlength=n)
+        if allowed is not None:
+            scores[~self._mask(state, allowed, allowed_key)] = 0.0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(state["ids"][i], float(scores[i])) for i in candidates]
+
+    def save(self, path):
+        """
+        Writes a snapshot without locks. The matrix goes to a file named after a fresh snapshot ID
+        and meta.json, replaced atomically last, names it, so concurrent writers never pair one's
+        matrix with another's vocabulary. Each writer then removes the matrix its meta.json replaced,
+        which no meta.json can point to again.
+        """
+        os.makedirs(path, exist_ok=True)
+        state = self._state
+        matrix_file = f"matrix-{uuid.uuid4().hex}.npz"
+        sparse.save_npz(os.path.join(path, matrix_file), state["csr"])
+        meta = {
+            "matrix": matrix_file,
+            "version": self.version,
+            "k1": self.k1,
+            "b": self.b,
+            "rows": len(state["ids"]),
+            "ids": state["ids"],
+            "vocab": sorted(self.vocab, key=self.vocab.get),
+        }
+        meta_path = os.path.join(path, "meta.json")
+        replaced = self._matrix_file(meta_path)
+        fd, tmp_path = tempfile.mkstemp(prefix="meta-", suffix=".tmp", dir=path)
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        current = self._matrix_file(meta_path)
+        for name in os.listdir(path):
+            if not name.startswith("matrix") or not name.endswith(".npz") or name in (matrix_file, current):
+                continue
+            try:
+                # Matrices of writers that lost a race are only removed once clearly abandoned
+                if name == replaced or time.time() - os.path.getmtime(os.path.join(path, name)) > ORPHAN_SECONDS:
+                    os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _matrix_file(meta_path):
+        try:
+            with open(meta_path, "r") as f:
+                # Snapshots written before snapshot IDs were added use a fixed file name
+                return json.load(f).get("matrix", "matrix.npz")
+        except Exception:
+            return None
+
+    @classmethod
+    def load(cls, path, attempts=2):
+        """
+        Restores a saved index, or returns None if it is missing or inconsistent. A snapshot
+        replaced while it was being read is retried once with the new one.
+        """
+        meta_path = os.path.join(path, "meta.json")
+        for _ in range(attempts):
+            if not os.path.exists(meta_path):
+                return None
+            try:
+                with open(meta_path, "r") as f:
+                    meta = json.load(f)
+                matrix = sparse.load_npz(os.path.join(path, meta.get("matrix", "matrix.npz")))
+                break
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"Could not load BM25 index from {path}: {e}")
+                return None
+        else:
+            return None
+        if matrix.shape[0] != meta["rows"] or matrix.shape[0] != len(meta["ids"]) or matrix.shape[1] > len(meta["vocab"]):
+            print(f"BM25 index at {path} is inconsistent; it will be rebuilt.")
+            return None
+        index = cls(k1=meta["k1"], b=meta["b"])
+        index.version = meta["version"]
+        index.vocab = {term: i for i, term in enumerate(meta["vocab"])}
+        matrix.resize((matrix.shape[0], len(index.vocab)))
+        index._set_state(meta["ids"], matrix)
+        return index
@@ -0,0 +1,113 @@
+import os
+import threading
+from collections import OrderedDict
+from langchain_core.documents import Document
+from app.rag.retriever import dedup_key
+
+# Retrieved chunks kept in memory for materializing the references held in graph state
+CHUNK_STORE_SIZE = int(os.getenv("CHUNK_STORE_SIZE", "20000"))
+# Per-run fields a chunk reference carries: position (for overlap trimming) and scores.
+# Everything else, text included, lives once in the chunk store.
+REF_FIELDS = ("source", "start_index", "structured", "vector_score", "bm25_score", "web_score",
+              "fusion_score", "rerank_score", "retrieval_sources")
+RUN_FIELDS = ("vector_score", "bm25_score", "web_score", "fusion_score", "rerank_score", "retrieval_sources")
+# Chunks with these key prefixes (web results, table rows, unstored text) can't be re-read from
+# the tenant's vector store, so their references carry the text and metadata themselves
+PAYLOAD_PREFIXES = ("text:", "row:", "web:")
+
+
+class ChunkStore:
+    """
+    Process-wide LRU of retrieved chunks keyed by dedup key (the chunk ID for stored chunks).
+    Graph state holds compact references, {"id", "source", "start_index", scores...}, instead of
+    Documents, which keeps checkpoints and state copies small; the text is materialized only to
+    score candidates, build prompts and render responses. Chunks outside the tenant's vector store
+    keep their payload in the reference, so eviction or a restart never loses them.
+    """
+
+    def __init__(self, max_size=CHUNK_STORE_SIZE):
+        self.max_size = max_size
+        self.stats = {"puts": 0, "hits": 0, "misses": 0, "unresolved": 0}
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, docs: list):
+        """Stores the chunks and returns their references, in order."""
+        refs = []
+        with self._lock:
+            for doc in docs:
+                key = dedup_key(doc)
+                if key in self._chunks:
+                    self._chunks.move_to_end(key)
+                else:
+                    metadata = {k: v for k, v in doc.metadata.items() if k not in RUN_FIELDS}
+                    self._chunks[key] = Document(page_content=doc.page_content, metadata=metadata)
+                ref = {"id": key, **{f: doc.metadata[f] for f in REF_FIELDS if f in doc.metadata}}
+                if key.startswith(PAYLOAD_PREFIXES):
+                    ref["text"] = doc.page_content
+                    ref["metadata"] = {k: v for k, v in doc.metadata.items() if k not in REF_FIELDS}
+                refs.append(ref)
+            self.stats["puts"] += len(docs)
+            while len(self._chunks) > self.max_size:
+                self._chunks.popitem(last=False)
+        return refs
+
+    def materialize(self, refs: list, tenant: str = None):
+        """
+        Documents for the references, with their per-run scores in metadata. Chunks evicted from
+        the store are rebuilt from the reference's payload or re-read from the tenant's vector
+        store; ones found nowhere (e.g. deleted by a sync since) are dropped and logged.
+        """
+        found = {}
+        with self._lock:
+            for ref in refs:
+                doc = self._chunks.get(ref["id"])
+                if doc is not None:
+                    found[ref["id"]] = doc
+            self.stats["hits"] += len(found)
+        for ref in refs:
+            if ref["id"] not in found and "text" in ref:
+                found[ref["id"]] = Document(page_content=ref["text"], metadata=ref.get("metadata", {}))
+        missing = [ref["id"] for ref in refs if ref["id"] not in found]
+        if missing:
+            from app.rag.vector_db import get_documents_by_ids
+            for doc in get_documents_by_ids(missing, tenant=tenant):
+                found[doc.metadata["chunk_id"]] = doc
+            unresolved = [cid for cid in missing if cid not in found]
+            with self._lock:
+                self.stats["misses"] += len(missing)
+                self.stats["unresolved"] += len(unresolved)
+            if unresolved:
+                print(f"Chunk store: dropped {len(unresolved)} unresolved chunk reference(s) "
+                      f"for tenant '{tenant or 'default'}': {unresolved[:5]}")
+        docs = []
+        for ref in refs:
+            doc = found.get(ref["id"])
+            if doc is not None:
+                metadata = {**doc.metadata, **{k: v for k, v in ref.items() if k not in ("id", "text", "metadata")}}
+                docs.append(Document(page_content=doc.page_content, metadata=metadata))
+        return docs
+
+    def describe(self):
+        with self._lock:
+            return {"chunks": len(self._chunks), **self.stats}
+
+
+_chunk_store = None
+_chunk_store_lock = threading.Lock()
+
+
+def get_chunk_store():
+    global _chunk_store
+    with _chunk_store_lock:
+        if _chunk_store is None:
+            _chunk_store = ChunkStore()
+    return _chunk_store
+
+
+def put_chunks(docs: list):
+    return get_chunk_store().put(docs)
+
+
+def materialize(refs: list, tenant: str = None):
+    return get_chunk_store().materialize(refs or [], tenant)
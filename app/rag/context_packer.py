@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+
+# Local tokenizer used for budgeting. Defaults to the embedding model's, which is already on disk;
+# counts are approximate for the LLM's own tokenizer, so budgets should leave some headroom.
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "sentence-transformers/all-MiniLM-L6-v2")
+# "summarize" condenses turns that don't fit into one line of earlier questions; "window" drops them
+CONTEXT_HISTORY_MODE = os.getenv("CONTEXT_HISTORY_MODE", "summarize")
+# Don't bother packing a truncated chunk into less room than this
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "64"))
+
+def _budget(agent, part, default):
+    return int(os.getenv(f"CONTEXT_{agent.upper()}_{part.upper()}_TOKENS", str(default)))
+
+# Per-agent prompt budgets in tokens, overridable via CONTEXT_{AGENT}_{CONTEXT,HISTORY}_TOKENS
+AGENT_BUDGETS = {
+    "planner": {"history": _budget("planner", "history", 800)},
+    "summarizer": {"context": _budget("summarizer", "context", 3000), "history": _budget("summarizer", "history", 1000)},
+    "validator": {"context": _budget("validator", "context", 3000)},
+}
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+def _get_tokenizer():
+    """Returns the HF tokenizer, or False if it can't be loaded (regex counting is used instead)."""
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            try:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_pretrained(CONTEXT_TOKENIZER)
+                tokenizer.no_truncation()
+                tokenizer.no_padding()
+                _tokenizer = tokenizer
+            except Exception as e:
+                print(f"Context tokenizer unavailable ({e}); falling back to word-piece estimates")
+                _tokenizer = False
+    return _tokenizer
+
+def _token_spans(text: str):
+    tokenizer = _get_tokenizer()
+    if tokenizer:
+        return tokenizer.encode(text, add_special_tokens=False).offsets
+    return [m.span() for m in TOKEN_RE.finditer(text)]
+
+def count_tokens(text: str):
+    return len(_token_spans(text)) if text else 0
+
+def truncate_to_tokens(text: str, max_tokens: int):
+    spans = _token_spans(text)
+    if len(spans) <= max_tokens:
+        return text
+    return text[:spans[max_tokens - 1][1]] if max_tokens > 0 else ""
+
+def _relevance(doc):
+    meta = doc.metadata
+    return meta.get("rerank_score", meta.get("fusion_score", 0.0))
+
+def _trim_overlap(doc, packed):
+    """
+    Drops the text a chunk shares with already packed neighbours from the same source.
+    The splitter's start_index locates overlaps exactly; otherwise a leading overlap is found by
+    suffix/prefix match.
+    """
+    text = doc.page_content
+    source, start = doc.metadata.get("source"), doc.metadata.get("start_index")
+    head, tail = 0, len(text)
+    for other in packed:
+        if other.metadata.get("source") != source:
+            continue
+        other_start = other.metadata.get("start_index")
+        if start is not None and other_start is not None:
+            other_end = other_start + len(other.page_content)
+            if other_start <= start < other_end:
+                head = max(head, other_end - start)
+            elif start < other_start < start + len(text):
+                tail = min(tail, other_start - start)
+            continue
+        prev = other.page_content
+        for size in range(min(len(prev), len(text), 300), 19, -1):
+            if prev.endswith(text[:size]):
+                head = max(head, size)
+                break
+    return text[head:tail] if head < tail else ""
+
+def pack_documents(docs: list, budget: int):
+    """
+    Packs chunks into a context string of at most `budget` tokens, most relevant first.
+    Overlap with already packed neighbouring chunks is trimmed, and the last chunk that
+    doesn't fit is truncated if enough room is left.
+    Returns (context, stats) with stats = {docs, packed, tokens, trimmed_chars}.
+    """
+    packed, parts = [], []
+    used, trimmed = 0, 0
+    for doc in sorted(docs, key=_relevance, reverse=True):
+        text = _trim_overlap(doc, packed).strip()
+        trimmed += len(doc.page_content) - len(text)
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        remaining = budget - used
+        if tokens > remaining:
+            if remaining < CONTEXT_MIN_CHUNK_TOKENS:
+                break
+            text, tokens = truncate_to_tokens(text, remaining), remaining
+        packed.append(doc)
+        parts.append(text)
+        used += tokens
+    stats = {"docs": len(docs), "packed": len(packed), "tokens": used, "trimmed_chars": trimmed}
+    return "\n\n".join(parts), stats
+
+def _turn(msg):
+    role = "User" if hasattr(msg, 'type') and msg.type == 'human' else "Assistant"
+    return f"{role}: {msg.content}\n"
+
+def _window(messages: list, budget: int):
+    """Returns (history, used_tokens, first_kept_index) for the newest turns that fit the budget."""
+    kept, used = [], 0
+    index = len(messages)
+    while index > 0:
+        turn = _turn(messages[index - 1])
+        tokens = count_tokens(turn)
+        if used + tokens > budget:
+            break
+        kept.append(turn)
+        used += tokens
+        index -= 1
+    return "".join(reversed(kept)), used, index
+
+def _earlier_questions(messages: list, budget: int):
+    # Most recent questions first, so the ones closest to the current turn survive the budget
+    prefix = "Earlier in this conversation the user asked: "
+    used = count_tokens(prefix)
+    questions = []
+    for msg in reversed(messages):
+        if getattr(msg, "type", None) != "human":
+            continue
+        tokens = count_tokens(msg.content) + 1
+        if used + tokens > budget:
+            break
+        questions.insert(0, msg.content.strip())
+        used += tokens
+    return prefix + "; ".join(questions) + "\n" if questions else ""
+
+def pack_history(messages: list, budget: int, mode: str = CONTEXT_HISTORY_MODE):
+    """
+    Formats the newest conversation turns that fit into `budget` tokens.
+    Older turns are dropped ("window") or, with a quarter of the budget reserved for them,
+    condensed into one line listing the earlier user questions ("summarize").
+    """
+    history, _, index = _window(messages, budget)
+    if mode != "summarize" or index == 0:
+        return history
+
+    note_budget = budget // 4
+    history, _, index = _window(messages, budget - note_budget)
+    return _earlier_questions(messages[:index], note_budget) + history
@@ -0,0 +1,288 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # "torch" or "onnx"
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_qint8_avx512.onnx")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+# Least recently used vectors beyond this many rows are pruned; 0 keeps every vector
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "500000"))
+# Worker processes for bulk (ingestion) batches; 0 embeds in-process
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "0"))
+# Smaller bulk batches aren't worth shipping to the pool
+EMBEDDING_POOL_MIN_TEXTS = int(os.getenv("EMBEDDING_POOL_MIN_TEXTS", "128"))
+
+
+def load_model(model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    from sentence_transformers import SentenceTransformer
+    print(f"Loading embedding model {model_name} ({backend})...")
+    kwargs = {}
+    if backend == "onnx":
+        kwargs["backend"] = "onnx"
+        kwargs["model_kwargs"] = {"file_name": EMBEDDING_ONNX_FILE}
+    return SentenceTransformer(model_name, **kwargs)
+
+
+# --- worker processes for bulk embedding ---------------------------------
+
+_worker_model = None
+
+def _init_worker(model_name, backend, threads):
+    global _worker_model
+    import torch
+    torch.set_num_threads(threads)
+    _worker_model = load_model(model_name, backend)
+
+def _embed_in_worker(texts, batch_size):
+    return _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+
+class VectorCache:
+    """
+    Persistent content-hash -> vector cache in SQLite (WAL), shared by worker processes.
+    Vectors are stored as raw float32 bytes. Rows record when they were last used (at most
+    hourly, to keep reads cheap) and the least recently used ones are pruned past `max_rows`.
+    """
+
+    TOUCH_INTERVAL = 3600
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_rows=EMBEDDING_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._unpruned = self.PRUNE_EVERY  # check the size on the first write
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+                     "used_at REAL NOT NULL DEFAULT 0)")
+        # Caches written before rows carried a last-used time
+        if "used_at" not in [row[1] for row in conn.execute("PRAGMA table_info(vectors)")]:
+            conn.execute("ALTER TABLE vectors ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS vectors_used_at ON vectors (used_at)")
+
+    def _conn(self):
+        # Connections must not cross a fork, so they are per thread and per process
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get_many(self, keys):
+        now = time.time()
+        found, stale = {}, []
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT key, vector, used_at FROM vectors WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for key, blob, used_at in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+                if used_at < now - self.TOUCH_INTERVAL:
+                    stale.append((now, key))
+        if stale:
+            self._conn().executemany("UPDATE vectors SET used_at = ? WHERE key = ?", stale)
+        return found
+
+    def put_many(self, items):
+        items = [(key, np.asarray(vector, dtype=np.float32).tobytes(), time.time()) for key, vector in items]
+        self._conn().executemany("INSERT OR REPLACE INTO vectors (key, vector, used_at) VALUES (?, ?, ?)", items)
+        with self._lock:
+            self._unpruned += len(items)
+            if self._unpruned < self.PRUNE_EVERY:
+                return
+            self._unpruned = 0
+        self.prune()
+
+    def prune(self):
+        """Drops the least recently used vectors beyond max_rows; returns how many were dropped."""
+        if self.max_rows <= 0:
+            return 0
+        conn = self._conn()
+        excess = conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0] - self.max_rows
+        if excess <= 0:
+            return 0
+        conn.execute(
+            "DELETE FROM vectors WHERE key IN (SELECT key FROM vectors ORDER BY used_at LIMIT ?)", (excess,)
+        )
+        return excess
+
+
+class _Request:
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+
+
+class EmbeddingService(Embeddings):
+    """
+    Embeddings backed by a SentenceTransformer with a persistent content-hash cache.
+    Query embeddings from concurrent callers are micro-batched on one inference thread
+    (up to batch_size texts or max_wait_ms). Bulk document batches are embedded in batch_size
+    chunks, on a process pool when `workers` > 0. Only cache misses are embedded.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND, batch_size=EMBEDDING_BATCH_SIZE,
+                 max_wait_ms=EMBEDDING_MAX_WAIT_MS, cache=EMBEDDING_CACHE_ENABLED, workers=EMBEDDING_WORKERS):
+        self.model_name = model_name
+        self.backend = backend
+        # ONNX files (e.g. quantized ones) produce different vectors, so the file is part of the key
+        self._variant = f"onnx:{EMBEDDING_ONNX_FILE}" if backend == "onnx" else backend
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self.cache = VectorCache() if cache else None
+        self.model = None
+        self.stats = {"requests": 0, "texts": 0, "cache_hits": 0, "embedded": 0, "batches": 0, "embed_seconds": 0.0}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._pool = None
+
+    def load(self):
+        """Loads the model if it isn't loaded yet. Safe to call before forking workers."""
+        with self._model_lock:
+            if self.model is None:
+                self.model = load_model(self.model_name, self.backend)
+        return self.model
+
+    def _key(self, text):
+        return hashlib.sha1(f"{self.model_name}\0{self._variant}\0{text}".encode("utf-8")).hexdigest()
+
+    def _encode(self, texts):
+        started = time.perf_counter()
+        vectors = self.load().encode(texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False)
+        self._record_batch(len(texts), time.perf_counter() - started)
+        return vectors
+
+    def _record_batch(self, n, seconds):
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["embedded"] += n
+            self.stats["embed_seconds"] += seconds
+
+    # --- bulk path -----------------------------------------------------------
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                threads = max(1, (os.cpu_count() or 1) // self.workers)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.model_name, self.backend, threads)
+                )
+        return self._pool
+
+    def _encode_bulk(self, texts):
+        if self.workers <= 0 or len(texts) < EMBEDDING_POOL_MIN_TEXTS:
+            return self._encode(texts)
+        started = time.perf_counter()
+        size = -(-len(texts) // self.workers)
+        parts = [texts[i:i + size] for i in range(0, len(texts), size)]
+        vectors = np.vstack(list(self._get_pool().map(_embed_in_worker, parts, [self.batch_size] * len(parts))))
+        self._record_batch(len(texts), time.perf_counter() - started)
+        return vectors
+
+    def _embed(self, texts, encode):
+        """Serves cached vectors and embeds the rest (each distinct text once) with `encode`."""
+        keys = [self._key(t) for t in texts]
+        found = self.cache.get_many(list(set(keys))) if self.cache else {}
+        hits = sum(1 for k in keys if k in found)
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+        if missing:
+            text_of = dict(zip(keys, texts))
+            vectors = encode([text_of[k] for k in missing])
+            fresh = list(zip(missing, vectors))
+            found.update(fresh)
+            if self.cache:
+                self.cache.put_many(fresh)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["texts"] += len(texts)
+            self.stats["cache_hits"] += hits
+        return [found[k].tolist() for k in keys]
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        return self._embed(texts, self._encode_bulk) if texts else []
+
+    # --- query path ----------------------------------------------------------
+
+    def _ensure_thread(self):
+        with self._lock:
+            # A thread inherited across fork is gone, so start one per process
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name="meka-embedder", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _batched(self, texts):
+        self._ensure_thread()
+        request = _Request(texts)
+        self._queue.put(request)
+        return list(request.future.result())
+
+    def embed_queries(self, texts):
+        """Embeds a few short texts through the shared micro-batcher."""
+        texts = list(texts)
+        return self._embed(texts, self._batched) if texts else []
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = self._encode(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            offset = 0
+            for request in batch:
+                n = len(request.texts)
+                request.future.set_result(vectors[offset:offset + n])
+                offset += n
+
+    def describe(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["cache_hits"] / stats["texts"], 4) if stats["texts"] else 0.0
+        stats["texts_per_s"] = round(stats["embedded"] / stats["embed_seconds"], 1) if stats["embed_seconds"] else 0.0
+        stats["embed_seconds"] = round(stats["embed_seconds"], 3)
+        return stats
@@ -0,0 +1,61 @@
+import json
+
+# Metadata filters accepted with a query:
+#   sources: list of source paths (or URLs), types: list of file types ("txt", "csv", "web", ...),
+#   modified_after / modified_before: unix timestamps compared with the file's modification time
+FILTER_FIELDS = ("sources", "types", "modified_after", "modified_before")
+
+
+def normalize_filters(filters):
+    """Drops empty fields; returns None when nothing is filtered."""
+    if not filters:
+        return None
+    if hasattr(filters, "model_dump"):
+        filters = filters.model_dump()
+    clean = {}
+    for name in FILTER_FIELDS:
+        value = filters.get(name)
+        if value is None or value == [] or value == "":
+            continue
+        if name in ("sources", "types"):
+            values = [value] if isinstance(value, str) else list(value)
+            clean[name] = sorted({v.lower().lstrip(".") for v in values} if name == "types" else set(values))
+        else:
+            clean[name] = float(value)
+    return clean or None
+
+
+def filter_key(filters):
+    return json.dumps(filters, sort_keys=True) if filters else ""
+
+
+def chroma_where(filters):
+    """The Chroma `where` clause for normalized filters, or None."""
+    if not filters:
+        return None
+    clauses = []
+    if "sources" in filters:
+        clauses.append({"source": {"$in": filters["sources"]}})
+    if "types" in filters:
+        clauses.append({"type": {"$in": filters["types"]}})
+    if "modified_after" in filters:
+        clauses.append({"modified": {"$gte": filters["modified_after"]}})
+    if "modified_before" in filters:
+        clauses.append({"modified": {"$lte": filters["modified_before"]}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def matches_filters(metadata: dict, filters):
+    """The same predicate as chroma_where, for documents that don't come from the store."""
+    if not filters:
+        return True
+    if "sources" in filters and metadata.get("source") not in filters["sources"]:
+        return False
+    if "types" in filters and metadata.get("type") not in filters["types"]:
+        return False
+    modified = metadata.get("modified")
+    if "modified_after" in filters and (modified is None or modified < filters["modified_after"]):
+        return False
+    if "modified_before" in filters and (modified is None or modified > filters["modified_before"]):
+        return False
+    return True
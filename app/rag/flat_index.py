@@ -0,0 +1,179 @@
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+
+FLAT_INDEX_PATH = os.getenv("VECTOR_FLAT_PATH", "flat_index")
+# int8 scans several times faster; float16 stays closer to exact recall (see the benchmark's ann report)
+FLAT_INDEX_DTYPE = os.getenv("VECTOR_FLAT_DTYPE", "int8")  # "int8" or "float16"
+# Stored rows converted to float32 and scored per step; small enough for the buffer to stay in cache
+FLAT_INDEX_BLOCK = int(os.getenv("VECTOR_FLAT_BLOCK", "2048"))
+# Row masks kept per index for distinct metadata filters, the same bound as the filtered-ID cache
+FLAT_INDEX_MASK_CACHE = int(os.getenv("VECTOR_FILTER_CACHE_SIZE", "64"))
+
+
+class FlatIndex:
+    """
+    Exact inner-product search over L2-normalised vectors kept in a memory-mapped .npy file,
+    as float16 or as int8 with one scale per row. Every worker process maps the same pages,
+    so the vectors cost page cache rather than per-process heap.
+    Filterable metadata (source, type, modified) sits in small arrays next to the vectors,
+    so metadata filters become a row mask applied before the top-k selection.
+    """
+
+    def __init__(self, path, ids, vectors, scales, sources, source_codes, types, type_codes, modified, version=None):
+        self.path = path
+        self.ids = ids
+        self.vectors = vectors
+        self.scales = scales
+        self.sources = sources
+        self.source_codes = source_codes
+        self.types = types
+        self.type_codes = type_codes
+        self.modified = modified
+        self.version = version
+        # Per index, so a reloaded index starts empty; LRU since filter keys come from requests
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dtype(self):
+        return str(self.vectors.dtype)
+
+    @classmethod
+    def build(cls, collections, path=FLAT_INDEX_PATH, dtype=FLAT_INDEX_DTYPE, version=None, batch_size=5000):
+        """
+        Copies the vectors of a Chroma collection (or of all shards, given a list of them)
+        into a new flat index at `path` and opens it.
+        """
+        if not isinstance(collections, (list, tuple)):
+            collections = [collections]
+        total = sum(collection.count() for collection in collections)
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        ids, sources, types, modified = [], [], [], []
+        vectors = scales = None
+        for collection in collections:
+            offset = 0
+            while len(ids) < total:
+                batch = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    break
+                block = np.asarray(batch["embeddings"], dtype=np.float32)[:total - len(ids)]
+                if vectors is None:
+                    shape = (total, block.shape[1])
+                    vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"), mode="w+",
+                                                        dtype=np.int8 if dtype == "int8" else np.float16, shape=shape)
+                    scales = np.ones(total, dtype=np.float32)
+                norms = np.linalg.norm(block, axis=1, keepdims=True)
+                block = block / np.where(norms == 0, 1, norms)
+                rows = slice(len(ids), len(ids) + len(block))
+                if dtype == "int8":
+                    peak = np.abs(block).max(axis=1)
+                    scale = np.where(peak == 0, 1, peak) / 127
+                    vectors[rows] = np.round(block / scale[:, None]).astype(np.int8)
+                    scales[rows] = scale
+                else:
+                    vectors[rows] = block.astype(np.float16)
+                for meta in batch["metadatas"][:len(block)]:
+                    meta = meta or {}
+                    sources.append(meta.get("source", ""))
+                    types.append(meta.get("type", ""))
+                    modified.append(meta.get("modified", np.nan))
+                ids.extend(batch["ids"][:len(block)])
+                offset += len(batch["ids"])
+
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"), mode="w+",
+                                                dtype=np.float16, shape=(0, 0))
+            scales = np.ones(0, dtype=np.float32)
+        # If the collections shrank while they were copied, only the filled rows are used
+        n = len(ids)
+        vectors.flush()
+        del vectors
+
+        source_names, source_codes = np.unique(np.asarray(sources, dtype=object).astype(str), return_inverse=True)
+        type_names, type_codes = np.unique(np.asarray(types, dtype=object).astype(str), return_inverse=True)
+        np.save(os.path.join(tmp_path, "scales.npy"), scales[:n])
+        np.save(os.path.join(tmp_path, "source_codes.npy"), source_codes.astype(np.int32))
+        np.save(os.path.join(tmp_path, "type_codes.npy"), type_codes.astype(np.int32))
+        np.save(os.path.join(tmp_path, "modified.npy"), np.asarray(modified, dtype=np.float64))
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"version": version, "rows": n, "ids": ids,
+                       "sources": source_names.tolist(), "types": type_names.tolist()}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path=FLAT_INDEX_PATH):
+        """Opens a saved index (vectors memory-mapped), or returns None if it is missing or inconsistent."""
+        try:
+            with open(os.path.join(path, "meta.json"), "r") as f:
+                meta = json.load(f)
+            vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            arrays = {name: np.load(os.path.join(path, f"{name}.npy"))
+                      for name in ("scales", "source_codes", "type_codes", "modified")}
+        except Exception:
+            return None
+        n = meta["rows"]
+        if vectors.shape[0] < n or any(len(a) != n for a in arrays.values()):
+            return None
+        return cls(path, meta["ids"], vectors[:n], arrays["scales"], meta["sources"], arrays["source_codes"],
+                   meta["types"], arrays["type_codes"], arrays["modified"], meta["version"])
+
+    def mask(self, filters, key):
+        """Boolean row mask for normalized filters (see app.rag.filters), cached per filter (LRU)."""
+        with self._lock:
+            if key in self._masks:
+                self._masks.move_to_end(key)
+                return self._masks[key]
+        mask = np.ones(len(self.ids), dtype=bool)
+        if "sources" in filters:
+            wanted = [i for i, name in enumerate(self.sources) if name in filters["sources"]]
+            mask &= np.isin(self.source_codes, wanted)
+        if "types" in filters:
+            wanted = [i for i, name in enumerate(self.types) if name in filters["types"]]
+            mask &= np.isin(self.type_codes, wanted)
+        if "modified_after" in filters:
+            mask &= self.modified >= filters["modified_after"]
+        if "modified_before" in filters:
+            mask &= self.modified <= filters["modified_before"]
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > FLAT_INDEX_MASK_CACHE:
+                self._masks.popitem(last=False)
+        return mask
+
+    def search(self, vector, k=5, mask=None):
+        """Returns up to k (chunk_id, cosine similarity) pairs, best first."""
+        n = len(self.ids)
+        if not n:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+        scores = np.empty(n, dtype=np.float32)
+        buffer = np.empty((min(FLAT_INDEX_BLOCK, n), self.vectors.shape[1]), dtype=np.float32)
+        for start in range(0, n, FLAT_INDEX_BLOCK):
+            block = self.vectors[start:start + FLAT_INDEX_BLOCK]
+            rows = buffer[:len(block)]
+            np.copyto(rows, block)
+            scores[start:start + len(block)] = rows @ query
+        if self.vectors.dtype == np.int8:
+            scores *= self.scales
+        if mask is not None:
+            scores[~mask] = -np.inf
+        k = min(k, int(mask.sum()) if mask is not None else n)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
@@ -0,0 +1,53 @@
+import os
+import re
+import threading
+import numpy as np
+
+NLI_MODEL = os.getenv("VALIDATOR_NLI_MODEL", "cross-encoder/nli-deberta-v3-xsmall")
+# Mean per-sentence entailment probability needed to call an answer grounded
+NLI_THRESHOLD = float(os.getenv("VALIDATOR_NLI_THRESHOLD", "0.5"))
+NLI_MAX_SENTENCES = int(os.getenv("VALIDATOR_NLI_MAX_SENTENCES", "12"))
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+_model = None
+_model_lock = threading.Lock()
+
+def _get_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            from sentence_transformers import CrossEncoder
+            print("Loading NLI groundedness model...")
+            _model = CrossEncoder(NLI_MODEL)
+    return _model
+
+def _entailment_index(model):
+    labels = getattr(model.config, "id2label", None) or {}
+    for idx, label in labels.items():
+        if str(label).lower().startswith("entail"):
+            return int(idx)
+    return 1
+
+def nli_groundedness(answer: str, contexts: list):
+    """
+    Scores every answer sentence against every context chunk with a local NLI cross-encoder.
+    A sentence's support is its best entailment probability over the chunks.
+    Returns (status, reason) in the same shape as the LLM validator.
+    """
+    sentences = [s.strip() for s in SENTENCE_RE.split(answer) if len(s.strip()) > 3][:NLI_MAX_SENTENCES]
+    if not sentences or not contexts:
+        return "UNKNOWN", "Nothing to verify"
+
+    model = _get_model()
+    pairs = [(context, sentence) for sentence in sentences for context in contexts]
+    logits = np.asarray(model.predict(pairs, show_progress_bar=False), dtype=np.float32)
+    probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probs /= probs.sum(axis=1, keepdims=True)
+    entailment = probs[:, _entailment_index(model)].reshape(len(sentences), len(contexts))
+
+    support = entailment.max(axis=1)
+    weakest = int(support.argmin())
+    status = "GROUNDED" if support.mean() >= NLI_THRESHOLD else "HALLUCINATED"
+    reason = f"mean entailment {support.mean():.2f}; weakest sentence ({support[weakest]:.2f}): {sentences[weakest][:80]}"
+    return status, reason
@@ -1,4 +1,7 @@
+import multiprocessing
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from langchain_community.document_loaders import (
     TextLoader, 
     PyPDFLoader, 
@@ -8,46 +11,105 @@ from langchain_community.document_loaders import (
 )
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-# Simple cache to avoid reloading from disk on every query
-_cached_docs = None
-
-def load_documents(data_path="data", force_reload=False):
-    """
-    Loads documents from the data directory supporting multiple formats.
-    """
-    global _cached_docs
-    if _cached_docs is not None and not force_reload:
-        return _cached_docs
-
-    docs = []
-    if not os.path.exists(data_path):
-        os.makedirs(data_path)
-        return docs
-
-    print(f"Loading documents from {data_path}...")
-    for file in os.listdir(data_path):
-        file_path = os.path.join(data_path, file)
-        try:
-            if file.endswith(".txt"):
-                loader = TextLoader(file_path, encoding="utf-8")
-                docs.extend(loader.load())
-            elif file.endswith(".pdf"):
-                loader = PyPDFLoader(file_path)
-                docs.extend(loader.load())
-            elif file.endswith(".docx"):
-                loader = Docx2txtLoader(file_path)
-                docs.extend(loader.load())
-            elif file.endswith(".csv"):
-                loader = CSVLoader(file_path)
-                docs.extend(loader.load())
-            elif file.endswith(".json"):
-                loader = JSONLoader(file_path, jq_schema='.[]', text_content=False)
-                docs.extend(loader.load())
-        except Exception as e:
-            print(f"Error loading {file}: {e}")
-
-    _cached_docs = docs
-    return docs
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx", ".csv", ".json")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(os.cpu_count() or 1, 8))))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+def discover_files(data_path="data"):
+    """
+    Yields the paths of all supported files under the data directory, recursing into subdirectories.
+    """
+    for root, dirs, files in os.walk(data_path):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(root, file)
+
+def list_source_files(data_path="data"):
+    return list(discover_files(data_path))
+
+def file_type_of(file_path):
+    """The filterable "type" metadata of a source file: its extension without the dot."""
+    return os.path.splitext(file_path)[1].lower().lstrip(".")
+
+def load_file(file_path):
+    """
+    Loads a single file into Documents based on its extension.
+    """
+    try:
+        if file_path.endswith(".txt"):
+            loader = TextLoader(file_path, encoding="utf-8")
+        elif file_path.endswith(".pdf"):
+            loader = PyPDFLoader(file_path)
+        elif file_path.endswith(".docx"):
+            loader = Docx2txtLoader(file_path)
+        elif file_path.endswith(".csv"):
+            loader = CSVLoader(file_path)
+        elif file_path.endswith(".json"):
+            loader = JSONLoader(file_path, jq_schema='.[]', text_content=False)
+        else:
+            return []
+        return loader.load()
+    except Exception as e:
+        print(f"Error loading {file_path}: {e}")
+        return []
+
+def load_and_split(file_path):
+    """
+    Parses and chunks one file. Runs inside ingestion worker processes.
+    """
+    return file_path, get_chunks(load_file(file_path))
+
+class IngestProgress:
+    """
+    Tracks files/sec and chunks/sec and prints a progress line at most every `interval` seconds.
+    """
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self.files = 0
+        self.chunks = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def update(self, files=0, chunks=0):
+        self.files += files
+        self.chunks += chunks
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            print(f"Ingest progress: {self.summary()}")
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (f"{self.files} files ({self.files / elapsed:.1f} files/s), "
+                f"{self.chunks} chunks ({self.chunks / elapsed:.1f} chunks/s) in {elapsed:.1f}s")
+
+def iter_file_chunks(file_paths, workers=INGEST_WORKERS):
+    """
+    Yields (file_path, chunks) for each file, parsing in a process pool.
+    At most 2 * workers files are in flight, so memory stays bounded however many files there are.
+    Results arrive in completion order.
+    """
+    file_paths = iter(file_paths)
+    if workers <= 1:
+        for file_path in file_paths:
+            yield load_and_split(file_path)
+        return
+
+    # spawn: forking a process that already holds model and DB threads is not safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        in_flight = set()
+        for file_path in file_paths:
+            in_flight.add(pool.submit(load_and_split, file_path))
+            if len(in_flight) >= 2 * workers:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
 
 def get_chunks(documents):
     """
@@ -58,4 +120,4 @@ def get_chunks(documents):
         chunk_overlap=100,
         add_start_index=True
     )
-    return text_splitter.split_documents(documents)
\ No newline at end of file
+    return text_splitter.split_documents(documents)
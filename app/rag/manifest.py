@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+
+class ManifestError(Exception):
+    pass
+
+def empty_manifest():
+    return {"version": 0, "files": {}}
+
+def load_manifest(manifest_path, strict=False):
+    """
+    Loads the ingestion manifest that tracks which files and chunks are in the vector store.
+    An unreadable manifest raises ManifestError when strict, and is read as an empty one otherwise.
+    """
+    if not os.path.exists(manifest_path):
+        return empty_manifest()
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        if strict:
+            raise ManifestError(f"Manifest {manifest_path} is unreadable: {e}") from e
+        print(f"WARNING: manifest {manifest_path} is unreadable ({e}); treating the store as unindexed "
+              f"until the next sync rebuilds it.")
+        return empty_manifest()
+    manifest.setdefault("version", 0)
+    manifest.setdefault("files", {})
+    return manifest
+
+def save_manifest(manifest_path, manifest):
+    """
+    Writes the manifest atomically so a crashed sync never leaves a half-written file.
+    """
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def assign_chunk_ids(source, chunks):
+    """
+    Gives every chunk a stable ID derived from its source and content.
+    Unchanged chunks keep their ID across edits elsewhere in the file, so they are never re-embedded.
+    """
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        content_hash = hash_text(chunk.page_content)
+        occurrence = seen.get(content_hash, 0)
+        seen[content_hash] = occurrence + 1
+        chunk_id = hashlib.sha1(f"{source}\x00{content_hash}\x00{occurrence}".encode("utf-8")).hexdigest()
+        chunk.metadata["chunk_id"] = chunk_id
+        chunk.metadata["content_hash"] = content_hash
+        ids.append(chunk_id)
+    return ids
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "torch")  # "torch" or "onnx"
+RERANKER_ONNX_FILE = os.getenv("RERANKER_ONNX_FILE", "onnx/model_qint8_avx512.onnx")
+RERANKER_MAX_BATCH = int(os.getenv("RERANKER_MAX_BATCH", "64"))
+RERANKER_MAX_WAIT_MS = float(os.getenv("RERANKER_MAX_WAIT_MS", "5"))
+RERANKER_MAX_LENGTH = int(os.getenv("RERANKER_MAX_LENGTH", "512"))
+RERANKER_CACHE_SIZE = int(os.getenv("RERANKER_CACHE_SIZE", "20000"))
+
+class _Request:
+    def __init__(self, pairs):
+        self.pairs = pairs
+        self.future = Future()
+
+class RerankService:
+    """
+    Cross-encoder scoring on a dedicated inference thread.
+    Pairs from concurrent callers are micro-batched (up to max_batch pairs or max_wait_ms),
+    and scores are kept in an LRU cache keyed by (query hash, chunk id).
+    """
+
+    def __init__(self, model_name=RERANKER_MODEL, backend=RERANKER_BACKEND, max_batch=RERANKER_MAX_BATCH,
+                 max_wait_ms=RERANKER_MAX_WAIT_MS, max_length=RERANKER_MAX_LENGTH, cache_size=RERANKER_CACHE_SIZE):
+        self.model_name = model_name
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.model = None
+        self.stats = {"requests": 0, "pairs_scored": 0, "batches": 0, "cache_hits": 0, "cache_misses": 0}
+        self._queue = queue.Queue()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+
+    def _load_model(self):
+        from sentence_transformers import CrossEncoder
+        print(f"Loading CrossEncoder model ({self.backend})...")
+        # The tokenizer truncates each pair to max_length tokens
+        kwargs = {"max_length": self.max_length}
+        if self.backend == "onnx":
+            kwargs["backend"] = "onnx"
+            kwargs["model_kwargs"] = {"file_name": RERANKER_ONNX_FILE}
+        return CrossEncoder(self.model_name, **kwargs)
+
+    def load(self):
+        """Loads the CrossEncoder if it isn't loaded yet. Safe to call before forking workers."""
+        with self._model_lock:
+            if self.model is None:
+                self.model = self._load_model()
+        return self.model
+
+    def _ensure_thread(self):
+        with self._lock:
+            # A thread inherited across fork is gone, so start one per process
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name="meka-reranker", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    @staticmethod
+    def _doc_key(doc):
+        return doc.metadata.get("chunk_id") or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+    def score(self, query, docs):
+        """
+        Returns (scores, cache_hits) for the docs, in input order. Blocks until the batch is scored.
+        """
+        query_hash = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        keys = [(query_hash, self._doc_key(doc)) for doc in docs]
+        scores = [None] * len(docs)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+        missing = [i for i, s in enumerate(scores) if s is None]
+        hits = len(docs) - len(missing)
+
+        if missing:
+            self._ensure_thread()
+            request = _Request([[query, docs[i].page_content] for i in missing])
+            self._queue.put(request)
+            fresh = request.future.result()
+            with self._lock:
+                for i, value in zip(missing, fresh):
+                    scores[i] = value
+                    self._cache[keys[i]] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["cache_hits"] += hits
+            self.stats["cache_misses"] += len(missing)
+        return scores, hits
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].pairs)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.pairs)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            pairs = [pair for request in batch for pair in request.pairs]
+            try:
+                raw = self.load().predict(pairs, batch_size=self.max_batch, show_progress_bar=False)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["pairs_scored"] += len(pairs)
+            offset = 0
+            for request in batch:
+                n = len(request.pairs)
+                request.future.set_result([float(s) for s in raw[offset:offset + n]])
+                offset += n
+
+_rerank_service = None
+_service_lock = threading.Lock()
+
+def get_rerank_service():
+    global _rerank_service
+    with _service_lock:
+        if _rerank_service is None:
+            _rerank_service = RerankService()
+    return _rerank_service
@@ -1,78 +1,303 @@
-from langchain_community.retrievers import BM25Retriever
-from langchain_tavily import TavilySearch
 from langchain_core.documents import Document
-from app.rag.vector_db import get_vector_store
-from app.rag.ingest import load_documents
+from app.rag.vector_db import (get_tenant, get_embeddings, get_bm25_index, get_documents_by_ids,
+                               get_flat_index, get_filtered_ids, VECTOR_BACKEND)
+from app.rag.filters import normalize_filters, filter_key, chroma_where, matches_filters
+from app.rag.structured_store import structured_lookup
+from app.rag.web_search import get_web_search
+from app.utils.metrics import RETRIEVAL_SECONDS
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import hashlib
 import os
+import time
 
-# Global BM25 retriever to prevent recalculating index on every query
-_cached_bm25 = None
+def get_bm25_retriever(tenant: str = None):
+    return get_bm25_index(tenant)
 
-def get_bm25_retriever():
-    global _cached_bm25
-    if _cached_bm25 is None:
-        documents = load_documents()
-        if documents:
-            print("Initializing BM25 Retriever...")
-            _cached_bm25 = BM25Retriever.from_documents(documents)
-            _cached_bm25.k = 5
-    return _cached_bm25
+def bm25_search_docs(query: str, k: int = 5, filters: dict = None, tenant: str = None):
+    """
+    Keyword search over the tenant's chunk-level BM25 index, resolved to the stored chunks.
+    Filters restrict the ranking to the chunks whose metadata matches.
+    """
+    bm25 = get_bm25_retriever(tenant)
+    if filters:
+        key = filter_key(filters)
+        allowed = get_filtered_ids(chroma_where(filters), key, tenant=tenant)
+        hits = bm25.search(query, k=k, allowed=allowed, allowed_key=key)
+    else:
+        hits = bm25.search(query, k=k)
+    scores = dict(hits)
+    docs = get_documents_by_ids([cid for cid, _ in hits], tenant=tenant)
+    for d in docs:
+        d.metadata["bm25_score"] = scores[d.metadata.get("chunk_id")]
+    return docs
 
-def web_search_docs(query: str):
+def web_search_docs(query: str, k: int = 3, filters: dict = None):
     """
-    Performs a web search using Tavily and returns results as LangChain Documents.
+    Web results as LangChain Documents, from the web search layer's cache, stored web chunks
+    or the configured provider (WEB_SEARCH_PROVIDER). Filters are applied to the results.
     """
-    if not os.getenv("TAVILY_API_KEY"):
+    if filters and "web" not in filters.get("types", ["web"]):
         return []
+    docs = get_web_search().search(query, k)
+    return [d for d in docs if matches_filters(d.metadata, filters)]
 
-    try:
-        search = TavilySearch(max_results=3)
-        response = search.invoke(query)
-        
-        # Handle both dict with 'results' and direct list response
-        if isinstance(response, dict):
-            results_list = response.get("results", [])
-        elif isinstance(response, list):
-            results_list = response
+def vector_search_docs(query: str, k: int = 5, embedding=None, filters: dict = None, tenant: str = None):
+    """
+    Semantic search keeping the relevance score in metadata, over the tenant's Chroma HNSW shards
+    (searched in parallel and merged by distance) or, with VECTOR_BACKEND=flat, its memory-mapped
+    flat index. Filters are pushed down into the search. A precomputed query embedding skips the
+    embedding step.
+    """
+    if embedding is None:
+        embedding = get_embeddings().embed_query(query)
+    if VECTOR_BACKEND == "flat":
+        index = get_flat_index(tenant)
+        mask = index.mask(filters, filter_key(filters)) if filters else None
+        hits = index.search(embedding, k=k, mask=mask)
+        scores = dict(hits)
+        docs = get_documents_by_ids([cid for cid, _ in hits], tenant=tenant)
+        for d in docs:
+            d.metadata["vector_score"] = scores[d.metadata.get("chunk_id")]
+        return docs
+
+    store = get_tenant(tenant)
+    relevance = store.relevance_fn()
+    docs = []
+    for doc, distance in store.vector_search(embedding, k=k, where=chroma_where(filters)):
+        doc.metadata["vector_score"] = float(relevance(distance))
+        docs.append(doc)
+    return docs
+
+# Each source runs concurrently; a source that misses its timeout contributes nothing to the fusion
+RETRIEVAL_SOURCES = {
+    "vector": {
+        "search": vector_search_docs,
+        "score_key": "vector_score",
+        "k": int(os.getenv("RETRIEVER_VECTOR_K", "5")),
+        "weight": float(os.getenv("RETRIEVER_VECTOR_WEIGHT", "1.0")),
+        "timeout": float(os.getenv("RETRIEVER_VECTOR_TIMEOUT", "5")),
+    },
+    "bm25": {
+        "search": bm25_search_docs,
+        "score_key": "bm25_score",
+        "k": int(os.getenv("RETRIEVER_BM25_K", "5")),
+        "weight": float(os.getenv("RETRIEVER_BM25_WEIGHT", "1.0")),
+        "timeout": float(os.getenv("RETRIEVER_BM25_TIMEOUT", "5")),
+    },
+    "web": {
+        "search": web_search_docs,
+        "score_key": "web_score",
+        "k": int(os.getenv("RETRIEVER_WEB_K", "3")),
+        "weight": float(os.getenv("RETRIEVER_WEB_WEIGHT", "0.8")),
+        "timeout": float(os.getenv("RETRIEVER_WEB_TIMEOUT", "8")),
+    },
+}
+FUSION_METHOD = os.getenv("RETRIEVER_FUSION", "rrf")  # "rrf" or "weighted"
+RRF_K = int(os.getenv("RETRIEVER_RRF_K", "60"))
+# Upper bound on fused candidates handed to the reranker, however many sub-queries ran
+MAX_CANDIDATES = int(os.getenv("RETRIEVER_MAX_CANDIDATES", "20"))
+
+# Dedicated pool so blocking source calls never run on (or wait for) an event loop's default executor
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("RETRIEVER_THREADS", "8")), thread_name_prefix="meka-retrieval")
+
+def dedup_key(doc: Document):
+    """
+    Chunk ID when the chunk comes from the store, otherwise a hash of the normalized text,
+    which also collapses copies that differ only in case or whitespace.
+    """
+    chunk_id = doc.metadata.get("chunk_id")
+    if chunk_id:
+        return chunk_id
+    normalized = " ".join(doc.page_content.lower().split())
+    return "text:" + hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+def fuse_results(results: list, method: str = FUSION_METHOD):
+    """
+    Merges ranked lists into one list, best first. `results` holds (source_name, ranked_docs)
+    pairs; a source may contribute one list per query.
+    rrf: sum of weight / (RRF_K + rank). weighted: sum of weight * min-max normalized source score.
+    """
+    fused, docs = {}, {}
+    for name, ranked in results:
+        config = RETRIEVAL_SOURCES[name]
+        if method == "weighted":
+            raw = [d.metadata.get(config["score_key"]) for d in ranked]
+            if any(r is None for r in raw):
+                raw = [1.0 / (rank + 1) for rank in range(len(ranked))]
+            low, high = min(raw, default=0.0), max(raw, default=0.0)
+            contributions = [(r - low) / (high - low) if high > low else 1.0 for r in raw]
         else:
-            return []
+            contributions = [1.0 / (RRF_K + rank + 1) for rank in range(len(ranked))]
 
-        docs = []
-        for res in results_list:
-            content = res.get("content", "")
-            url = res.get("url", "unknown")
-            docs.append(Document(
-                page_content=content,
-                metadata={"source": url, "type": "web"}
-            ))
-        return docs
+        for doc, contribution in zip(ranked, contributions):
+            key = dedup_key(doc)
+            if key not in docs:
+                docs[key] = doc
+                doc.metadata["retrieval_sources"] = []
+            else:
+                # Keep per-source scores from every copy of the chunk
+                for k, v in doc.metadata.items():
+                    docs[key].metadata.setdefault(k, v)
+            if name not in docs[key].metadata["retrieval_sources"]:
+                docs[key].metadata["retrieval_sources"].append(name)
+            fused[key] = fused.get(key, 0.0) + config["weight"] * contribution
+
+    ordered = sorted(fused, key=fused.get, reverse=True)
+    for key in ordered:
+        docs[key].metadata["fusion_score"] = round(fused[key], 6)
+    return [docs[key] for key in ordered]
+
+async def _run_source(name: str, query: str, search=None):
+    config = RETRIEVAL_SOURCES[name]
+    search = search or config["search"]
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    status, docs = "ok", []
+    try:
+        docs = await asyncio.wait_for(
+            loop.run_in_executor(_executor, search, query, config["k"]),
+            timeout=config["timeout"]
+        )
+    except asyncio.TimeoutError:
+        status = "timeout"
     except Exception as e:
-        print(f"Web search error: {e}")
-        return []
+        print(f"Retrieval source '{name}' failed: {e}")
+        status = "error"
+    elapsed = time.perf_counter() - start
+    RETRIEVAL_SECONDS.observe(elapsed, source=name, status=status)
+    return name, docs, status, round(elapsed * 1000, 1)
+
+async def _embed_queries(queries: list):
+    """
+    Embeds all queries in one request to the embedding service, which also batches them with
+    other in-flight queries; returns None if embedding fails or times out.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(_executor, get_embeddings().embed_queries, queries),
+            timeout=RETRIEVAL_SOURCES["vector"]["timeout"]
+        )
+    except Exception as e:
+        print(f"Query embedding failed: {e!r}")
+        return None
+
+async def _vector_searches(queries: list, filters: dict = None, tenant: str = None):
+    embeddings = await _embed_queries(queries)
+    if embeddings is None:
+        return [("vector", [], "error", 0.0)]
+    return await asyncio.gather(*[
+        _run_source("vector", q, search=partial(vector_search_docs, embedding=e, filters=filters, tenant=tenant))
+        for q, e in zip(queries, embeddings)
+    ])
+
+def _source_stats(name: str, outcomes: list):
+    statuses = [status for _, _, status, _ in outcomes]
+    return {
+        "status": "ok" if "ok" in statuses else statuses[0],
+        "hits": sum(len(docs) for _, docs, _, _ in outcomes),
+        "queries": len(outcomes),
+        "k": RETRIEVAL_SOURCES[name]["k"],
+        "weight": RETRIEVAL_SOURCES[name]["weight"],
+        "latency_ms": max(latency for _, _, _, latency in outcomes),
+    }
+
+def structured_retrieve(query: str, filters: dict = None, tenant: str = None):
+    """
+    Answers key and column lookups from the structured (CSV/JSON) store. Returns (docs, stats),
+    or None when the query isn't a lookup there and text retrieval is needed.
+    """
+    start = time.perf_counter()
+    try:
+        docs = [d for d in structured_lookup(query, tenant) if matches_filters(d.metadata, filters)]
+    except Exception as e:
+        print(f"Structured lookup failed: {e}")
+        docs = []
+    elapsed = time.perf_counter() - start
+    RETRIEVAL_SECONDS.observe(elapsed, source="structured", status="ok" if docs else "miss")
+    if not docs:
+        return None
+    latency_ms = round(elapsed * 1000, 3)
+    stats = {
+        "fusion": "structured",
+        "queries": [query],
+        "filters": filters,
+        "sources": {"structured": {"status": "ok", "hits": len(docs), "queries": 1, "k": len(docs),
+                                   "weight": 1.0, "latency_ms": latency_ms}},
+        "candidates": len(docs),
+        "latency_ms": latency_ms,
+    }
+    return docs, stats
+
+async def aretrieve_docs(query: str, use_web: bool = False, sub_queries: list = None,
+                         max_candidates: int = MAX_CANDIDATES, filters: dict = None, tenant: str = None):
+    """
+    Fans the query and its sub-queries out to every enabled source in parallel and fuses the results.
+    Query embeddings are computed in one batch. Web search only runs for the original query.
+    Exact lookups against structured sources are answered from the structured store instead,
+    unless web results were asked for. Metadata filters (source/type/modified) are applied
+    inside every source's search; local sources only search the given tenant's corpus.
+    Returns (docs, stats) where stats holds per-source latency and hit counts.
+    """
+    filters = normalize_filters(filters)
+    if not use_web:
+        structured = structured_retrieve(query, filters, tenant)
+        if structured is not None:
+            return structured
+
+    queries = list(dict.fromkeys([query] + [q for q in (sub_queries or []) if q and q.strip()]))
+    start = time.perf_counter()
 
-def retrieve_docs(query: str, use_web: bool = False):
-    """
-    Hybrid retriever that combines Vector search and Keyword (BM25) search.
-    """
-    # 1. Vector Search
-    vector_store = get_vector_store()
-    vector_retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-    local_docs = vector_retriever.invoke(query)
-    
-    # 2. BM25 Keyword Search
-    bm25 = get_bm25_retriever()
-    if bm25:
-        bm25_docs = bm25.invoke(query)
-        # Manual merge to avoid 'langchain_classic' extension issues
-        seen_content = {d.page_content for d in local_docs}
-        for d in bm25_docs:
-            if d.page_content not in seen_content:
-                local_docs.append(d)
-                seen_content.add(d.page_content)
-
-    # 3. Supplemental Web Search
+    bm25_search = partial(bm25_search_docs, filters=filters, tenant=tenant)
+    groups = [_vector_searches(queries, filters, tenant), asyncio.gather(*[_run_source("bm25", q, search=bm25_search) for q in queries])]
     if use_web:
-        web_docs = web_search_docs(query)
-        local_docs.extend(web_docs)
-        
-    return local_docs
\ No newline at end of file
+        groups.append(asyncio.gather(_run_source("web", query, search=partial(web_search_docs, filters=filters))))
+    grouped = await asyncio.gather(*groups)
+
+    outcomes = [outcome for group in grouped for outcome in group]
+    docs = fuse_results([(name, found) for name, found, _, _ in outcomes])
+    stats = {
+        "fusion": FUSION_METHOD,
+        "queries": queries,
+        "filters": filters,
+        "tenant": tenant,
+        "shards": len(get_tenant(tenant).stores()),
+        "sources": {group[0][0]: _source_stats(group[0][0], group) for group in grouped},
+        "candidates": len(docs),
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    return docs[:max_candidates], stats
+
+def run_async(coro):
+    """
+    Runs a coroutine to completion from synchronous code (graph nodes run in worker threads).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Already inside an event loop on this thread: use a helper thread instead of nesting loops
+    with ThreadPoolExecutor(max_workers=1) as helper:
+        return helper.submit(asyncio.run, coro).result()
+
+def retrieve_docs_with_stats(query: str, use_web: bool = False, sub_queries: list = None, filters: dict = None,
+                             tenant: str = None):
+    return run_async(aretrieve_docs(query, use_web, sub_queries, filters=filters, tenant=tenant))
+
+def web_retrieve_with_stats(query: str, filters: dict = None):
+    """
+    Runs only the web source, with its configured k and timeout.
+    """
+    search = partial(web_search_docs, filters=normalize_filters(filters))
+    _, docs, status, latency_ms = run_async(_run_source("web", query, search=search))
+    return docs, {"status": status, "hits": len(docs), "latency_ms": latency_ms}
+
+def retrieve_docs(query: str, use_web: bool = False, sub_queries: list = None, filters: dict = None,
+                  tenant: str = None):
+    """
+    Hybrid retriever that combines Vector search, Keyword (BM25) search and optional Web search.
+    """
+    docs, _ = retrieve_docs_with_stats(query, use_web, sub_queries, filters, tenant)
+    return docs
@@ -0,0 +1,251 @@
+import csv
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from langchain_core.documents import Document
+from app.rag.ingest import file_type_of
+
+STRUCTURED_ENABLED = os.getenv("STRUCTURED_ENABLED", "true").lower() == "true"
+STRUCTURED_EXTENSIONS = (".csv", ".json")
+# Column used as the lookup key; by default the first column whose values are unique
+STRUCTURED_KEY_COLUMN = os.getenv("STRUCTURED_KEY_COLUMN", "")
+# More matching rows than this is a broad question rather than a lookup: use text retrieval
+STRUCTURED_MAX_ROWS = int(os.getenv("STRUCTURED_MAX_ROWS", "5"))
+# Key values shorter than this are too ambiguous to match inside free text
+STRUCTURED_MIN_KEY_CHARS = int(os.getenv("STRUCTURED_MIN_KEY_CHARS", "4"))
+# A query naming a key but no column is only a lookup when it has at most this many words
+STRUCTURED_KEY_QUERY_MAX_WORDS = int(os.getenv("STRUCTURED_KEY_QUERY_MAX_WORDS", "8"))
+
+TOKEN_RE = re.compile(r"\w+")
+# "<column> is <value>", "<column> = <value>", "<column>: <value>", "where <column> equals '<value>'"
+FILTER_RE = re.compile(r"\b(\w+)\s*(?:=|:|\bis\b|\bequals\b)\s*[\"']?([^\"'?,;]+?)[\"']?\s*(?:[?,;]|\band\b|$)")
+# Questions that need explanation or comparison across documents, not a row's values
+ANALYTICAL_RE = re.compile(
+    r"\b(why|how|compare|comparison|versus|vs|difference|differences|between|explain|describe|detail|details|"
+    r"summarize|summarise|analyze|analyse|pros|cons|implications?)\b"
+)
+
+
+def _tokens(text):
+    return tuple(TOKEN_RE.findall(str(text).lower()))
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def read_rows(file_path):
+    """
+    Reads a CSV file (header row) or a JSON file (a list of objects, or one object) into
+    (columns, rows) with every cell as text. Returns None for files that aren't tabular.
+    """
+    try:
+        if file_path.endswith(".csv"):
+            with open(file_path, "r", encoding="utf-8", newline="") as f:
+                reader = csv.DictReader(f)
+                rows = [{k: _cell(v) for k, v in row.items() if k is not None} for row in reader]
+                columns = list(reader.fieldnames or [])
+        else:
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                data = [data]
+            if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+                return None
+            columns = list(dict.fromkeys(k for item in data for k in item))
+            rows = [{k: _cell(item.get(k)) for k in columns} for item in data]
+    except Exception as e:
+        print(f"Error reading structured file {file_path}: {e}")
+        return None
+    if not columns or not rows:
+        return None
+    return columns, rows
+
+
+class StructuredStore:
+    """
+    CSV/JSON sources loaded into an in-memory SQLite database, one table per file with a
+    NOCASE index on every column. A hash index over each table's tokenized key column finds
+    the rows a query names in microseconds, and "<column> is <value>" filters use the column
+    indexes. Matching rows come back as compact "column: value" Documents.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.tables = {}
+        self.columns = {}
+        self.rows = 0
+        self.stats = {"lookups": 0, "hits": 0}
+        self._keys = {}
+        self._key_lengths = set()
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, files, version=None):
+        store = cls(version)
+        for file_path in files:
+            if file_path.endswith(STRUCTURED_EXTENSIONS):
+                loaded = read_rows(file_path)
+                if loaded:
+                    store.add_table(file_path, *loaded, modified=os.stat(file_path).st_mtime)
+        return store
+
+    def add_table(self, source, columns, rows, modified=None):
+        table = f"t{len(self.tables)}"
+        quoted = [f'"{c.replace(chr(34), chr(34) * 2)}"' for c in columns]
+        with self._lock:
+            self._conn.execute(f"CREATE TABLE {table} ({', '.join(f'{q} TEXT' for q in quoted)})")
+            self._conn.executemany(
+                f"INSERT INTO {table} VALUES ({', '.join('?' * len(columns))})",
+                [[row.get(c, "") for c in columns] for row in rows]
+            )
+            for i, q in enumerate(quoted):
+                self._conn.execute(f"CREATE INDEX {table}_c{i} ON {table} ({q} COLLATE NOCASE)")
+
+        key = self._key_column(columns, rows)
+        self.tables[table] = {"source": source, "columns": columns, "key": key,
+                              "type": file_type_of(source), "modified": modified}
+        for name in columns:
+            self.columns.setdefault(name.lower(), []).append((table, name))
+        if key is not None:
+            for rowid, row in enumerate(rows, start=1):
+                tokens = _tokens(row.get(key, ""))
+                if tokens and len(" ".join(tokens)) >= STRUCTURED_MIN_KEY_CHARS:
+                    self._keys.setdefault(tokens, []).append((table, rowid))
+                    self._key_lengths.add(len(tokens))
+        self.rows += len(rows)
+
+    @staticmethod
+    def _key_column(columns, rows):
+        if STRUCTURED_KEY_COLUMN:
+            return STRUCTURED_KEY_COLUMN if STRUCTURED_KEY_COLUMN in columns else None
+        for name in columns:
+            values = [row.get(name, "").strip().lower() for row in rows]
+            if all(values) and len(set(values)) == len(values):
+                return name
+        return None
+
+    def _key_matches(self, tokens):
+        # One dict probe per query n-gram of a length some key has; longest keys first,
+        # so "security policy v2" ranks above "security policy"
+        matches = []
+        for n in sorted(self._key_lengths, reverse=True):
+            for i in range(len(tokens) - n + 1):
+                matches.extend(self._keys.get(tokens[i:i + n], ()))
+        return matches
+
+    def _filter_matches(self, filters):
+        matches = []
+        for column, value in filters:
+            for table, name in self.columns.get(column.lower(), ()):
+                q = name.replace('"', '""')
+                with self._lock:
+                    found = self._conn.execute(
+                        f'SELECT rowid FROM {table} WHERE "{q}" = ? COLLATE NOCASE LIMIT ?',
+                        (value.strip(), STRUCTURED_MAX_ROWS + 1)
+                    ).fetchall()
+                matches.extend((table, rowid) for (rowid,) in found)
+        return matches
+
+    def _fetch(self, table, rowids):
+        marks = ",".join("?" * len(rowids))
+        with self._lock:
+            found = self._conn.execute(f"SELECT rowid, * FROM {table} WHERE rowid IN ({marks})", rowids).fetchall()
+        return {row[0]: row[1:] for row in found}
+
+    def _render(self, table, rowid, values, wanted):
+        info = self.tables[table]
+        pairs = list(zip(info["columns"], values))
+        if wanted:
+            # The query names specific columns: keep the key and those, drop the rest
+            pairs = [(c, v) for c, v in pairs if c == info["key"] or c.lower() in wanted]
+        return Document(
+            page_content="; ".join(f"{c}: {v}" for c, v in pairs if v != ""),
+            metadata={"source": info["source"], "type": info["type"], "structured": True, "row": rowid,
+                      "modified": info["modified"], "chunk_id": f"row:{info['source']}:{rowid}"}
+        )
+
+    def lookup(self, query: str):
+        """
+        Rows the query names by key or filters on by column value, as compact Documents.
+        Returns [] when the query isn't a lookup (an analytical question, or a long one naming
+        a key but no column), nothing matches, or the match is too broad to be a lookup.
+        """
+        with self._lock:
+            self.stats["lookups"] += 1
+        if ANALYTICAL_RE.search(query.lower()):
+            return []
+        tokens = _tokens(query)
+        filters = FILTER_RE.findall(query)
+        # Columns named outside a filter are the ones asked for
+        wanted = {t for t in tokens if t in self.columns} - {c.lower() for c, _ in filters}
+        filter_matches = self._filter_matches(filters)
+        if not filter_matches and not wanted and len(tokens) > STRUCTURED_KEY_QUERY_MAX_WORDS:
+            return []
+        matches = list(dict.fromkeys(filter_matches + self._key_matches(tokens)))
+        if not matches or len(matches) > STRUCTURED_MAX_ROWS:
+            return []
+
+        by_table = {}
+        for table, rowid in matches:
+            by_table.setdefault(table, []).append(rowid)
+        fetched = {table: self._fetch(table, rowids) for table, rowids in by_table.items()}
+        docs, seen = [], set()
+        for table, rowid in matches:
+            if rowid in fetched[table]:
+                doc = self._render(table, rowid, fetched[table][rowid], wanted)
+                # The same row exported to several files is only passed on once
+                if doc.page_content not in seen:
+                    seen.add(doc.page_content)
+                    docs.append(doc)
+        with self._lock:
+            self.stats["hits"] += 1
+        return docs
+
+    def describe(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        return {"tables": len(self.tables), "rows": self.rows, **stats}
+
+
+_stores = {}
+_store_lock = threading.Lock()
+
+
+def get_structured_store(tenant=None):
+    """
+    The tenant's structured store for its current corpus version, rebuilt from the tenant's
+    data directory whenever a sync changes the corpus.
+    """
+    from app.rag.vector_db import get_tenant
+    from app.rag.ingest import list_source_files
+
+    corpus = get_tenant(tenant)
+    version = corpus.corpus_version()
+    store = _stores.get(corpus.name)
+    if store is not None and store.version == version:
+        return store
+    with _store_lock:
+        store = _stores.get(corpus.name)
+        if store is None or store.version != version:
+            started = time.perf_counter()
+            store = _stores[corpus.name] = StructuredStore.build(list_source_files(corpus.data_path), version)
+            print(f"Structured store ({corpus.name}): {store.rows} rows in {len(store.tables)} tables "
+                  f"loaded in {(time.perf_counter() - started) * 1000:.1f}ms.")
+    return store
+
+
+def structured_lookup(query: str, tenant=None):
+    """Rows answering an exact lookup query, or [] when text retrieval is needed."""
+    if not STRUCTURED_ENABLED:
+        return []
+    return get_structured_store(tenant).lookup(query)
@@ -1,56 +1,542 @@
 from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from app.rag.ingest import load_documents, get_chunks
+from langchain_core.documents import Document
+from app.rag.ingest import list_source_files, iter_file_chunks, file_type_of, IngestProgress, INGEST_WORKERS, INGEST_BATCH_SIZE
+from app.rag.manifest import load_manifest, save_manifest, hash_file, assign_chunk_ids, ManifestError
+from app.rag.bm25_index import BM25Index
+from app.rag.flat_index import FlatIndex, FLAT_INDEX_PATH, FLAT_INDEX_DTYPE
+from app.rag.embedding_service import EmbeddingService
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import heapq
 import os
-import shutil
+import re
+import threading
 
 CHROMA_PATH = "chroma_db"
+MANIFEST_PATH = os.path.join(CHROMA_PATH, "ingest_manifest.json")
+BM25_PATH = "bm25_index"
+# Below this many changed files, parsing inline beats paying for worker process startup
+INGEST_PARALLEL_MIN_FILES = int(os.getenv("INGEST_PARALLEL_MIN_FILES", "8"))
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # "chroma" (HNSW) or "flat" (memory-mapped NumPy)
+# HNSW graph parameters. M and ef_construction are fixed when the collection is created;
+# ef_search (recall vs latency per query) is applied to an existing collection at startup
+HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "100"))
+HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "100"))
+# Distinct metadata filters whose matching chunk IDs are kept for keyword search
+FILTER_CACHE_SIZE = int(os.getenv("VECTOR_FILTER_CACHE_SIZE", "64"))
+
+# Tenants other than the default live in TENANTS_DIR/<name>, with their documents in <name>/data
+DEFAULT_TENANT = "default"
+TENANTS_DIR = os.getenv("MEKA_TENANTS_DIR", "tenants")
+TENANT_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+# Shards (Chroma collections) for a newly created tenant store; an existing store keeps its count
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "1"))
+SHARD_COLLECTION = "langchain"
+
+# Shard searches of one query run concurrently on this pool
+_shard_executor = ThreadPoolExecutor(max_workers=int(os.getenv("VECTOR_SHARD_THREADS", "8")),
+                                     thread_name_prefix="meka-shard")
 
 # Global Singletons to prevent reloading models on every request
 _embeddings = None
-_vector_store = None
+_web_store = None
+_tenants = {}
+# Retrieval sources initialize concurrently; only one thread may open a client
+_init_lock = threading.RLock()
+
+class UnknownTenantError(Exception):
+    pass
 
 def get_embeddings():
     global _embeddings
-    if _embeddings is None:
-        print("Loading HuggingFace Embeddings...")
-        _embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    with _init_lock:
+        if _embeddings is None:
+            _embeddings = EmbeddingService()
     return _embeddings
 
-def get_vector_store():
-    global _vector_store
-    if _vector_store is None:
-        embeddings = get_embeddings()
-        
-        # If the database doesn't exist, create it by ingesting documents
-        if not os.path.exists(CHROMA_PATH) or not os.listdir(CHROMA_PATH):
-            sync_vector_store()
-            
-        _vector_store = Chroma(
-            persist_directory=CHROMA_PATH,
-            embedding_function=embeddings
-        )
-    return _vector_store
-
-def sync_vector_store():
-    """
-    Clears the existing vector store and rebuilds it from the data directory.
-    """
-    global _vector_store
-    if os.path.exists(CHROMA_PATH):
-        shutil.rmtree(CHROMA_PATH)
-    
-    print("Synchronizing Vector DB...")
-    embeddings = get_embeddings()
-    documents = load_documents()
-    chunks = get_chunks(documents)
-    
-    if chunks:
-        _vector_store = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=CHROMA_PATH
+def hnsw_metadata():
+    return {"hnsw:M": HNSW_M, "hnsw:construction_ef": HNSW_EF_CONSTRUCTION, "hnsw:search_ef": HNSW_EF_SEARCH}
+
+def set_ef_search(collection, ef_search):
+    """
+    Stores a new HNSW search breadth on the collection. Chroma reads it when a process first
+    loads the index, so it applies to processes that haven't queried the collection yet.
+    """
+    collection.modify(configuration={"hnsw": {"ef_search": int(ef_search)}})
+
+def _apply_hnsw_config(store, chroma_path):
+    hnsw = (store._collection.configuration or {}).get("hnsw") or {}
+    if hnsw.get("ef_search") not in (None, HNSW_EF_SEARCH):
+        # Before the first query, so this process loads the index with it
+        set_ef_search(store._collection, HNSW_EF_SEARCH)
+    built = (hnsw.get("max_neighbors"), hnsw.get("ef_construction"))
+    if None not in built and built != (HNSW_M, HNSW_EF_CONSTRUCTION):
+        print(f"Vector store was built with M={built[0]}, ef_construction={built[1]}; "
+              f"delete {chroma_path} to rebuild with M={HNSW_M}, ef_construction={HNSW_EF_CONSTRUCTION}.")
+
+def _delete_ids(vector_store, ids, batch_size=5000):
+    ids = list(ids)
+    for i in range(0, len(ids), batch_size):
+        vector_store.delete(ids=ids[i:i + batch_size])
+
+class Tenant:
+    """
+    One isolated corpus: its data directory, Chroma store, manifest, BM25 and flat index snapshots.
+    The store is split into `shards` Chroma collections; every file's chunks live in the shard its
+    path hashes to, so a sync only touches the shards of the files that changed. Vector searches
+    query all shards in parallel and merge the hits by distance.
+    The default tenant keeps the original single-corpus layout (data/, chroma_db/, bm25_index/).
+    """
+
+    def __init__(self, name, data_path, root):
+        self.name = name
+        self.data_path = data_path
+        self.chroma_path = os.path.join(root, CHROMA_PATH) if root else CHROMA_PATH
+        self.manifest_path = os.path.join(self.chroma_path, "ingest_manifest.json")
+        self.bm25_path = os.path.join(root, BM25_PATH) if root else BM25_PATH
+        self.flat_path = os.path.join(root, FLAT_INDEX_PATH) if root else FLAT_INDEX_PATH
+        self._opened = None
+        self._stores = None
+        self._bm25_index = None
+        self._flat_index = None
+        self._version = (None, None)
+        self._filtered_ids = OrderedDict()
+        # Reentrant so the derived-index builders may reach the store accessors while holding it
+        self._sync_lock = threading.RLock()
+
+    # --- stores -------------------------------------------------------------
+
+    def _shard_count(self):
+        manifest = load_manifest(self.manifest_path)
+        return manifest.get("shards") or (VECTOR_SHARDS if not manifest["files"] else 1)
+
+    def _open(self):
+        """
+        Opens the shard collections once, without ingesting anything. Sync writes through these,
+        so it never goes back through stores() (which runs the first sync itself).
+        """
+        if self._opened is not None:
+            return self._opened
+        with _init_lock:
+            if self._opened is None:
+                client = None
+                stores = []
+                for shard in range(self._shard_count()):
+                    store = Chroma(
+                        collection_name=SHARD_COLLECTION if shard == 0 else f"{SHARD_COLLECTION}_shard{shard}",
+                        persist_directory=self.chroma_path if client is None else None,
+                        client=client,
+                        embedding_function=get_embeddings(),
+                        collection_metadata=hnsw_metadata()
+                    )
+                    client = store._client
+                    _apply_hnsw_config(store, self.chroma_path)
+                    stores.append(store)
+                self._opened = stores
+        return self._opened
+
+    def stores(self):
+        """
+        The shard stores, opened on first use; a tenant without a manifest is ingested first.
+        The first ingest runs under this tenant's sync lock only, so other tenants keep serving,
+        and the stores are published once it has finished: concurrent callers wait for it rather
+        than searching a half-filled store.
+        """
+        if self._stores is not None:
+            return self._stores
+        stores = self._open()
+        with self._sync_lock:
+            if self._stores is None:
+                # First start (or a store built before the manifest existed): ingest the data directory
+                if not os.path.exists(self.manifest_path):
+                    self.sync()
+                self._stores = stores
+        return self._stores
+
+    def collections(self):
+        return [store._collection for store in self.stores()]
+
+    def shard_of(self, file_path):
+        stores = self._open()
+        if len(stores) == 1:
+            return 0
+        return int(hashlib.sha1(file_path.encode("utf-8")).hexdigest()[:8], 16) % len(stores)
+
+    def _map_shards(self, fn):
+        stores = self.stores()
+        if len(stores) == 1:
+            return [fn(stores[0])]
+        return list(_shard_executor.map(fn, stores))
+
+    def corpus_version(self):
+        """
+        Monotonic counter bumped every time a sync changes the indexed corpus.
+        The manifest is only re-read when its mtime changes, so this is cheap to call per query
+        and still picks up syncs made by other worker processes.
+        """
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+        if self._version[0] != mtime:
+            self._version = (mtime, load_manifest(self.manifest_path)["version"])
+        return self._version[1]
+
+    # --- search -------------------------------------------------------------
+
+    def relevance_fn(self):
+        return self.stores()[0]._select_relevance_score_fn()
+
+    def vector_search(self, embedding, k=5, where=None):
+        """The k nearest chunks over all shards as (Document, distance) pairs, nearest first."""
+        hits = self._map_shards(
+            lambda store: store.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=where)
         )
-        print(f"Ingested {len(chunks)} chunks from {len(documents)} documents.")
+        return heapq.nsmallest(k, (hit for shard in hits for hit in shard), key=lambda hit: hit[1])
+
+    def documents_by_ids(self, ids):
+        """
+        Fetches stored chunks as Documents, in the order of the given IDs.
+        """
+        if not ids:
+            return []
+        by_id = {}
+        for found in self._map_shards(lambda store: store.get(ids=list(ids), include=["documents", "metadatas"])):
+            for cid, text, meta in zip(found["ids"], found["documents"], found["metadatas"]):
+                by_id[cid] = Document(page_content=text, metadata=meta or {})
+        return [by_id[cid] for cid in ids if cid in by_id]
+
+    def filtered_ids(self, where, key, batch_size=5000):
+        """
+        IDs of the chunks matching a Chroma `where` clause, cached per filter and corpus version
+        so keyword search can be restricted to them without asking the store on every query.
+        """
+        cache_key = (key, self.corpus_version())
+        with _init_lock:
+            if cache_key in self._filtered_ids:
+                self._filtered_ids.move_to_end(cache_key)
+                return self._filtered_ids[cache_key]
+
+        def shard_ids(store):
+            ids, offset = [], 0
+            while True:
+                batch = store.get(where=where, include=[], limit=batch_size, offset=offset)["ids"]
+                if not batch:
+                    return ids
+                ids.extend(batch)
+                offset += len(batch)
+
+        ids = frozenset(cid for shard in self._map_shards(shard_ids) for cid in shard)
+        with _init_lock:
+            self._filtered_ids[cache_key] = ids
+            while len(self._filtered_ids) > FILTER_CACHE_SIZE:
+                self._filtered_ids.popitem(last=False)
+        return ids
+
+    # --- derived indexes ----------------------------------------------------
+
+    def bm25_index(self):
+        """
+        Keyword index over the same chunks the vector store holds, restored from its on-disk snapshot.
+        Reloaded when another worker process has synced since, and only rebuilt from the vector
+        store if the snapshot is missing or out of date.
+        """
+        version = self.corpus_version()
+        if self._bm25_index is not None and self._bm25_index.version == version:
+            return self._bm25_index
+        self.stores()
+        with self._sync_lock:
+            version = self.corpus_version()
+            if self._bm25_index is None or self._bm25_index.version != version:
+                index = BM25Index.load(self.bm25_path)
+                # A sync saves the snapshot just before publishing its manifest, so a snapshot
+                # ahead of the manifest is the corpus about to be published
+                if index is None or index.version is None or index.version < version:
+                    index = self._rebuild_bm25_index()
+                self._bm25_index = index
+        return self._bm25_index
+
+    def flat_index(self):
+        """
+        Flat vector index over the vector store's embeddings, memory-mapped from its snapshot.
+        Rebuilt from the vector store when the snapshot is missing, stale or of another dtype.
+        """
+        version = self.corpus_version()
+        if self._flat_index is not None and self._flat_index.version == version:
+            return self._flat_index
+        self.stores()
+        with self._sync_lock:
+            version = self.corpus_version()
+            if self._flat_index is None or self._flat_index.version != version:
+                index = FlatIndex.load(self.flat_path)
+                if index is None or index.version != version or index.dtype != FLAT_INDEX_DTYPE:
+                    print(f"Building flat vector index for tenant '{self.name}'...")
+                    index = FlatIndex.build(self.collections(), path=self.flat_path, version=version)
+                    print(f"Flat index built over {len(index)} chunks ({index.dtype}).")
+                self._flat_index = index
+        return self._flat_index
+
+    def _rebuild_bm25_index(self, version=None, batch_size=5000):
+        print(f"Building BM25 index for tenant '{self.name}' from vector store...")
+        index = BM25Index()
+        for store in self._open():
+            offset = 0
+            while True:
+                batch = store.get(include=["documents"], limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    break
+                index.update(batch["ids"], batch["documents"])
+                offset += len(batch["ids"])
+        index.version = self.corpus_version() if version is None else version
+        index.save(self.bm25_path)
+        print(f"BM25 index built over {len(index)} chunks.")
+        return index
+
+    def _bm25_for_sync(self, version):
+        """
+        The BM25 index to update incrementally during a sync, or None if it is stale and must be rebuilt.
+        """
+        index = self._bm25_index or BM25Index.load(self.bm25_path)
+        if index is None or index.version != version:
+            return None
+        return index
+
+    def _update_bm25_index(self, index, previous_version, version, add_ids, add_rows, removed):
+        """
+        Applies a sync's chunk changes to the BM25 snapshot, falling back to a rebuild if it was stale,
+        and saves it as `version`. Must be called with the sync lock held, before the manifest
+        announcing `version` is saved.
+        """
+        if index is None or index.version != previous_version:
+            self._bm25_index = self._rebuild_bm25_index(version)
+            return
+        index.update(add_ids, remove_ids=removed, add_rows=add_rows)
+        index.version = version
+        index.save(self.bm25_path)
+        self._bm25_index = index
+
+    # --- sync ---------------------------------------------------------------
+
+    def _load_manifest_for_sync(self):
+        """
+        The manifest to sync against. A corrupt one is moved aside (kept for inspection) and the
+        sync reconciles the files with the IDs already in the store instead.
+        """
+        try:
+            return load_manifest(self.manifest_path, strict=True)
+        except ManifestError as e:
+            corrupt_path = f"{self.manifest_path}.corrupt"
+            os.replace(self.manifest_path, corrupt_path)
+            print(f"WARNING: {e}. Moved it to {corrupt_path}; rebuilding it from the vector store "
+                  f"for tenant '{self.name}'.")
+            return load_manifest(self.manifest_path)
+
+    def sync(self):
+        """
+        Incrementally synchronizes the tenant's store with its data directory.
+        Only new or changed files are loaded, chunked and embedded; chunks of removed files are deleted.
+        Changed files are parsed in a process pool and streamed to their shards in bounded batches.
+        The collections are updated in place, so they stay queryable throughout.
+        """
+        with self._sync_lock:
+            stores = self._open()
+            manifest = self._load_manifest_for_sync()
+            manifest["shards"] = len(stores)
+            files = manifest["files"]
+
+            # Without a manifest (first start, a lost or corrupt manifest, or a store built by the
+            # old wipe-and-rebuild sync) the store's IDs are untracked. Chunks whose ID is derived
+            # again below are kept without re-embedding; the rest are dropped once the tracked
+            # chunks are in place.
+            untracked = [set() for _ in stores]
+            if not files:
+                untracked = [set(store.get(include=[])["ids"]) for store in stores]
+            written = [set() for _ in stores]
+
+            print(f"Synchronizing Vector DB for tenant '{self.name}'...")
+            current_files = list_source_files(self.data_path)
+
+            # 1. Cheap change detection: stat first, hash only when the stat differs
+            changed = {}
+            for file_path in current_files:
+                stat = os.stat(file_path)
+                entry = files.get(file_path)
+                # Entries without "type" predate the filterable chunk metadata: re-parse them once
+                # (unchanged chunks only get their metadata updated, nothing is re-embedded)
+                current = entry is not None and "type" in entry
+                if current and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                    continue
+                file_hash = hash_file(file_path)
+                if current and entry["hash"] == file_hash:
+                    # Touched but not modified: just refresh the stat info
+                    entry["mtime"] = stat.st_mtime
+                    entry["size"] = stat.st_size
+                    continue
+                changed[file_path] = (stat, file_hash)
+
+            # 2. Stream changed files through load -> split -> embed -> upsert
+            bm25 = self._bm25_for_sync(manifest["version"])
+            bm25_ids, bm25_rows = [], []
+            stale_ids = [set() for _ in stores]
+            pending = [[] for _ in stores]
+            progress = IngestProgress()
+            added = 0
+
+            def flush(shard):
+                if pending[shard]:
+                    stores[shard].add_documents([c for _, c in pending[shard]], ids=[cid for cid, _ in pending[shard]])
+                    pending[shard].clear()
+
+            def flush_bm25():
+                # Keyword rows follow the stored chunks batch by batch, so memory stays bounded by
+                # the batch size; removals and the snapshot are applied once at the end
+                for shard in range(len(stores)):
+                    flush(shard)
+                bm25.update(bm25_ids, add_rows=bm25_rows)
+                bm25_ids.clear()
+                bm25_rows.clear()
+
+            workers = INGEST_WORKERS if len(changed) >= INGEST_PARALLEL_MIN_FILES else 1
+            for file_path, chunks in iter_file_chunks(list(changed), workers=workers):
+                stat, file_hash = changed[file_path]
+                shard = self.shard_of(file_path)
+                file_type = file_type_of(file_path)
+                for chunk in chunks:
+                    chunk.metadata["type"] = file_type
+                    chunk.metadata["modified"] = stat.st_mtime
+                chunk_ids = assign_chunk_ids(file_path, chunks)
+                old_chunks = files[file_path]["chunks"] if file_path in files else {}
+
+                known = old_chunks.keys() | untracked[shard]
+                new_chunks = [(cid, c) for cid, c in zip(chunk_ids, chunks) if cid not in known]
+                kept_chunks = [(cid, c) for cid, c in zip(chunk_ids, chunks) if cid in known]
+                stale_ids[shard].update(set(old_chunks) - set(chunk_ids))
+                written[shard].update(chunk_ids)
+
+                if kept_chunks:
+                    # Content is identical, only offsets may have moved: update metadata without re-embedding
+                    stores[shard]._collection.update(
+                        ids=[cid for cid, _ in kept_chunks],
+                        metadatas=[c.metadata for _, c in kept_chunks]
+                    )
+                pending[shard].extend(new_chunks)
+                if len(pending[shard]) >= INGEST_BATCH_SIZE:
+                    flush(shard)
+                if new_chunks and bm25 is not None:
+                    bm25_ids.extend(cid for cid, _ in new_chunks)
+                    bm25_rows.append(bm25.encode([c.page_content for _, c in new_chunks]))
+                    if len(bm25_ids) >= INGEST_BATCH_SIZE:
+                        flush_bm25()
+
+                files[file_path] = {
+                    "hash": file_hash,
+                    "mtime": stat.st_mtime,
+                    "size": stat.st_size,
+                    "type": file_type,
+                    "chunks": {c.metadata["chunk_id"]: c.metadata["content_hash"] for c in chunks}
+                }
+                added += len(new_chunks)
+                progress.update(files=1, chunks=len(chunks))
+            for shard in range(len(stores)):
+                flush(shard)
+
+            # 3. Remove what is gone, only after the replacements are in place
+            removed_files = set(files) - set(current_files)
+            for file_path in removed_files:
+                stale_ids[self.shard_of(file_path)].update(files.pop(file_path)["chunks"])
+            for shard, (store, ids) in enumerate(zip(stores, stale_ids)):
+                ids.update(untracked[shard] - written[shard])
+                _delete_ids(store, ids)
+
+            removed = set().union(*stale_ids)
+            changed_files = len(changed) + len(removed_files)
+            if changed_files:
+                previous_version = manifest["version"]
+                manifest["version"] += 1
+                # Snapshot first: workers that see the new manifest find a matching BM25 snapshot
+                self._update_bm25_index(bm25, previous_version, manifest["version"], bm25_ids, bm25_rows, removed)
+                save_manifest(self.manifest_path, manifest)
+                print(f"Synced {changed_files} files: {added} chunks embedded, {len(removed)} chunks removed "
+                      f"({progress.summary()}).")
+            else:
+                save_manifest(self.manifest_path, manifest)
+                print("Vector DB already up to date.")
+
+    def describe(self):
+        return {
+            "shards": len(self._stores) if self._stores is not None else 0,
+            "version": self.corpus_version(),
+            "chunks": sum(c.count() for c in self.collections()) if self._stores is not None else 0,
+        }
+
+def get_tenant(name=None):
+    """
+    The tenant registered under `name` (the default tenant when None), created on first use.
+    Raises UnknownTenantError for invalid names and tenants without a data directory.
+    """
+    name = name or DEFAULT_TENANT
+    tenant = _tenants.get(name)
+    if tenant is not None:
+        return tenant
+    if name == DEFAULT_TENANT:
+        data_path, root = "data", None
     else:
-        print("No documents found to ingest.")
\ No newline at end of file
+        root = os.path.join(TENANTS_DIR, name)
+        data_path = os.path.join(root, "data")
+        if not TENANT_NAME_RE.match(name) or not os.path.isdir(data_path):
+            raise UnknownTenantError(f"Unknown tenant '{name}'")
+    with _init_lock:
+        if name not in _tenants:
+            _tenants[name] = Tenant(name, data_path, root)
+    return _tenants[name]
+
+def list_tenants():
+    names = [DEFAULT_TENANT]
+    if os.path.isdir(TENANTS_DIR):
+        names += sorted(n for n in os.listdir(TENANTS_DIR)
+                        if TENANT_NAME_RE.match(n) and os.path.isdir(os.path.join(TENANTS_DIR, n, "data")))
+    return names
+
+# --- module-level API, per tenant (the default tenant when omitted) ---------
+
+def get_vector_store(tenant=None):
+    """The tenant's first shard store; opening it ingests the data directory on first start."""
+    return get_tenant(tenant).stores()[0]
+
+def get_corpus_version(tenant=None):
+    return get_tenant(tenant).corpus_version()
+
+def get_bm25_index(tenant=None):
+    return get_tenant(tenant).bm25_index()
+
+def get_flat_index(tenant=None):
+    return get_tenant(tenant).flat_index()
+
+def get_documents_by_ids(ids, tenant=None):
+    return get_tenant(tenant).documents_by_ids(ids)
+
+def get_filtered_ids(where, key, tenant=None):
+    return get_tenant(tenant).filtered_ids(where, key)
+
+def sync_vector_store(tenant=None):
+    get_tenant(tenant).sync()
+
+def get_web_store():
+    """
+    Collection of chunked, embedded web results, next to the default corpus in the same Chroma client.
+    It is shared by all tenants and not part of any corpus: syncs and corpus versions never touch it.
+    """
+    global _web_store
+    from app.rag.web_search import WEB_COLLECTION
+    if _web_store is not None:
+        return _web_store
+    with _init_lock:
+        if _web_store is None:
+            _web_store = Chroma(
+                collection_name=WEB_COLLECTION,
+                client=get_vector_store()._client,
+                embedding_function=get_embeddings()
+            )
+    return _web_store
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from app.rag.ingest import get_chunks
+
+WEB_SEARCH_PROVIDER = os.getenv("WEB_SEARCH_PROVIDER", "tavily")  # "tavily", "local" or "none"
+# Hard limit on one provider call; the retriever's RETRIEVER_WEB_TIMEOUT still bounds the whole stage
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "6"))
+WEB_SEARCH_POOL_SIZE = int(os.getenv("WEB_SEARCH_POOL_SIZE", "8"))
+WEB_CACHE_ENABLED = os.getenv("WEB_CACHE_ENABLED", "true").lower() == "true"
+WEB_CACHE_PATH = os.getenv("WEB_CACHE_PATH", "web_cache.db")
+WEB_CACHE_TTL = float(os.getenv("WEB_CACHE_TTL", str(24 * 3600)))
+# Fetched pages are chunked and embedded into this collection for reuse by later queries
+WEB_COLLECTION = os.getenv("WEB_COLLECTION", "web_results")
+WEB_STORE_ENABLED = os.getenv("WEB_STORE_ENABLED", "true").lower() == "true"
+# A stored web chunk at least this relevant to a new query answers it without a provider call
+WEB_REUSE_SCORE = float(os.getenv("WEB_REUSE_SCORE", "0.8"))
+# Local provider corpus: a JSON list of {"url", "title", "content"} objects
+WEB_LOCAL_PATH = os.getenv("WEB_LOCAL_PATH", "web_fixtures.json")
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def normalize_query(query: str):
+    return " ".join(TOKEN_RE.findall(query.lower()))
+
+
+class TavilyProvider:
+    """Tavily search through one shared client, so HTTP connections are pooled across queries."""
+
+    name = "tavily"
+
+    def __init__(self, timeout=WEB_SEARCH_TIMEOUT, pool_size=WEB_SEARCH_POOL_SIZE):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._client = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        return bool(os.getenv("TAVILY_API_KEY"))
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                import requests
+                from tavily import TavilyClient
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                self._client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"), session=session)
+        return self._client
+
+    def search(self, query: str, k: int):
+        response = self._get_client().search(query, max_results=k, timeout=self.timeout)
+        return response.get("results", []) if isinstance(response, dict) else []
+
+
+class LocalProvider:
+    """
+    Offline stand-in: ranks the pages of a local JSON file by query word overlap.
+    Lets the web path (cache, chunking, reuse) run in tests and benchmarks without network access.
+    """
+
+    name = "local"
+
+    def __init__(self, path=WEB_LOCAL_PATH):
+        self.path = path
+        self._pages = None
+
+    def available(self):
+        return os.path.exists(self.path)
+
+    def _load(self):
+        if self._pages is None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._pages = [(page, set(TOKEN_RE.findall(page.get("content", "").lower()))) for page in json.load(f)]
+        return self._pages
+
+    def search(self, query: str, k: int):
+        terms = set(TOKEN_RE.findall(query.lower()))
+        scored = []
+        for page, words in self._load():
+            overlap = len(terms & words) / max(len(terms), 1)
+            if overlap:
+                scored.append({**page, "score": round(overlap, 4)})
+        scored.sort(key=lambda r: r["score"], reverse=True)
+        return scored[:k]
+
+
+PROVIDERS = {"tavily": TavilyProvider, "local": LocalProvider}
+
+
+class WebResultCache:
+    """Persistent normalized-query -> provider results cache in SQLite (WAL), with a TTL."""
+
+    def __init__(self, path=WEB_CACHE_PATH, ttl=WEB_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, results TEXT NOT NULL, fetched_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        # Connections must not cross a fork, so they are per thread and per process
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT results FROM results WHERE key = ? AND fetched_at >= ?", (key, time.time() - self.ttl)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, results):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO results (key, results, fetched_at) VALUES (?, ?, ?)",
+                     (key, json.dumps(results), now))
+        conn.execute("DELETE FROM results WHERE fetched_at < ?", (now - self.ttl,))
+
+
+class WebSearch:
+    """
+    Web retrieval in three tiers, cheapest first:
+    1. the persistent result cache, keyed by provider, normalized query and k;
+    2. web chunks stored from earlier fetches, when one is at least WEB_REUSE_SCORE relevant;
+    3. the provider itself, with a hard timeout. Its pages are then chunked, embedded and
+       stored in the web collection on a background thread.
+    """
+
+    def __init__(self, provider=None, cache=WEB_CACHE_ENABLED, store=WEB_STORE_ENABLED):
+        self.provider = provider or PROVIDERS.get(WEB_SEARCH_PROVIDER, lambda: None)()
+        self.cache = WebResultCache() if cache else None
+        self.store_enabled = store
+        self.stats = {"requests": 0, "cache_hits": 0, "reused": 0, "fetched": 0, "errors": 0, "stored_chunks": 0}
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="meka-web-store")
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _to_docs(self, results):
+        pages = []
+        for res in results:
+            metadata = {"source": res.get("url", "unknown"), "type": "web"}
+            if res.get("title"):
+                metadata["title"] = res["title"]
+            if res.get("score") is not None:
+                metadata["web_score"] = float(res["score"])
+            pages.append(Document(page_content=res.get("content", ""), metadata=metadata))
+        chunks = get_chunks(pages)
+        for chunk in chunks:
+            digest = hashlib.sha1(f"{chunk.metadata['source']}\0{chunk.page_content}".encode("utf-8")).hexdigest()
+            chunk.metadata["chunk_id"] = f"web:{digest}"
+        return chunks
+
+    def _reuse(self, query: str, k: int):
+        from app.rag.vector_db import get_web_store, get_embeddings
+        store = get_web_store()
+        relevance = store._select_relevance_score_fn()
+        cutoff = time.time() - WEB_CACHE_TTL
+        found = store.similarity_search_by_vector_with_relevance_scores(
+            get_embeddings().embed_query(query), k=k, filter={"fetched_at": {"$gte": cutoff}}
+        )
+        docs = []
+        for doc, distance in found:
+            score = float(relevance(distance))
+            if score >= WEB_REUSE_SCORE:
+                doc.metadata["web_score"] = score
+                docs.append(doc)
+        return docs
+
+    def _store(self, chunks):
+        from app.rag.vector_db import get_web_store
+        try:
+            now = time.time()
+            store = get_web_store()
+            for chunk in chunks:
+                chunk.metadata["fetched_at"] = now
+            ids = list(dict.fromkeys(c.metadata["chunk_id"] for c in chunks))
+            unique = {c.metadata["chunk_id"]: c for c in chunks}
+            store.add_documents([unique[cid] for cid in ids], ids=ids)
+            store._collection.delete(where={"fetched_at": {"$lt": now - WEB_CACHE_TTL}})
+            self._count("stored_chunks", len(ids))
+        except Exception as e:
+            print(f"Storing web results failed: {e}")
+
+    def search(self, query: str, k: int = 3):
+        if self.provider is None or not self.provider.available():
+            return []
+        self._count("requests")
+        key = f"{self.provider.name}\0{normalize_query(query)}\0{k}"
+
+        results = self.cache.get(key) if self.cache else None
+        if results is not None:
+            self._count("cache_hits")
+            return self._to_docs(results)
+
+        if self.store_enabled:
+            try:
+                docs = self._reuse(query, k)
+            except Exception as e:
+                print(f"Web result reuse failed: {e}")
+                docs = []
+            if docs:
+                self._count("reused")
+                return docs
+
+        try:
+            results = self.provider.search(query, k)
+        except Exception as e:
+            print(f"Web search error: {e}")
+            self._count("errors")
+            return []
+        self._count("fetched")
+        if self.cache:
+            self.cache.put(key, results)
+        docs = self._to_docs(results)
+        if self.store_enabled and docs:
+            self._writer.submit(self._store, [Document(page_content=d.page_content, metadata=dict(d.metadata)) for d in docs])
+        return docs
+
+    def describe(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["provider"] = self.provider.name if self.provider else "none"
+        served = stats["cache_hits"] + stats["reused"]
+        stats["hit_rate"] = round(served / stats["requests"], 4) if stats["requests"] else 0.0
+        return stats
+
+
+_web_search = None
+_web_search_lock = threading.Lock()
+
+
+def get_web_search():
+    global _web_search
+    with _web_search_lock:
+        if _web_search is None:
+            _web_search = WebSearch()
+    return _web_search
@@ -1,7 +1,15 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+
+class SearchFilters(BaseModel):
+    sources: Optional[List[str]] = None
+    types: Optional[List[str]] = None
+    modified_after: Optional[float] = None
+    modified_before: Optional[float] = None
 
 class AskRequest(BaseModel):
     query: str
     web_search: Optional[bool] = False
-    thread_id: Optional[str] = "default_user"
\ No newline at end of file
+    thread_id: Optional[str] = "default_user"
+    filters: Optional[SearchFilters] = None
+    tenant: Optional[str] = None  # named collection to query; the default corpus when omitted
@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("MEKA")
+
+
+def _load_embeddings():
+    from app.rag.vector_db import get_embeddings
+    get_embeddings().load()
+
+
+def _load_vector_store():
+    from app.rag.vector_db import get_tenant, list_tenants
+    for name in list_tenants():
+        get_tenant(name).stores()
+
+
+def _load_bm25():
+    from app.rag.vector_db import get_bm25_index, list_tenants
+    for name in list_tenants():
+        get_bm25_index(name)
+
+
+def _load_flat_index():
+    from app.rag.vector_db import VECTOR_BACKEND, get_flat_index, list_tenants
+    if VECTOR_BACKEND == "flat":
+        for name in list_tenants():
+            get_flat_index(name)
+
+
+def _load_structured():
+    from app.rag.structured_store import get_structured_store
+    from app.rag.vector_db import list_tenants
+    for name in list_tenants():
+        get_structured_store(name)
+
+
+def _load_reranker():
+    from app.rag.rerank_service import get_rerank_service
+    get_rerank_service().load()
+
+
+def _load_tokenizer():
+    from app.rag.context_packer import count_tokens
+    count_tokens("warmup")
+
+
+def _load_nli():
+    from app.agents.validator_agent import VALIDATOR_BACKEND
+    if VALIDATOR_BACKEND == "nli":
+        from app.rag.groundedness import _get_model
+        _get_model()
+
+
+# (name, loader, fork_safe). Fork-safe components hold only model weights and may be loaded in
+# the master; Chroma's client and anything it opens must be created in each worker.
+COMPONENTS = [
+    ("embeddings", _load_embeddings, True),
+    ("reranker", _load_reranker, True),
+    ("tokenizer", _load_tokenizer, True),
+    ("nli", _load_nli, True),
+    ("vector_store", _load_vector_store, False),
+    ("bm25", _load_bm25, False),
+    ("flat_index", _load_flat_index, False),
+    ("structured", _load_structured, False),
+]
+
+
+class Warmup:
+    """
+    Loads every component once, in order, on a background thread, recording per-component
+    status ("pending", "loading", "ready", "failed") and load time.
+    The service is ready once every component is ready.
+    """
+
+    def __init__(self, components=COMPONENTS):
+        self.components = components
+        self.status = {name: {"state": "pending"} for name, _, _ in components}
+        self.started_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.started_at = time.time()
+                self._thread = threading.Thread(target=self.run, name="meka-warmup", daemon=True)
+                self._thread.start()
+
+    def run(self, fork_safe_only=False):
+        for name, loader, fork_safe in self.components:
+            if fork_safe_only and not fork_safe:
+                continue
+            if self.status[name]["state"] == "ready":
+                continue
+            self.status[name] = {"state": "loading"}
+            started = time.perf_counter()
+            try:
+                loader()
+                self.status[name] = {"state": "ready", "seconds": round(time.perf_counter() - started, 2)}
+                logger.info(f"Warmup: {name} ready in {self.status[name]['seconds']}s")
+            except Exception as e:
+                self.status[name] = {"state": "failed", "error": str(e)}
+                logger.warning(f"Warmup: {name} failed - {e}")
+
+    def ready(self):
+        return all(s["state"] == "ready" for s in self.status.values())
+
+    def describe(self):
+        return {
+            "ready": self.ready(),
+            "uptime_s": round(time.time() - self.started_at, 1) if self.started_at else 0.0,
+            "components": self.status,
+        }
+
+
+warmup = Warmup()
+
+
+def preload_models():
+    """Loads the fork-safe models in the current (master) process; workers inherit them."""
+    logger.info("Preloading models before forking workers...")
+    warmup.run(fork_safe_only=True)
@@ -1,52 +1,264 @@
+import base64
 import json
 import os
-import uuid
+import sqlite3
+import threading
 from datetime import datetime
 
 HISTORY_FILE = "query_history.json"
+HISTORY_DB = "query_history.db"
+HISTORY_BACKEND = os.getenv("MEKA_HISTORY_BACKEND", "sqlite")
 
-def get_history():
-    if not os.path.exists(HISTORY_FILE):
-        return {}
+
+def _encode_cursor(record):
+    raw = f"{record.get('timestamp', '')}|{record['query_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor):
     try:
-        with open(HISTORY_FILE, "r") as f:
-            return json.load(f)
-    except:
-        return {}
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        timestamp, query_id = raw.split("|", 1)
+        return timestamp, query_id
+    except Exception:
+        raise ValueError("Invalid history cursor")
+
+
+class JsonHistoryBackend:
+    """
+    Original single-file backend: every write rewrites the whole JSON document.
+    Kept for compatibility and tiny deployments.
+    """
+
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load_all(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except:
+            return {}
+
+    def save_all(self, history):
+        with open(self.path, "w") as f:
+            json.dump(history, f, indent=4)
+
+    def put(self, query_id, record):
+        with self._lock:
+            history = self.load_all()
+            history[query_id] = record
+            self.save_all(history)
+
+    def update(self, query_id, fields):
+        return self.modify(query_id, lambda record: fields)
+
+    def modify(self, query_id, change):
+        """Read-modify-write of one record: change(record) returns the fields to set."""
+        with self._lock:
+            history = self.load_all()
+            if query_id not in history:
+                return False
+            history[query_id].update(change(history[query_id]))
+            self.save_all(history)
+            return True
+
+    def get(self, query_id):
+        return self.load_all().get(query_id)
+
+    def delete(self, query_id):
+        with self._lock:
+            history = self.load_all()
+            if query_id not in history:
+                return False
+            del history[query_id]
+            self.save_all(history)
+            return True
+
+    def page(self, limit, cursor=None):
+        records = sorted(
+            self.load_all().values(),
+            key=lambda x: (x.get("timestamp", ""), x.get("query_id", "")),
+            reverse=True
+        )
+        if cursor:
+            after = _decode_cursor(cursor)
+            records = [r for r in records if (r.get("timestamp", ""), r.get("query_id", "")) < after]
+        return records if limit < 0 else records[:limit]
+
+
+class SqliteHistoryBackend:
+    """
+    Embedded SQLite store in WAL mode: one row per query, indexed by timestamp.
+    Writes touch a single record inside a transaction, so concurrent updates don't clobber each other.
+    """
+
+    def __init__(self, path=HISTORY_DB, legacy_json=HISTORY_FILE):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "query_id TEXT PRIMARY KEY, timestamp TEXT NOT NULL, data TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp DESC, query_id DESC)")
+        self._import_legacy(legacy_json)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _import_legacy(self, legacy_json):
+        """One-time migration of an existing query_history.json."""
+        if not legacy_json or not os.path.exists(legacy_json):
+            return
+        if self._conn().execute("SELECT 1 FROM history LIMIT 1").fetchone():
+            return
+        legacy = JsonHistoryBackend(legacy_json).load_all()
+        if legacy:
+            self.save_all(legacy)
+            print(f"Imported {len(legacy)} history records from {legacy_json}")
+
+    def load_all(self):
+        rows = self._conn().execute("SELECT query_id, data FROM history").fetchall()
+        return {query_id: json.loads(data) for query_id, data in rows}
+
+    def save_all(self, history):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM history")
+            conn.executemany(
+                "INSERT INTO history (query_id, timestamp, data) VALUES (?, ?, ?)",
+                [(qid, rec.get("timestamp", ""), json.dumps(rec)) for qid, rec in history.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def put(self, query_id, record):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO history (query_id, timestamp, data) VALUES (?, ?, ?)",
+            (query_id, record.get("timestamp", ""), json.dumps(record))
+        )
+
+    def update(self, query_id, fields):
+        return self.modify(query_id, lambda record: fields)
+
+    def modify(self, query_id, change):
+        """Read-modify-write of one record in one transaction: change(record) returns the fields to set."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM history WHERE query_id = ?", (query_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            record = json.loads(row[0])
+            record.update(change(record))
+            conn.execute("UPDATE history SET data = ? WHERE query_id = ?", (json.dumps(record), query_id))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, query_id):
+        row = self._conn().execute("SELECT data FROM history WHERE query_id = ?", (query_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, query_id):
+        cur = self._conn().execute("DELETE FROM history WHERE query_id = ?", (query_id,))
+        return cur.rowcount > 0
+
+    def page(self, limit, cursor=None):
+        if cursor:
+            timestamp, query_id = _decode_cursor(cursor)
+            rows = self._conn().execute(
+                "SELECT data FROM history WHERE (timestamp, query_id) < (?, ?) "
+                "ORDER BY timestamp DESC, query_id DESC LIMIT ?",
+                (timestamp, query_id, limit)
+            ).fetchall()
+        else:
+            rows = self._conn().execute(
+                "SELECT data FROM history ORDER BY timestamp DESC, query_id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+
+_BACKENDS = {
+    "json": JsonHistoryBackend,
+    "sqlite": SqliteHistoryBackend,
+}
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if HISTORY_BACKEND not in _BACKENDS:
+            raise ValueError(f"Unknown history backend: {HISTORY_BACKEND}")
+        _backend = _BACKENDS[HISTORY_BACKEND]()
+    return _backend
+
+def get_history():
+    return get_backend().load_all()
 
 def save_history(history):
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=4)
+    get_backend().save_all(history)
 
 def add_query_to_history(query_id, query_data):
-    history = get_history()
-    history[query_id] = {
+    get_backend().put(query_id, {
         **query_data,
         "timestamp": datetime.now().isoformat()
-    }
-    save_history(history)
+    })
 
 def update_query_status(query_id, status, result=None):
-    history = get_history()
-    if query_id in history:
-        history[query_id]["status"] = status
-        if result:
-            history[query_id]["result"] = result
-        save_history(history)
+    fields = {"status": status}
+    if result:
+        fields["result"] = result
+    get_backend().update(query_id, fields)
+
+def update_query_fields(query_id, **fields):
+    return get_backend().update(query_id, fields)
+
+def merge_query_result(query_id, trace=None, **fields):
+    """
+    Merges fields into a finished record's result and optionally appends a trace line, atomically,
+    so it can't lose a concurrent write to the same record.
+    """
+    def change(record):
+        result = record.get("result") if isinstance(record.get("result"), dict) else {}
+        update = {"result": {**result, **fields}}
+        if trace:
+            update["reasoning_trace"] = [*record.get("reasoning_trace", []), trace]
+        return update
+    return get_backend().modify(query_id, change)
 
 def get_query_by_id(query_id):
-    history = get_history()
-    return history.get(query_id)
+    return get_backend().get(query_id)
 
 def delete_history_item(query_id):
-    history = get_history()
-    if query_id in history:
-        del history[query_id]
-        save_history(history)
-        return True
-    return False
+    return get_backend().delete(query_id)
+
+def get_history_page(limit=50, cursor=None):
+    """
+    Returns (records, next_cursor) with the newest records first.
+    next_cursor is None once the last page has been reached.
+    """
+    records = get_backend().page(limit, cursor)
+    next_cursor = _encode_cursor(records[-1]) if len(records) == limit else None
+    return records, next_cursor
 
 def get_all_history():
-    history = get_history()
     # Return as list sorted by timestamp
-    return sorted(history.values(), key=lambda x: x.get("timestamp", ""), reverse=True)
+    return get_backend().page(limit=-1)
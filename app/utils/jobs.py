@@ -0,0 +1,158 @@
+import asyncio
+import functools
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+QUERY_WORKERS = int(os.getenv("MEKA_QUERY_WORKERS", "2"))
+QUERY_QUEUE_SIZE = int(os.getenv("MEKA_QUERY_QUEUE_SIZE", "32"))
+QUERY_TIMEOUT = float(os.getenv("MEKA_QUERY_TIMEOUT", "120"))
+
+class QueueFullError(Exception):
+    def __init__(self, depth):
+        super().__init__(f"Job queue is full ({depth} waiting)")
+        self.depth = depth
+
+class Job:
+    def __init__(self, job_id, func, args, kwargs=None, callback=None):
+        self.job_id = job_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.callback = callback
+        self.state = "queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.waiter = None
+
+class JobQueue:
+    """
+    Bounded FIFO queue that runs blocking jobs on a dedicated thread pool.
+    `workers` jobs run at once, at most `max_queued` wait, and each run is capped at `timeout` seconds.
+    Python threads can't be interrupted, so a timed-out or cancelled run finishes in the
+    background and its result is discarded; its worker keeps the thread slot until then, so
+    the next job starts only on a free thread and its timeout never counts time spent waiting.
+    """
+
+    def __init__(self, workers=QUERY_WORKERS, max_queued=QUERY_QUEUE_SIZE, timeout=QUERY_TIMEOUT):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="meka-job")
+        self._jobs = {}
+        self._waiting = deque()
+        self._queue = None
+        self._worker_tasks = []
+        self._draining = 0
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, job_id, func, *args, callback=None, **kwargs):
+        """
+        Enqueues func(*args, **kwargs) and returns its 1-based queue position. Raises QueueFullError when full.
+        Callbacks read the call back from job.args and job.kwargs.
+        """
+        self._ensure_workers()
+        if len(self._waiting) >= self.max_queued:
+            raise QueueFullError(len(self._waiting))
+        job = Job(job_id, func, args, kwargs, callback)
+        self._jobs[job_id] = job
+        self._waiting.append(job_id)
+        self._queue.put_nowait(job)
+        return len(self._waiting)
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        if job.state == "queued":
+            self._waiting.remove(job_id)
+            self._finish(job, "cancelled")
+            return True
+        if job.state == "running" and job.waiter is not None:
+            job.waiter.cancel()
+            return True
+        return False
+
+    def describe(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        info = {"queue_state": job.state, "queue_position": None, "queue_depth": len(self._waiting)}
+        if job.state == "queued":
+            info["queue_position"] = self._waiting.index(job_id) + 1
+        elif job.started_at:
+            info["running_for"] = round(time.time() - job.started_at, 2)
+        return info
+
+    def stats(self):
+        running = sum(1 for job in self._jobs.values() if job.state == "running")
+        return {"queued": len(self._waiting), "running": running, "draining": self._draining,
+                "workers": self.workers}
+
+    def _finish(self, job, state, result=None, error=None):
+        job.state = state
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        self._jobs.pop(job.job_id, None)
+        self._notify(job)
+
+    def _notify(self, job):
+        if job.callback is None:
+            return
+        try:
+            job.callback(job)
+        except Exception as e:
+            logger.error(f"Job callback failed | id={job.job_id} | error={e}")
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if job.state != "queued":
+                continue  # cancelled while waiting
+            self._waiting.remove(job.job_id)
+            job.state = "running"
+            job.started_at = time.time()
+            self._notify(job)
+
+            future = loop.run_in_executor(self._executor, functools.partial(job.func, *job.args, **job.kwargs))
+            # Shielded: a timeout or cancel gives up on the result but not on the thread
+            job.waiter = asyncio.ensure_future(asyncio.wait_for(asyncio.shield(future), self.timeout))
+            await asyncio.wait([job.waiter])
+
+            if job.waiter.cancelled():
+                self._finish(job, "cancelled")
+            elif isinstance(job.waiter.exception(), asyncio.TimeoutError):
+                self._finish(job, "timeout", error=f"Timed out after {self.timeout}s")
+            elif job.waiter.exception() is not None:
+                self._finish(job, "failed", error=str(job.waiter.exception()))
+            else:
+                self._finish(job, "completed", result=job.waiter.result())
+
+            if not future.done():
+                # Hold this worker's slot until the abandoned run returns its thread
+                logger.warning(f"Job abandoned, waiting for its thread | id={job.job_id} | state={job.state}")
+                self._draining += 1
+                await asyncio.wait([future])
+                self._draining -= 1
+                future.exception()  # retrieved, so a late failure isn't reported as unhandled
+
+_job_queue = None
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
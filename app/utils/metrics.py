@@ -0,0 +1,164 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Latency buckets in seconds, from a BM25 lookup up to a slow multi-call LLM run
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines += self._samples()
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_label_str(self.labels, k)} {v}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self):
+        return [f"{self.name}{_label_str(self.labels, k)} {v}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, n) in self._series.items():
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_label_str(self.labels + ('le',), key + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_label_str(self.labels + ('le',), key + ('+Inf',))} {n}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {n}")
+        return lines
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram("meka_stage_seconds", "Time spent in each agent node", ["stage"])
+RETRIEVAL_SECONDS = Histogram("meka_retrieval_source_seconds", "Latency per retrieval source", ["source", "status"])
+REQUEST_SECONDS = Histogram("meka_request_seconds", "End-to-end query latency", ["mode", "cache"])
+FIRST_TOKEN_SECONDS = Histogram("meka_first_token_seconds", "Time to the first streamed answer token")
+CANDIDATES = Histogram("meka_candidates", "Documents per query after each stage", ["stage"], buckets=COUNT_BUCKETS)
+LLM_TOKENS = Histogram("meka_llm_tokens", "Tokens per LLM call", ["kind"], buckets=TOKEN_BUCKETS)
+LLM_SECONDS = Histogram("meka_llm_call_seconds", "Latency per LLM call", ["status"])
+QUERIES = Counter("meka_queries_total", "Queries handled", ["mode", "status"])
+RUNTIME = Gauge("meka_runtime", "Point-in-time gauges: queue depth, cache hit rates and sizes", ["component", "stat"])
+
+# Token usage of the LLM calls made inside the current span, if one is open
+_span_usage: ContextVar = ContextVar("meka_span_usage", default=None)
+
+
+class Span:
+    def __init__(self, name):
+        self.name = name
+        self.ms = 0.0
+        self.usage = {"input_tokens": 0, "output_tokens": 0}
+
+
+@contextmanager
+def stage_span(name):
+    """
+    Times a block as one pipeline stage and collects the LLM tokens spent inside it.
+    The duration is recorded in meka_stage_seconds; span.ms and span.usage are filled on exit.
+    """
+    span = Span(name)
+    token = _span_usage.set(span.usage)
+    started = time.perf_counter()
+    try:
+        yield span
+    finally:
+        elapsed = time.perf_counter() - started
+        _span_usage.reset(token)
+        span.ms = round(elapsed * 1000, 1)
+        STAGE_SECONDS.observe(elapsed, stage=name)
+
+
+def record_llm_call(latency_s, usage, failed=False):
+    LLM_SECONDS.observe(latency_s, status="error" if failed else "ok")
+    if not usage:
+        return
+    for kind in ("input_tokens", "output_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.observe(usage[kind], kind=kind)
+    current = _span_usage.get()
+    if current is not None:
+        for kind in current:
+            current[kind] += usage.get(kind, 0)
+
+
+def set_runtime_stats(component, stats: dict):
+    for stat, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            RUNTIME.set(value, component=component, stat=stat)
+
+
+def render_metrics():
+    """Prometheus text exposition of every registered metric."""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
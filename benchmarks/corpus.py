@@ -0,0 +1,74 @@
+import json
+import os
+import random
+import shutil
+
+# Each paragraph stays under the splitter's 1000-char chunk size, so one paragraph = one chunk
+PARAGRAPH_CHARS = 900
+PARAGRAPHS_PER_FILE = 100
+VOCAB_SIZE = 20000
+TOPICS = 200
+SYLLABLES = ["ka", "lo", "mi", "ne", "su", "ra", "to", "vi", "de", "po", "ga", "li", "mu", "ze", "fa", "shi"]
+
+
+def build_vocabulary(rng, size=VOCAB_SIZE):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def _paragraph(rng, topic_words, common_words):
+    words, length = [], 0
+    while length < PARAGRAPH_CHARS - 20:
+        # Topical words make BM25 and the vector search discriminative; common words add noise
+        pool = topic_words if rng.random() < 0.4 else common_words
+        word = pool[min(int(rng.paretovariate(1.2)) - 1, len(pool) - 1)]
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words).capitalize() + "."
+
+
+def generate_corpus(path, chunks, seed=13, queries=200, spec_path="corpus.json"):
+    """
+    Writes a synthetic text corpus of about `chunks` chunks into `path` and returns query specs.
+    Every file covers one topic with a Zipf-like word distribution. Queries are word windows
+    taken from random paragraphs, each remembering the file it came from, so hit rates can be checked.
+    The corpus is reused when `spec_path` records one with the same parameters.
+    """
+    params = {"chunks": chunks, "seed": seed, "queries": queries}
+    if os.path.exists(spec_path):
+        with open(spec_path, "r") as f:
+            spec = json.load(f)
+        if spec["params"] == params:
+            return spec
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    rng = random.Random(seed)
+    vocab = build_vocabulary(rng)
+    common = vocab[:2000]
+    topics = [rng.sample(vocab[2000:], 300) for _ in range(TOPICS)]
+
+    os.makedirs(path, exist_ok=True)
+    n_files = max(1, -(-chunks // PARAGRAPHS_PER_FILE))
+    query_picks = sorted(rng.sample(range(chunks), min(queries, chunks)))
+    specs, pick = [], 0
+    for file_no in range(n_files):
+        file_path = os.path.join(path, f"doc_{file_no:06d}.txt")
+        topic = topics[file_no % TOPICS]
+        first = file_no * PARAGRAPHS_PER_FILE
+        count = min(PARAGRAPHS_PER_FILE, chunks - first)
+        paragraphs = [_paragraph(rng, topic, common) for _ in range(count)]
+        while pick < len(query_picks) and query_picks[pick] < first + count:
+            words = paragraphs[query_picks[pick] - first].split()
+            start = rng.randint(0, max(0, len(words) - 8))
+            specs.append({"query": " ".join(words[start:start + 8]).strip("."), "source": file_path})
+            pick += 1
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs))
+
+    spec = {"params": params, "files": n_files, "queries": specs}
+    with open(spec_path, "w") as f:
+        json.dump(spec, f)
+    return spec
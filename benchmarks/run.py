@@ -0,0 +1,397 @@
+"""
+Offline benchmark for the MEKA pipeline.
+
+    python -m benchmarks.run --sizes 10000,100000,1000000 --output bench_report.json
+    python -m benchmarks.run --sizes 10000 --compare bench_report.json
+    python -m benchmarks.run --sizes 100000 --e2e-requests 0 --ann-ef 16,32,64,128,256
+
+Each corpus size runs in its own worker process and working directory (<workdir>/<size>), so
+the Chroma store, BM25 snapshot, history and checkpoints never mix between sizes. The LLM is the
+built-in fake provider. Embeddings and the CrossEncoder are replaced by offline stand-ins unless
+--real-models is given, in which case the models must already be in the local HF cache.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Environment for worker processes: no network, fake LLM, no answer cache hiding the pipeline
+WORKER_ENV = {
+    "LLM_PROVIDER": "fake",
+    "HF_HUB_OFFLINE": "1",
+    "TRANSFORMERS_OFFLINE": "1",
+    "ANONYMIZED_TELEMETRY": "False",
+    "ANSWER_CACHE_ENABLED": "false",
+    "TAVILY_API_KEY": "",
+}
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2)
+
+    return {"n": len(ordered), "mean_ms": round(sum(ordered) / len(ordered), 2),
+            "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": round(ordered[-1], 2)}
+
+
+# --- worker: one corpus size ------------------------------------------------
+
+def bench_ingest(spec):
+    from app.rag import vector_db
+
+    started = time.perf_counter()
+    tenant = vector_db.get_tenant()
+    tenant.stores()  # first start: full ingest of ./data
+    elapsed = time.perf_counter() - started
+    chunks = sum(collection.count() for collection in tenant.collections())
+
+    started = time.perf_counter()
+    vector_db.sync_vector_store()
+    noop = time.perf_counter() - started
+
+    # Edit 1% of the files and measure the incremental sync; the files and the store are
+    # restored afterwards, so the later benchmarks search the original corpus
+    files = sorted(os.path.join("data", p) for p in os.listdir("data") if p.endswith(".txt"))
+    changed = files[:max(1, len(files) // 100)]
+    originals = {}
+    for path in changed:
+        with open(path, "r", encoding="utf-8") as f:
+            originals[path] = f.read()
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n\nBenchmark revision paragraph with fresh content.")
+    started = time.perf_counter()
+    vector_db.sync_vector_store()
+    incremental = time.perf_counter() - started
+    for path, text in originals.items():
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    vector_db.sync_vector_store()
+
+    return {
+        "files": spec["files"],
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "chunks_per_s": round(chunks / elapsed, 1),
+        "files_per_s": round(spec["files"] / elapsed, 2),
+        "noop_sync_s": round(noop, 3),
+        "incremental_sync_s": round(incremental, 3),
+        "incremental_files": len(changed),
+    }
+
+
+def bench_retrieval(queries):
+    from app.rag.retriever import retrieve_docs_with_stats
+
+    retrieve_docs_with_stats(queries[0]["query"])  # warm up
+    totals, per_source, hits, results = [], {}, 0, []
+    for spec in queries:
+        started = time.perf_counter()
+        docs, stats = retrieve_docs_with_stats(spec["query"])
+        totals.append((time.perf_counter() - started) * 1000)
+        for name, source in stats["sources"].items():
+            per_source.setdefault(name, []).append(source["latency_ms"])
+        hits += any(d.metadata.get("source") == spec["source"] for d in docs)
+        results.append((spec["query"], docs))
+    report = {"latency": percentiles(totals), "sources": {k: percentiles(v) for k, v in per_source.items()},
+              "source_hit_rate": round(hits / len(queries), 4)}
+    return report, results
+
+
+def bench_rerank(results):
+    from app.rag.rerank_service import get_rerank_service
+
+    service = get_rerank_service()
+    report = {}
+    for phase in ("cold", "warm"):  # warm repeats the same pairs, so it measures the score cache
+        samples = []
+        for query, docs in results:
+            started = time.perf_counter()
+            service.score(query, docs)
+            samples.append((time.perf_counter() - started) * 1000)
+        report[phase] = percentiles(samples)
+    report["candidates_per_query"] = round(sum(len(d) for _, d in results) / max(len(results), 1), 1)
+    return report
+
+
+def _normalized(matrix):
+    import numpy as np
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def bench_ann(queries, k, ef_values):
+    """
+    Recall@k against exact float32 search, and per-query latency, for the HNSW index at each
+    ef_search and for the flat index in float16 and int8.
+    """
+    import numpy as np
+    from app.rag import vector_db
+    from app.rag.flat_index import FlatIndex
+
+    collections = vector_db.get_tenant().collections()
+    ids, blocks = [], []
+    for collection in collections:
+        offset = 0
+        while True:
+            batch = collection.get(include=["embeddings"], limit=5000, offset=offset)
+            if not batch["ids"]:
+                break
+            ids.extend(batch["ids"])
+            blocks.append(np.asarray(batch["embeddings"], dtype=np.float32))
+            offset += len(batch["ids"])
+    matrix = np.vstack(blocks)
+    sq_norms = (matrix ** 2).sum(axis=1)
+    vectors = np.asarray(vector_db.get_embeddings().embed_queries([q["query"] for q in queries]), dtype=np.float32)
+
+    # Ground truth in Chroma's space (squared L2); identical to cosine order for normalized vectors
+    truth, exact = [], []
+    for vector in vectors:
+        started = time.perf_counter()
+        distances = sq_norms - 2 * (matrix @ vector)
+        top = np.argpartition(distances, k - 1)[:k]
+        exact.append((time.perf_counter() - started) * 1000)
+        truth.append({ids[i] for i in top})
+
+    def recall(found):
+        return round(sum(len(t & set(f)) for t, f in zip(truth, found)) / (k * len(truth)), 4)
+
+    report = {"k": k, "chunks": len(ids), "shards": len(collections), "exact_float32": {"latency": percentiles(exact)}, "hnsw": {}}
+    # Chroma only applies ef_search when a process loads the index, so each value runs in a fresh probe
+    np.save("ann_queries.npy", vectors)
+    for ef in ef_values:
+        probe = subprocess.run([sys.executable, "-m", "benchmarks.run", "--ann-probe", str(ef), "--ann-k", str(k)],
+                               capture_output=True, text=True, check=True)
+        found, samples = json.loads(probe.stdout.strip().splitlines()[-1])
+        report["hnsw"][f"ef_{ef}"] = {"recall": recall(found), "latency": percentiles(samples)}
+    for collection in collections:
+        vector_db.set_ef_search(collection, vector_db.HNSW_EF_SEARCH)
+    os.remove("ann_queries.npy")
+
+    for dtype in ("float16", "int8"):
+        index = FlatIndex.build(collections, path=f"flat_index_{dtype}", dtype=dtype)
+        index.search(vectors[0], k)  # warm up: fault the mapped pages in
+        found, samples = [], []
+        for vector in vectors:
+            started = time.perf_counter()
+            found.append([cid for cid, _ in index.search(vector, k)])
+            samples.append((time.perf_counter() - started) * 1000)
+        report[f"flat_{dtype}"] = {"recall": recall(found), "latency": percentiles(samples),
+                                   "mb": round(index.vectors.nbytes / 2 ** 20, 1)}
+    return report
+
+
+def run_ann_probe(args):
+    """
+    Queries the HNSW shards with one ef_search in this fresh process, in parallel and merged by
+    distance as the retriever does; prints [ids, latencies_ms].
+    """
+    import heapq
+    import numpy as np
+    from app.rag import vector_db
+
+    collections = vector_db.get_tenant().collections()
+    for collection in collections:
+        vector_db.set_ef_search(collection, args.ann_probe)
+    vectors = np.load("ann_queries.npy")
+
+    def query(vector):
+        def shard(collection):
+            result = collection.query(query_embeddings=[vector.tolist()], n_results=args.ann_k, include=["distances"])
+            return zip(result["ids"][0], result["distances"][0])
+        hits = vector_db._shard_executor.map(shard, collections) if len(collections) > 1 else [shard(collections[0])]
+        return [cid for cid, _ in heapq.nsmallest(args.ann_k, (h for found in hits for h in found), key=lambda h: h[1])]
+
+    query(vectors[0])  # warm up
+    found, samples = [], []
+    for vector in vectors:
+        started = time.perf_counter()
+        found.append(query(vector))
+        samples.append((time.perf_counter() - started) * 1000)
+    print(json.dumps([found, samples]))
+
+
+async def bench_e2e(queries, requests, concurrency):
+    import httpx
+    from app.main import app
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(client, i):
+        nonlocal errors
+        spec = queries[i % len(queries)]
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(f"/sse/ask/bench-{i}", params={"query": spec["query"]})
+            if response.status_code != 200 or "event: done" not in response.text:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        await one(client, 0)  # warm up
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*[one(client, i) for i in range(1, requests + 1)])
+        elapsed = time.perf_counter() - started
+
+    return {"requests": requests, "concurrency": concurrency, "errors": errors,
+            "qps": round(len(latencies) / elapsed, 2), "latency": percentiles(latencies)}
+
+
+# Everything a run writes next to the corpus; removed first so every run ingests from scratch
+RUN_STATE = ("chroma_db", "bm25_index", "checkpoints.db", "checkpoints.db-wal", "checkpoints.db-shm",
+             "query_history.db", "query_history.db-wal", "query_history.db-shm",
+             "embedding_cache.db", "embedding_cache.db-wal", "embedding_cache.db-shm",
+             "web_cache.db", "web_cache.db-wal", "web_cache.db-shm",
+             "flat_index", "flat_index_float16", "flat_index_int8")
+
+
+def run_worker(args):
+    from benchmarks.corpus import generate_corpus
+
+    for path in RUN_STATE:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    spec = generate_corpus("data", args.worker, seed=args.seed, queries=args.queries)
+    if not args.real_models:
+        from benchmarks.stubs import install_stubs
+        install_stubs()
+
+    report = {"corpus": {"chunks": args.worker, "files": spec["files"], "queries": len(spec["queries"])}}
+    print(f"[{args.worker}] ingest...", file=sys.stderr)
+    report["ingest"] = bench_ingest(spec)
+    from app.rag.vector_db import get_embeddings
+    report["embeddings"] = get_embeddings().describe()
+    print(f"[{args.worker}] retrieval...", file=sys.stderr)
+    report["retrieval"], results = bench_retrieval(spec["queries"])
+    print(f"[{args.worker}] rerank...", file=sys.stderr)
+    report["rerank"] = bench_rerank(results)
+    ef_values = [int(v) for v in args.ann_ef.split(",") if v.strip()]
+    if ef_values:
+        print(f"[{args.worker}] ann recall/latency...", file=sys.stderr)
+        report["ann"] = bench_ann(spec["queries"], args.ann_k, ef_values)
+    if args.e2e_requests:
+        print(f"[{args.worker}] end-to-end...", file=sys.stderr)
+        report["e2e"] = asyncio.run(bench_e2e(spec["queries"], args.e2e_requests, args.concurrency))
+
+    with open(args.result_file, "w") as f:
+        json.dump(report, f)
+
+
+# --- driver -----------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def _flatten(tree, prefix=""):
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(previous, current):
+    """Prints every numeric result that changed between two reports, with the relative change."""
+    old, new = _flatten(previous["results"]), _flatten(current["results"])
+    print(f"{'metric':<50} {'before':>12} {'after':>12} {'change':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        if old[key] == new[key]:
+            continue
+        change = f"{(new[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "n/a"
+        print(f"{key:<50} {old[key]:>12} {new[key]:>12} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline MEKA benchmark")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated corpus sizes in chunks")
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval/rerank queries per size")
+    parser.add_argument("--e2e-requests", type=int, default=200, help="Requests through /sse/ask per size (0 skips)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--ann-ef", default="10,20,40,80,160", help="HNSW ef_search values for the recall report (empty skips)")
+    parser.add_argument("--ann-k", type=int, default=10, help="k for recall@k")
+    parser.add_argument("--workdir", default=".bench")
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--compare", help="Previous report to diff against")
+    parser.add_argument("--real-models", action="store_true", help="Use the cached HF models instead of offline stand-ins")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ann-probe", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.ann_probe:
+        return run_ann_probe(args)
+    if args.worker:
+        random.seed(args.seed)
+        return run_worker(args)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    env = {**os.environ, **WORKER_ENV,
+           "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")]))}
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "models": "real" if args.real_models else "stub",
+            "args": {k: v for k, v in vars(args).items() if k not in ("worker", "result_file", "compare")},
+        },
+        "results": {},
+    }
+
+    for size in sizes:
+        workdir = os.path.abspath(os.path.join(args.workdir, str(size)))
+        os.makedirs(workdir, exist_ok=True)
+        result_file = os.path.join(workdir, "result.json")
+        command = [sys.executable, "-m", "benchmarks.run", "--worker", str(size), "--result-file", result_file,
+                   "--queries", str(args.queries), "--e2e-requests", str(args.e2e_requests),
+                   "--concurrency", str(args.concurrency), "--seed", str(args.seed),
+                   "--ann-ef", args.ann_ef, "--ann-k", str(args.ann_k)]
+        if args.real_models:
+            command.append("--real-models")
+        print(f"Benchmarking {size} chunks in {workdir}")
+        started = time.perf_counter()
+        subprocess.run(command, cwd=workdir, env=env, check=True)
+        with open(result_file, "r") as f:
+            report["results"][str(size)] = json.load(f)
+        print(f"Finished {size} chunks in {time.perf_counter() - started:.1f}s")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import hashlib
+import re
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Offline stand-in for the sentence-transformer: signed feature hashing of lowercased words,
+    L2-normalised. Lexically similar texts land close together, so retrieval stays meaningful.
+    """
+
+    def __init__(self, size=384):
+        self.size = size
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in TOKEN_RE.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.size] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class HashingEncoder:
+    """SentenceTransformer-shaped wrapper around HashingEmbeddings for the embedding service."""
+
+    def __init__(self, size=384):
+        self.embeddings = HashingEmbeddings(size)
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False):
+        return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+
+
+class OverlapCrossEncoder:
+    """Offline stand-in for the CrossEncoder: fraction of query words found in the passage."""
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        scores = []
+        for query, passage in pairs:
+            terms = set(TOKEN_RE.findall(query.lower()))
+            found = terms & set(TOKEN_RE.findall(passage.lower()))
+            scores.append(len(found) / max(len(terms), 1))
+        return np.asarray(scores, dtype=np.float32)
+
+
+def install_stubs():
+    """Swaps the embedding model and the reranker's CrossEncoder for the offline stand-ins."""
+    from app.rag.vector_db import get_embeddings
+    from app.rag.rerank_service import get_rerank_service
+
+    get_embeddings().model = HashingEncoder()
+    get_rerank_service().model = OverlapCrossEncoder()
@@ -174,10 +174,17 @@ function App() {
         try {
           const data = JSON.parse(ev.data);
           if (data.event === "trace") setReasoningTrace(p => [...p, data.trace]);
+          else if (data.event === "answer_delta") setResponse(p => p + data.delta);
           else if (data.event === "answer") setResponse(data.answer);
           else if (data.event === "done") {
             if (data.full_result) setResult(data.full_result);
-            setLoading(false); fetchHistory(); ws.close();
+            setLoading(false); fetchHistory();
+            // A background groundedness verdict follows on the same socket
+            if (data.full_result?.validation !== "PENDING") ws.close();
+          } else if (data.event === "validation") {
+            setReasoningTrace(p => [...p, data.trace]);
+            setResult(r => r ? { ...r, validation: data.validation, reason: data.reason } : r);
+            fetchHistory(); ws.close();
           } else if (data.event === "error") { setError(data.error); setLoading(false); ws.close(); }
         } catch (err) { console.error(err); }
       };
@@ -0,0 +1,22 @@
+# Production server: gunicorn -c gunicorn.conf.py app.main:app
+import multiprocessing
+import os
+
+bind = os.getenv("MEKA_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("MEKA_WORKERS", str(min(multiprocessing.cpu_count(), 4))))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("MEKA_WORKER_TIMEOUT", "180"))
+graceful_timeout = 30
+# Import the app once in the master so workers are forked from it
+preload_app = True
+
+# Tokenizers disable their thread pool after a fork anyway; say so up front instead of warning per worker
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def on_starting(server):
+    # Model weights loaded here are shared copy-on-write by every worker.
+    # Chroma and the BM25 index are opened per worker by the background warmup.
+    if os.getenv("MEKA_PRELOAD_MODELS", "true").lower() == "true":
+        from app.startup import preload_models
+        preload_models()
@@ -0,0 +1,31 @@
+import os
+
+# Offline and side-effect free: no telemetry, no model downloads, no cache files in the repo
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+
+import pytest
+from benchmarks.stubs import HashingEncoder
+from app.rag.vector_db import Tenant, get_embeddings
+
+get_embeddings().model = HashingEncoder(64)
+
+
+def write_files(data_path, files):
+    os.makedirs(data_path, exist_ok=True)
+    for name, text in files.items():
+        with open(os.path.join(data_path, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+@pytest.fixture
+def make_tenant(tmp_path):
+    """Builds an isolated tenant under tmp_path with the given {file name: text} data directory."""
+    def make(files, name="test"):
+        root = tmp_path / name
+        data_path = str(root / "data")
+        write_files(data_path, files)
+        return Tenant(name, data_path, str(root))
+    return make
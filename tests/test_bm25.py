@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+from scipy import sparse
+from app.rag.bm25_index import BM25Index
+
+
+def make_index():
+    index = BM25Index()
+    index.update(["a", "b", "c"], ["hotel stays per night", "badges at the office", "work from home"])
+    return index
+
+
+def test_search_ranks_matching_chunks():
+    index = make_index()
+    assert index.search("hotel night")[0][0] == "a"
+    assert index.search("unknown words") == []
+
+
+def test_update_replaces_and_removes_rows():
+    index = make_index()
+    index.update(["a"], ["remote badges policy"], remove_ids=["c"])
+    assert len(index) == 2
+    assert index.search("hotel") == []
+    assert {cid for cid, _ in index.search("badges")} == {"a", "b"}
+
+
+def test_allowed_ids_restrict_results():
+    index = make_index()
+    index.update(["d"], ["badges for visitors"])
+    assert [cid for cid, _ in index.search("badges", allowed={"d"}, allowed_key="d")] == ["d"]
+
+
+def test_update_leaves_live_snapshot_and_blocks_untouched():
+    index = make_index()
+    live = index._state["csr"]
+    live_shape = live.shape
+    block = index.encode(["entirely new vocabulary here"])
+    block_shape = block.shape
+    index.update(["d"], add_rows=[block])
+    assert live.shape == live_shape
+    assert block.shape == block_shape
+    assert index.search("vocabulary")[0][0] == "d"
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = make_index()
+    index.version = 3
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.version == 3
+    assert loaded.search("badges") == index.search("badges")
+    # Only the current snapshot's matrix is kept
+    index.save(str(tmp_path))
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".npz")]) == 1
+
+
+def test_concurrent_saves_leave_a_consistent_snapshot(tmp_path):
+    indexes = []
+    for i in range(4):
+        index = BM25Index()
+        index.update([f"{i}-{j}" for j in range(i + 1)], [f"words of writer {i} number {j}" for j in range(i + 1)])
+        index.version = i
+        indexes.append(index)
+    threads = [threading.Thread(target=index.save, args=(str(tmp_path),)) for index in indexes for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded is not None
+    assert len(loaded) == loaded.version + 1
+    assert all(cid.startswith(f"{loaded.version}-") for cid in loaded._state["ids"])
+
+
+def test_inconsistent_snapshot_is_rejected(tmp_path):
+    make_index().save(str(tmp_path))
+    meta_path = tmp_path / "meta.json"
+    meta = json.loads(meta_path.read_text())
+    meta["ids"] = meta["ids"][:2]
+    meta_path.write_text(json.dumps(meta))
+    assert BM25Index.load(str(tmp_path)) is None
+
+
+def test_loads_snapshots_with_the_old_fixed_layout(tmp_path):
+    index = make_index()
+    index.version = 1
+    state = index._state
+    sparse.save_npz(str(tmp_path / "matrix.npz"), state["csr"])
+    meta = {"version": 1, "k1": index.k1, "b": index.b, "rows": len(state["ids"]), "ids": state["ids"],
+            "vocab": sorted(index.vocab, key=index.vocab.get)}
+    (tmp_path / "meta.json").write_text(json.dumps(meta))
+    assert BM25Index.load(str(tmp_path)).search("hotel")[0][0] == "a"
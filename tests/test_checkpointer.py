@@ -0,0 +1,42 @@
+from langgraph.checkpoint.base import empty_checkpoint
+from app.graph.checkpointer import SqliteCheckpointer
+
+
+def make(tmp_path, **kwargs):
+    return SqliteCheckpointer(str(tmp_path / "checkpoints.db"), evict_interval=3600, **kwargs)
+
+
+def save(saver, thread_id, n=1):
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    for _ in range(n):
+        config = saver.put(config, empty_checkpoint(), {}, {})
+    return config
+
+
+def test_latest_checkpoint_round_trips(tmp_path):
+    saver = make(tmp_path)
+    config = save(saver, "t1", 2)
+    latest = saver.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert latest.config["configurable"]["checkpoint_id"] == config["configurable"]["checkpoint_id"]
+    assert latest.parent_config is not None
+
+
+def test_only_the_newest_checkpoints_are_kept(tmp_path):
+    saver = make(tmp_path, keep_last=2)
+    save(saver, "t1", 5)
+    assert len(list(saver.list({"configurable": {"thread_id": "t1"}}))) == 2
+    assert saver.stats["compacted"] == 3
+
+
+def test_idle_and_excess_threads_are_evicted(tmp_path):
+    saver = make(tmp_path, ttl=100, max_threads=2)
+    for thread_id in ("a", "b", "c"):
+        save(saver, thread_id)
+    conn = saver._conn()
+    conn.execute("UPDATE threads SET last_active = last_active - 1000 WHERE thread_id = 'a'")
+    conn.execute("UPDATE threads SET last_active = last_active - 10 WHERE thread_id = 'b'")
+    save(saver, "d")
+    assert saver.evict() == 2  # "a" is idle past the TTL, "b" is the least recently active over the cap
+    assert saver.get_tuple({"configurable": {"thread_id": "a"}}) is None
+    assert saver.get_tuple({"configurable": {"thread_id": "b"}}) is None
+    assert saver.get_tuple({"configurable": {"thread_id": "c"}}) is not None
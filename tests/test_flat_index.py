@@ -0,0 +1,23 @@
+import numpy as np
+from app.rag.flat_index import FlatIndex, FLAT_INDEX_MASK_CACHE
+
+
+def make_index():
+    return FlatIndex("unused", ["a", "b", "c"], np.eye(3, 4, dtype=np.float16), None,
+                     ["x.txt", "y.pdf"], np.array([0, 1, 0]), ["txt", "pdf"], np.array([0, 1, 0]),
+                     np.array([10.0, 20.0, 30.0]))
+
+
+def test_mask_applies_filters():
+    index = make_index()
+    mask = index.mask({"types": ["txt"], "modified_after": 15.0}, "k")
+    assert mask.tolist() == [False, False, True]
+
+
+def test_mask_cache_is_bounded():
+    index = make_index()
+    for i in range(FLAT_INDEX_MASK_CACHE * 3):
+        index.mask({"modified_after": float(i)}, ("modified_after", i))
+    assert len(index._masks) == FLAT_INDEX_MASK_CACHE
+    # Least recently used keys go first
+    assert ("modified_after", 0) not in index._masks
@@ -0,0 +1,33 @@
+from langchain_core.documents import Document
+from app.rag.retriever import fuse_results, RRF_K, RETRIEVAL_SOURCES
+
+
+def doc(chunk_id, **metadata):
+    return Document(page_content=f"text of {chunk_id}", metadata={"chunk_id": chunk_id, **metadata})
+
+
+def test_rrf_rewards_chunks_found_by_several_sources():
+    fused = fuse_results([("vector", [doc("a"), doc("b")]), ("bm25", [doc("b"), doc("c")])], method="rrf")
+    assert [d.metadata["chunk_id"] for d in fused] == ["b", "a", "c"]
+    assert fused[0].metadata["retrieval_sources"] == ["vector", "bm25"]
+    expected = RETRIEVAL_SOURCES["vector"]["weight"] / (RRF_K + 2) + RETRIEVAL_SOURCES["bm25"]["weight"] / (RRF_K + 1)
+    assert abs(fused[0].metadata["fusion_score"] - round(expected, 6)) < 1e-9
+
+
+def test_fusion_keeps_scores_from_every_copy():
+    fused = fuse_results([("vector", [doc("a", vector_score=0.9)]), ("bm25", [doc("a", bm25_score=3.0)])])
+    assert len(fused) == 1
+    assert fused[0].metadata["vector_score"] == 0.9
+    assert fused[0].metadata["bm25_score"] == 3.0
+
+
+def test_unstored_chunks_are_deduplicated_by_text():
+    a = Document(page_content="Same  Text", metadata={})
+    b = Document(page_content="same text", metadata={})
+    assert len(fuse_results([("vector", [a]), ("bm25", [b])])) == 1
+
+
+def test_weighted_fusion_normalizes_source_scores():
+    fused = fuse_results([("vector", [doc("a", vector_score=0.9), doc("b", vector_score=0.1)])], method="weighted")
+    assert [d.metadata["chunk_id"] for d in fused] == ["a", "b"]
+    assert fused[1].metadata["fusion_score"] == 0.0
@@ -0,0 +1,72 @@
+import threading
+import pytest
+from app.utils import history
+from app.utils.history import JsonHistoryBackend, SqliteHistoryBackend
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def backend(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        store = SqliteHistoryBackend(str(tmp_path / "history.db"), legacy_json=None)
+    else:
+        store = JsonHistoryBackend(str(tmp_path / "history.json"))
+    monkeypatch.setattr(history, "_backend", store)
+    return store
+
+
+def add(query_id, timestamp, **fields):
+    history.get_backend().put(query_id, {"query_id": query_id, "timestamp": timestamp, "status": "queued",
+                                         "result": "", "reasoning_trace": [], **fields})
+
+
+def test_status_updates(backend):
+    add("q1", "2026-01-01T00:00:00")
+    history.update_query_status("q1", "completed", {"answer": "42"})
+    assert history.get_query_by_id("q1")["status"] == "completed"
+    assert history.get_query_by_id("q1")["result"] == {"answer": "42"}
+    assert history.update_query_status("missing", "completed") is None
+    assert history.update_query_fields("missing", status="x") is False
+
+
+def test_merge_appends_trace_and_result_fields(backend):
+    add("q1", "2026-01-01T00:00:00", result={"answer": "42"}, reasoning_trace=["Retriever: ok"])
+    assert history.merge_query_result("q1", trace="Validator: ok", validation="GROUNDED")
+    record = history.get_query_by_id("q1")
+    assert record["result"] == {"answer": "42", "validation": "GROUNDED"}
+    assert record["reasoning_trace"] == ["Retriever: ok", "Validator: ok"]
+
+
+def test_concurrent_merges_keep_every_write(backend):
+    add("q1", "2026-01-01T00:00:00", result={})
+    threads = [threading.Thread(target=history.merge_query_result, args=("q1",), kwargs={"trace": f"t{i}", f"f{i}": i})
+               for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    record = history.get_query_by_id("q1")
+    assert len(record["reasoning_trace"]) == 16
+    assert record["result"] == {f"f{i}": i for i in range(16)}
+
+
+def test_cursor_pagination_walks_newest_first(backend):
+    for i in range(7):
+        add(f"q{i}", f"2026-01-01T00:00:0{i}")
+    seen, cursor = [], None
+    while True:
+        records, cursor = history.get_history_page(3, cursor)
+        seen += [r["query_id"] for r in records]
+        if not cursor:
+            break
+    assert seen == [f"q{i}" for i in reversed(range(7))]
+
+
+def test_invalid_cursor(backend):
+    with pytest.raises(ValueError):
+        history.get_history_page(3, "not-a-cursor")
+
+
+def test_delete(backend):
+    add("q1", "2026-01-01T00:00:00")
+    assert history.delete_history_item("q1")
+    assert history.get_query_by_id("q1") is None
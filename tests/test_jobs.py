@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.utils.jobs import JobQueue, QueueFullError
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def wait_for_state(updates, job_id, states, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if any(job_id == jid and state in states for jid, state in updates):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{job_id} never reached {states}: {updates}")
+
+
+def test_runs_jobs_with_args_and_kwargs():
+    async def main():
+        queue, updates = JobQueue(workers=1, max_queued=4, timeout=5), []
+        results = {}
+
+        def callback(job):
+            updates.append((job.job_id, job.state))
+            if job.state == "completed":
+                results[job.job_id] = job.result
+        queue.submit("a", lambda x, y=0: x + y, 1, y=2, callback=callback)
+        await wait_for_state(updates, "a", {"completed"})
+        assert results == {"a": 3}
+        assert [state for _, state in updates] == ["running", "completed"]
+    run(main())
+
+
+def test_full_queue_rejects_and_positions_are_reported():
+    async def main():
+        release = threading.Event()
+        queue = JobQueue(workers=1, max_queued=2, timeout=5)
+        queue.submit("running", release.wait)
+        await asyncio.sleep(0.05)  # let the worker pick it up
+        assert queue.submit("q1", time.sleep, 0) == 1
+        assert queue.submit("q2", time.sleep, 0) == 2
+        assert queue.describe("q2")["queue_position"] == 2
+        with pytest.raises(QueueFullError) as error:
+            queue.submit("q3", time.sleep, 0)
+        assert error.value.depth == 2
+        release.set()
+    run(main())
+
+
+def test_cancel_queued_and_running_jobs():
+    async def main():
+        release, updates = threading.Event(), []
+        queue = JobQueue(workers=1, max_queued=4, timeout=5)
+        callback = lambda job: updates.append((job.job_id, job.state))
+        queue.submit("running", release.wait, callback=callback)
+        queue.submit("queued", time.sleep, 0, callback=callback)
+        await wait_for_state(updates, "running", {"running"})
+        assert queue.cancel("queued")
+        assert queue.cancel("running")
+        await wait_for_state(updates, "running", {"cancelled"})
+        assert ("queued", "cancelled") in updates
+        assert not queue.cancel("unknown")
+        release.set()
+    run(main())
+
+
+def test_timed_out_job_keeps_its_slot_until_the_thread_returns():
+    async def main():
+        updates = []
+        queue = JobQueue(workers=1, max_queued=4, timeout=0.2)
+        callback = lambda job: updates.append((job.job_id, job.state, time.monotonic()))
+        started = time.monotonic()
+        queue.submit("slow", time.sleep, 0.6, callback=callback)
+        queue.submit("next", time.sleep, 0.1, callback=callback)
+        deadline = time.monotonic() + 5
+        while not any(u[:2] == ("next", "completed") for u in updates) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        states = {(jid, state): at - started for jid, state, at in updates}
+        assert ("slow", "timeout") in states
+        # "next" waited for the slow thread instead of timing out in the executor's queue
+        assert ("next", "completed") in states
+        assert states[("next", "running")] >= 0.6
+    run(main())
@@ -0,0 +1,36 @@
+import os
+import signal
+import pytest
+from langchain_core.documents import Document
+from benchmarks.stubs import OverlapCrossEncoder
+from app.rag.rerank_service import RerankService
+
+
+def make_service():
+    service = RerankService(max_wait_ms=1)
+    service.model = OverlapCrossEncoder()
+    return service
+
+
+def test_scores_and_caches():
+    service = make_service()
+    docs = [Document(page_content="hotel limit per night", metadata={"chunk_id": "a"}),
+            Document(page_content="badges at the office", metadata={"chunk_id": "b"})]
+    scores, hits = service.score("hotel limit", docs)
+    assert scores[0] > scores[1] and hits == 0
+    assert service.score("hotel limit", docs) == (scores, 2)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_scoring_works_in_a_forked_child():
+    service = make_service()
+    doc = Document(page_content="hotel limit", metadata={"chunk_id": "a"})
+    service.score("hotel", [doc])  # starts the batching thread in the parent
+    pid = os.fork()
+    if pid == 0:
+        # The parent's thread didn't survive the fork; a fresh one must serve this request
+        signal.alarm(10)  # a hang fails the test instead of blocking the run
+        ok = service.score("limit", [doc])[0][0] > 0
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
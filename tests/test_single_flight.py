@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.graph.single_flight import SingleFlight, StreamSingleFlight, flight_key
+
+
+def test_flight_key_normalizes_the_query():
+    assert flight_key("What is X?", False, 1) == flight_key("  what is x ", False, 1)
+    assert flight_key("x", False, 1) != flight_key("x", True, 1)
+    assert flight_key("x", False, 1, tenant="a") != flight_key("x", False, 1, tenant="b")
+
+
+def test_concurrent_callers_share_one_run():
+    flight, calls, results = SingleFlight(), [], []
+    gate = threading.Event()
+
+    def work():
+        calls.append(1)
+        gate.wait(2)
+        return "answer"
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(leader for _, leader in results) == [False] * 4 + [True]
+    assert all(result == "answer" for result, _ in results)
+    # Nothing is kept once the run finishes
+    assert flight.do("k", lambda: "again") == ("again", True)
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("k", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert flight.do("k", lambda: 1) == (1, True)
+
+
+def test_stream_subscribers_receive_every_event():
+    async def main():
+        flight = StreamSingleFlight()
+
+        async def source():
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield i
+        first, leader = flight.join("k", source)
+        await asyncio.sleep(0.015)  # the late subscriber missed the first event live
+        second, joined_leader = flight.join("k", source)
+        assert first is second and leader and not joined_leader
+
+        async def collect(broadcast):
+            return [event async for event in broadcast.subscribe()]
+        assert await asyncio.gather(collect(first), collect(second)) == [[0, 1, 2], [0, 1, 2]]
+        assert flight.stats == {"runs": 1, "joined": 1}
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+from app.rag.structured_store import StructuredStore
+
+ROWS = [
+    {"title": "Security Policy", "content": "All passwords must be 12 chars long."},
+    {"title": "Remote Work", "content": "Employees can work from home 3 days a week."},
+]
+
+
+def make_store():
+    store = StructuredStore()
+    store.add_table("data/policies.csv", ["title", "content"], ROWS)
+    return store
+
+
+def test_key_lookup_returns_the_row():
+    docs = make_store().lookup("What is the Security Policy?")
+    assert len(docs) == 1
+    assert "12 chars" in docs[0].page_content
+
+
+def test_column_filter_lookup():
+    docs = make_store().lookup("title is Remote Work")
+    assert len(docs) == 1
+    assert "3 days" in docs[0].page_content
+
+
+def test_analytical_question_is_not_a_lookup():
+    store = make_store()
+    assert store.lookup("Compare security policy and remote work policies in detail and tell me why") == []
+    assert store.lookup("Why is the remote work policy so strict?") == []
+
+
+def test_long_query_naming_only_a_key_is_not_a_lookup():
+    query = "tell me everything the handbook says about remote work for new employees in their first month"
+    assert make_store().lookup(query) == []
+    # Naming a column makes it a lookup again
+    assert len(make_store().lookup("the content of remote work for new employees in their first month please")) == 1
@@ -0,0 +1,108 @@
+import os
+from app.rag.manifest import load_manifest
+from tests.conftest import write_files
+
+FILES = {
+    "travel.txt": "Hotel stays are reimbursed up to 150 dollars per night.",
+    "security.txt": "Badges must be worn visibly at all times inside the office.",
+    "remote.txt": "Employees may work from home two days a week.",
+}
+
+
+def chunk_count(tenant):
+    return sum(c.count() for c in tenant.collections())
+
+
+def test_first_sync_ingests_every_file(make_tenant):
+    tenant = make_tenant(FILES)
+    tenant.stores()
+    manifest = load_manifest(tenant.manifest_path)
+    assert set(os.path.basename(p) for p in manifest["files"]) == set(FILES)
+    assert chunk_count(tenant) == 3
+    assert tenant.corpus_version() == 1
+
+
+def test_resync_after_manifest_loss_keeps_chunks(make_tenant):
+    tenant = make_tenant(FILES)
+    tenant.stores()
+    os.remove(tenant.manifest_path)
+    tenant.sync()
+    assert chunk_count(tenant) == 3
+    # The rebuilt manifest matches the store, so a later sync has nothing to do
+    tenant.sync()
+    assert chunk_count(tenant) == 3
+    assert len(load_manifest(tenant.manifest_path)["files"]) == 3
+
+
+def test_corrupt_manifest_is_moved_aside_and_rebuilt(make_tenant):
+    tenant = make_tenant(FILES)
+    tenant.stores()
+    with open(tenant.manifest_path, "w") as f:
+        f.write("{not json")
+    tenant.sync()
+    assert os.path.exists(tenant.manifest_path + ".corrupt")
+    assert chunk_count(tenant) == 3
+    assert len(load_manifest(tenant.manifest_path)["files"]) == 3
+
+
+def test_untracked_chunks_are_dropped_after_manifest_loss(make_tenant):
+    tenant = make_tenant(FILES)
+    store = tenant.stores()[0]
+    store.add_texts(["left over from a wipe-and-rebuild sync"], ids=["legacy-1"])
+    os.remove(tenant.manifest_path)
+    tenant.sync()
+    assert chunk_count(tenant) == 3
+    assert store.get(ids=["legacy-1"])["ids"] == []
+
+
+def test_incremental_sync_applies_edits_and_removals(make_tenant):
+    tenant = make_tenant(FILES)
+    tenant.stores()
+    write_files(tenant.data_path, {"travel.txt": "Hotel stays are capped at 200 dollars per night."})
+    os.remove(os.path.join(tenant.data_path, "security.txt"))
+    tenant.sync()
+    assert chunk_count(tenant) == 2
+    assert tenant.corpus_version() == 2
+    texts = [d.page_content for d in tenant.documents_by_ids(tenant.bm25_index()._state["ids"])]
+    assert any("200 dollars" in t for t in texts)
+    assert not any("Badges" in t for t in texts)
+    assert tenant.bm25_index().search("badges") == []
+
+
+def test_bm25_snapshot_is_saved_before_the_manifest(make_tenant, monkeypatch):
+    tenant = make_tenant(FILES)
+    tenant.stores()
+    from app.rag import vector_db
+    seen = []
+    save_manifest = vector_db.save_manifest
+
+    def checking_save(path, manifest):
+        from app.rag.bm25_index import BM25Index
+        seen.append((manifest["version"], BM25Index.load(tenant.bm25_path).version))
+        save_manifest(path, manifest)
+    monkeypatch.setattr(vector_db, "save_manifest", checking_save)
+    write_files(tenant.data_path, {"new.txt": "Parking permits are issued by facilities."})
+    tenant.sync()
+    assert seen == [(2, 2)]
+    assert tenant.bm25_index().search("parking")
+
+
+def test_bm25_rows_are_applied_in_batches(make_tenant, monkeypatch):
+    from app.rag import vector_db
+    from app.rag.bm25_index import BM25Index
+    tenant = make_tenant(FILES)
+    tenant.stores()
+    monkeypatch.setattr(vector_db, "INGEST_BATCH_SIZE", 2)
+    batches = []
+    update = BM25Index.update
+
+    def counting_update(self, add_ids=(), *args, **kwargs):
+        batches.append(len(list(add_ids)))
+        return update(self, add_ids, *args, **kwargs)
+    monkeypatch.setattr(BM25Index, "update", counting_update)
+    write_files(tenant.data_path, {f"extra{i}.txt": f"Extra policy number {i} about lockers." for i in range(5)})
+    tenant.sync()
+    assert max(batches) <= 2
+    assert sum(batches) == 5
+    assert len(tenant.bm25_index()) == 8
+    assert len(tenant.bm25_index().search("lockers", k=10)) == 5